@@ -0,0 +1,339 @@
+"""Versioned JSON API, under /api/v1.
+
+Covers what the HTML pages show -- the home timeline, profiles and their
+messages, followers/following and likes -- plus posting and deleting
+messages. Batch endpoints (`/users?ids=1,2,3`, `/messages?ids=...`)
+resolve up to `MAX_BATCH` IDs in one query, returning them in the order
+asked for and listing any that don't exist under "missing". Follows and
+likes are written in bulk too: POST `{"ids": [...]}` to /follows or
+/likes, or DELETE `?ids=...`; the response lists the IDs that changed.
+
+Reads select just the columns they return and serialize the row tuples
+straight to JSON, without building ORM objects. The home timeline is the
+exception: it comes from `timeline.home_timeline`, so it follows the
+same fan-out and caching settings as the home page.
+
+Clients log in through the usual session cookie. Writes only accept
+JSON bodies, which cross-site forms can't send, so they need no CSRF
+token. Message lists are paginated like the HTML pages, with the
+`before` cursor given back as "next_cursor"; follower and following
+lists page by user ID, with an `after` cursor.
+"""
+
+from flask import Blueprint, abort, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+import current_user
+import posting
+import relations
+import replicas
+from models import db, Follows, Likes, Message, User
+from pagination import (after_from_request, cursor_from_request, page_of,
+                        paginate, paginate_by_id)
+from timeline import TIMELINE_LIMIT, home_timeline
+
+MAX_BATCH = 100
+PER_PAGE = 100
+MAX_MESSAGE_LENGTH = 140
+
+blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.image_url,
+    User.header_image_url,
+    User.bio,
+    User.location,
+    User.messages_count,
+    User.following_count,
+    User.followers_count,
+    User.likes_count,
+)
+
+USER_FIELDS = [column.key for column in USER_COLUMNS]
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.text,
+    Message.timestamp,
+    Message.user_id,
+    User.username,
+    User.image_url,
+)
+
+
+##############################################################################
+# Serialization
+
+
+def user_json(row):
+    return dict(zip(USER_FIELDS, row))
+
+
+def message_json(row):
+    id, text, timestamp, user_id, username, image_url = row
+
+    return {'id': id, 'text': text, 'timestamp': timestamp.isoformat(),
+            'user': {'id': user_id, 'username': username,
+                     'image_url': image_url}}
+
+
+def user_page_json(page):
+    return jsonify(users=[user_json(row) for row in page.items],
+                   next_cursor=page.next_cursor)
+
+
+def message_page_json(page):
+    return jsonify(messages=[message_json(row) for row in page.items],
+                   next_cursor=page.next_cursor)
+
+
+def batch_json(name, ids, rows, serialize):
+    """Rows for a batch request, in the order of `ids`."""
+
+    by_id = {row.id: row for row in rows}
+
+    return jsonify({name: [serialize(by_id[id]) for id in ids if id in by_id],
+                    'missing': [id for id in ids if id not in by_id]})
+
+
+##############################################################################
+# Queries
+
+
+def user_rows():
+    return (db.session
+            .query(*USER_COLUMNS)
+            .filter(User.deleted_at.is_(None)))
+
+
+def message_rows():
+    return (db.session
+            .query(*MESSAGE_COLUMNS)
+            .join(User, User.id == Message.user_id)
+            .filter(User.deleted_at.is_(None)))
+
+
+def message_page(query):
+    return paginate(query, Message.timestamp, Message.id,
+                    cursor_from_request(), PER_PAGE)
+
+
+def user_page(query):
+    return paginate_by_id(query, User.id, after_from_request(), PER_PAGE)
+
+
+def requested_ids():
+    """The distinct IDs of `?ids=1,2,3`, in order; 400 if malformed."""
+
+    try:
+        ids = [int(id) for id in request.args.get('ids', '').split(',') if id]
+    except ValueError:
+        abort(400, "ids must be a comma-separated list of integers")
+
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > MAX_BATCH:
+        abort(400, f"give between 1 and {MAX_BATCH} ids")
+
+    return ids
+
+
+def body_ids():
+    """The distinct IDs of a JSON body's "ids" list; 400 if malformed."""
+
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(
+            isinstance(id, int) and not isinstance(id, bool) for id in ids):
+        abort(400, "ids must be a list of integers")
+
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > MAX_BATCH:
+        abort(400, f"give between 1 and {MAX_BATCH} ids")
+
+    return ids
+
+
+def login_required():
+    if not g.user:
+        abort(401)
+
+
+@blueprint.errorhandler(HTTPException)
+def error_json(error):
+    return jsonify(error=error.description), error.code
+
+
+##############################################################################
+# Users
+
+
+@blueprint.route('/users')
+@replicas.read_only
+def users_batch():
+    ids = requested_ids()
+
+    return batch_json('users', ids, user_rows().filter(User.id.in_(ids)),
+                      user_json)
+
+
+@blueprint.route('/users/<int:user_id>')
+@replicas.read_only
+def user_detail(user_id):
+    row = user_rows().filter(User.id == user_id).first()
+    if row is None:
+        abort(404)
+
+    return jsonify(user_json(row))
+
+
+@blueprint.route('/users/<int:user_id>/messages')
+@replicas.read_only
+def user_messages(user_id):
+    return message_page_json(
+        message_page(message_rows().filter(Message.user_id == user_id)))
+
+
+@blueprint.route('/users/<int:user_id>/following')
+@replicas.read_only
+def user_following(user_id):
+    return user_page_json(user_page(
+        user_rows()
+        .join(Follows, Follows.user_being_followed_id == User.id)
+        .filter(Follows.user_following_id == user_id)))
+
+
+@blueprint.route('/users/<int:user_id>/followers')
+@replicas.read_only
+def user_followers(user_id):
+    return user_page_json(user_page(
+        user_rows()
+        .join(Follows, Follows.user_following_id == User.id)
+        .filter(Follows.user_being_followed_id == user_id)))
+
+
+@blueprint.route('/follows', methods=['POST'])
+def follows_create():
+    login_required()
+
+    followed = relations.follow(g.user.id, body_ids())
+    if followed:
+        current_user.changed(g.user.id)
+
+    return jsonify(followed=followed)
+
+
+@blueprint.route('/follows', methods=['DELETE'])
+def follows_delete():
+    login_required()
+
+    unfollowed = relations.unfollow(g.user.id, requested_ids())
+    if unfollowed:
+        current_user.changed(g.user.id)
+
+    return jsonify(unfollowed=unfollowed)
+
+
+##############################################################################
+# Messages
+
+
+@blueprint.route('/timeline')
+@replicas.read_only
+def home():
+    login_required()
+
+    page = page_of(home_timeline(g.user.id, cursor_from_request()),
+                   TIMELINE_LIMIT)
+
+    return jsonify(messages=[message_json((msg.id, msg.text, msg.timestamp,
+                                           msg.user_id, msg.user.username,
+                                           msg.user.image_url))
+                             for msg in page.items],
+                   next_cursor=page.next_cursor)
+
+
+@blueprint.route('/likes')
+@replicas.read_only
+def likes():
+    login_required()
+
+    return message_page_json(message_page(
+        message_rows()
+        .join(Likes, Likes.message_id == Message.id)
+        .filter(Likes.user_id == g.user.id)))
+
+
+@blueprint.route('/likes', methods=['POST'])
+def likes_create():
+    login_required()
+
+    liked = relations.like(g.user.id, body_ids())
+    if liked:
+        current_user.changed(g.user.id)
+
+    return jsonify(liked=liked)
+
+
+@blueprint.route('/likes', methods=['DELETE'])
+def likes_delete():
+    login_required()
+
+    unliked = relations.unlike(g.user.id, requested_ids())
+    if unliked:
+        current_user.changed(g.user.id)
+
+    return jsonify(unliked=unliked)
+
+
+@blueprint.route('/messages')
+@replicas.read_only
+def messages_batch():
+    ids = requested_ids()
+
+    return batch_json('messages', ids,
+                      message_rows().filter(Message.id.in_(ids)),
+                      message_json)
+
+
+@blueprint.route('/messages/<int:message_id>')
+@replicas.read_only
+def message_detail(message_id):
+    row = message_rows().filter(Message.id == message_id).first()
+    if row is None:
+        abort(404)
+
+    return jsonify(message_json(row))
+
+
+@blueprint.route('/messages', methods=['POST'])
+def message_create():
+    login_required()
+
+    data = request.get_json(silent=True)
+    text = data.get('text') if isinstance(data, dict) else None
+    if not isinstance(text, str) or not text.strip():
+        abort(400, "text is required")
+    if len(text) > MAX_MESSAGE_LENGTH:
+        abort(400, f"text is limited to {MAX_MESSAGE_LENGTH} characters")
+
+    msg = posting.post_message(g.user.id, text)
+    current_user.changed(g.user.id)
+
+    return jsonify(message_json((msg.id, msg.text, msg.timestamp, g.user.id,
+                                 g.user.username, g.user.image_url))), 201
+
+
+@blueprint.route('/messages/<int:message_id>', methods=['DELETE'])
+def message_delete(message_id):
+    login_required()
+
+    msg = Message.query.get_or_404(message_id)
+    if msg.user_id != g.user.id:
+        abort(403)
+
+    posting.delete_message(msg)
+    current_user.changed(g.user.id)
+
+    return '', 204
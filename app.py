@@ -1,13 +1,39 @@
+import csv
 import os
+from collections import defaultdict
+from itertools import islice
 
+import click
 from flask import Flask, render_template, request, flash, redirect, session, g, url_for
 from flask_debugtoolbar import DebugToolbarExtension
+from flask_migrate import Migrate
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 
 from forms import UserAddForm, LoginForm, MessageForm, UserEditForm
-from models import db, connect_db, User, Message
+from models import db, connect_db, User, Message, Follows, Likes
+from passwords import hasher, HasherBusy
+from pagination import cursor_from_request, page_of, page_query, paginate
+import api
+import conditional
+import counters
+import current_user
+import fragments
+import jobs
+import metrics
+import posting
+import purge
+import querystats
+import relations
+import replicas
+import search
+import streaming
+import timeline
 
 CURR_USER_KEY = "curr_user"
+CURR_USER_VERSION_KEY = current_user.VERSION_KEY
+BUSY_MESSAGE = "We're handling a lot of logins right now, please try again."
+PER_PAGE = 100
 
 app = Flask(__name__)
 
@@ -17,12 +43,105 @@ app.config['SQLALCHEMY_DATABASE_URI'] = (
     os.environ.get('DATABASE_URL', 'postgresql:///warbler'))
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pools. Pre-ping replaces connections the server has dropped;
+# sizes only apply to pooled (e.g. PostgreSQL) engines, so are optional.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+}
+if os.environ.get('DB_POOL_SIZE'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(
+        pool_size=int(os.environ['DB_POOL_SIZE']),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    )
+
+# Read-only views read from these (space-separated) replica URLs; users
+# who just wrote something stay on the primary for REPLICA_PIN_SECONDS.
+app.config['SQLALCHEMY_REPLICA_URLS'] = (
+    os.environ.get('DATABASE_REPLICA_URLS', '').split())
+app.config['REPLICA_PIN_SECONDS'] = int(
+    os.environ.get('REPLICA_PIN_SECONDS', 10))
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+
+# Materialize home timelines on write instead of computing them on read.
+app.config['TIMELINE_FANOUT'] = os.environ.get('TIMELINE_FANOUT') == '1'
+app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] = int(
+    os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', 10000))
+
+# Per-worker cache of recent home timeline message IDs.
+app.config['TIMELINE_CACHE'] = os.environ.get('TIMELINE_CACHE') == '1'
+app.config['TIMELINE_CACHE_MAX_BYTES'] = int(
+    os.environ.get('TIMELINE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+app.config['TIMELINE_CACHE_TTL'] = int(
+    os.environ.get('TIMELINE_CACHE_TTL', 30))
+
+# Password hashing: bcrypt cost factor and the size of the hashing pool.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(
+    os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_MAX_QUEUE'] = int(
+    os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+
+# Username and message search: 'auto' uses database indexes on PostgreSQL
+# and in-process indexes elsewhere; 'sql' or 'memory' force one or the other.
+# USER_SEARCH_BACKEND, its name before message search, is still read.
+app.config['SEARCH_BACKEND'] = os.environ.get(
+    'SEARCH_BACKEND', os.environ.get('USER_SEARCH_BACKEND', 'auto'))
+
+# Seconds a worker may reuse the logged-in user's snapshot (0 disables).
+app.config['CURRENT_USER_CACHE_TTL'] = int(
+    os.environ.get('CURRENT_USER_CACHE_TTL', 5))
+
+# Per-request SQL statement counts: logged always, sent as response
+# headers when QUERY_STATS_HEADERS is on.
+app.config['QUERY_STATS_HEADERS'] = (
+    os.environ.get('QUERY_STATS_HEADERS') == '1')
+app.config['QUERY_REPEAT_THRESHOLD'] = int(
+    os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Send the home, likes and follower pages while they render, fetching
+# their rows in chunks.
+app.config['STREAM_PAGES'] = os.environ.get('STREAM_PAGES') == '1'
+app.config['STREAM_CHUNK_ROWS'] = int(
+    os.environ.get('STREAM_CHUNK_ROWS', 100))
+
+# Background jobs (see jobs.py): retried JOB_MAX_ATTEMPTS times, backing
+# off from JOB_RETRY_SECONDS. JOBS_SYNC runs them inline instead.
+app.config['JOBS_SYNC'] = os.environ.get('JOBS_SYNC') == '1'
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+app.config['JOB_RETRY_SECONDS'] = int(os.environ.get('JOB_RETRY_SECONDS', 10))
+app.config['JOB_LOCK_SECONDS'] = int(os.environ.get('JOB_LOCK_SECONDS', 600))
+
+# Deleted accounts are purged PURGE_BATCH_SIZE rows per transaction.
+app.config['PURGE_BATCH_SIZE'] = int(
+    os.environ.get('PURGE_BATCH_SIZE', 1000))
+
+# Per-worker cache of rendered message cards (0 disables).
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = int(
+    os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Cache-Control per endpoint; other pages aren't cached at all. Pages with
+# an ETag may be kept, but must be revalidated (see conditional.py).
+app.config['CACHE_CONTROL'] = {
+    endpoint: os.environ.get('CACHE_CONTROL', 'private, no-cache')
+    for endpoint in ('users_show', 'show_following', 'users_followers',
+                     'messages_show')
+}
+
 toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+migrate = Migrate(app, db)
+hasher.init_app(app)
+querystats.init_app(app)
+metrics.init_app(app)
+fragments.init_app(app)
+streaming.init_app(app)
+app.register_blueprint(api.blueprint)
 
 
 ##############################################################################
@@ -31,15 +150,36 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add a snapshot of curr user to Flask global.
+
+    g.user is a read-only `current_user.UserSnapshot`; handlers that change
+    the user load the full model with `load_current_user()`.
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = current_user.load(session[CURR_USER_KEY],
+                                   session.get(CURR_USER_VERSION_KEY, 0))
 
     else:
         g.user = None
 
 
+def load_current_user():
+    """Load the full `User` model for the logged-in user."""
+
+    return User.query.get_or_404(g.user.id)
+
+
+def current_user_changed():
+    """Note that curr user's snapshot is out of date.
+
+    Call after committing anything the snapshot shows (profile fields or
+    counts); the next request will load a fresh one.
+    """
+
+    current_user.changed(session[CURR_USER_KEY])
+
+
 def do_login(user):
     """Log in user."""
 
@@ -76,11 +216,16 @@ def signup():
                 image_url=form.image_url.data or User.image_url.default.arg,
             )
             db.session.commit()
+            search.user_changed(user)
 
         except IntegrityError:
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        except HasherBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('users/signup.html', form=form), 503
+
         do_login(user)
 
         return redirect("/")
@@ -96,10 +241,15 @@ def login():
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data,
-                                 form.password.data)
+        try:
+            user = User.authenticate(form.username.data,
+                                     form.password.data)
+        except HasherBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('users/login.html', form=form), 503
 
         if user:
+            db.session.commit()
             do_login(user)
             flash(f'Hello, {user.username}!', "success")
             return redirect("/")
@@ -122,43 +272,47 @@ def logout():
 # General user routes:
 
 @app.route('/users')
+@replicas.read_only
 def list_users():
     """Page with listing of users.
 
     Can take a 'q' param in querystring to search by that username.
     """
 
-    search = request.args.get('q')
+    q = request.args.get('q')
 
-    if not search:
-        users = User.query.limit(100).all()
+    if not q:
+        users = User.visible().limit(100).all()
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).limit(100).all()
+        users = search.search_users(q)
+
+    followed_ids = g.user.followed_ids(u.id for u in users) if g.user else set()
 
-    return render_template('users/index.html', users=users)
+    return render_template('users/index.html', users=users,
+                           followed_ids=followed_ids)
 
 
 @app.route('/users/<int:user_id>')
+@replicas.read_only
+@conditional.cached(conditional.user_version)
 def users_show(user_id):
     """Show user profile."""
 
-    user = User.query.get_or_404(user_id)
-    
+    user = User.visible().filter_by(id=user_id).first_or_404()
 
     # snagging messages in order from the database;
     # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    likes = user.likes
-    num_likes = len(likes)
-    return render_template('users/show.html', user=user, messages=messages, num_likes=num_likes)
+    page = paginate(Message.query.filter(Message.user_id == user_id),
+                    Message.timestamp, Message.id,
+                    cursor_from_request(), PER_PAGE)
+
+    return render_template('users/show.html', user=user, messages=page.items,
+                           next_cursor=page.next_cursor)
 
 
 @app.route('/users/<int:user_id>/following')
+@replicas.read_only
+@conditional.cached(conditional.following_version)
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -166,25 +320,63 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    likes = g.user.likes
-    num_likes = len(likes)
+    user = User.visible().filter_by(id=user_id).first_or_404()
 
-    return render_template('users/following.html', user=user, num_likes=num_likes)
+    return follows_page(user, 'users/following.html', 'following',
+                        Follows.user_being_followed_id,
+                        Follows.user_following_id)
 
 
 @app.route('/users/<int:user_id>/followers')
+@replicas.read_only
+@conditional.cached(conditional.followers_version)
 def users_followers(user_id):
     """Show list of followers of this user."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    likes = g.user.likes
-    num_likes = len(likes)
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user, num_likes=num_likes)
+    user = User.visible().filter_by(id=user_id).first_or_404()
+
+    return follows_page(user, 'users/followers.html', 'followers',
+                        Follows.user_following_id,
+                        Follows.user_being_followed_id)
+
+
+def follows_page(user, template, name, listed_col, owner_col):
+    """Render a page listing the users `user` follows or is followed by.
+
+    Deleted accounts are left out.
+    """
+
+    listed = (User
+              .visible()
+              .join(Follows, listed_col == User.id)
+              .filter(owner_col == user.id))
+
+    if streaming.enabled():
+        return stream_follows(user, template, name, listed)
+
+    users = listed.all()
+    followed_ids = g.user.followed_ids(u.id for u in users)
+
+    return render_template(template, user=user, followed_ids=followed_ids,
+                           **{name: users})
+
+
+def stream_follows(user, template, name, listed):
+    """Stream a page listing the users of the query `listed`."""
+
+    followed_ids = set()
+    users = streaming.Rows(
+        lambda: streaming.streamed(listed),
+        on_chunk=lambda chunk: followed_ids.update(
+            g.user.followed_ids(u.id for u in chunk)))
+
+    return streaming.stream_template(template, user=user,
+                                     followed_ids=followed_ids,
+                                     **{name: users})
 
 
 @app.route('/users/follow/<int:follow_id>', methods=['POST'])
@@ -195,9 +387,11 @@ def add_follow(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+    if relations.follow(g.user.id, [follow_id]):
+        current_user_changed()
+    else:
+        # Already following, or no such user.
+        User.visible().filter_by(id=follow_id).first_or_404()
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -210,9 +404,8 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    if relations.unfollow(g.user.id, [follow_id]):
+        current_user_changed()
 
     return redirect(f"/users/{g.user.id}/following")
 
@@ -220,29 +413,34 @@ def stop_following(follow_id):
 @app.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
-    form = UserEditForm(obj=g.user)
-    user = User.query.get_or_404(g.user.id)
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
+    user = load_current_user()
+    form = UserEditForm(obj=user)
     if form.validate_on_submit():
-        g.user.username = form.username.data
-        g.user.email = form.email.data
-        g.user.image_url = form.image_url.data
-        g.user.header_image_url = form.header_image_url.data
-        g.user.bio = form.bio.data
+        user.username = form.username.data
+        user.email = form.email.data
+        user.image_url = form.image_url.data
+        user.header_image_url = form.header_image_url.data
+        user.bio = form.bio.data
 
-        
-        user = User.authenticate(g.user.username,
-                                 form.password.data)
-        if user:
+        try:
+            authenticated = User.authenticate(user.username, form.password.data)
+        except HasherBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('users/edit.html', user=user, form=form), 503
+
+        if authenticated:
+            user.touch()
             db.session.commit()
-            return redirect(f'/users/{g.user.id}')
+            search.user_changed(user)
+            current_user_changed()
+            return redirect(f'/users/{user.id}')
         else:
             flash('Invalid Password')
             return redirect('users/profile')
-    
-    user = User.query.get_or_404(g.user.id)
+
     return render_template('users/edit.html', user=user, form=form )
 
 
@@ -256,8 +454,7 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
-    db.session.commit()
+    purge.hide(load_current_user())
 
     return redirect("/signup")
 
@@ -269,9 +466,15 @@ def add_like(msg_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    like = Message.query.get(msg_id)
-    g.user.likes.append(like)
-    db.session.commit()
+    if relations.like(g.user.id, [msg_id]):
+        current_user_changed()
+    else:
+        # Already liked, or no such message.
+        (Message
+         .query
+         .join(Message.user)
+         .filter(Message.id == msg_id, User.deleted_at.is_(None))
+         .first_or_404())
 
     return redirect(f"/users/{g.user.id}")
 
@@ -282,18 +485,44 @@ def remove_like(msg_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    like = Message.query.get(msg_id)
-    g.user.likes.remove(like)
-    db.session.commit()
+    if relations.unlike(g.user.id, [msg_id]):
+        current_user_changed()
 
     return redirect(f"/")
 
 @app.route('/users/likes')
+@replicas.read_only
 def list_likes():
-    likes = g.user.likes
-    num_likes = len(likes)
-    messages=[]
-    return render_template('users/show_liked_messages.html', likes=likes, num_likes=num_likes, user=g.user)
+    """Show the messages the current user has liked, newest first."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    liked = (Message
+             .query
+             .join(Likes, Likes.message_id == Message.id)
+             .join(Message.user)
+             .options(contains_eager(Message.user))
+             .filter(Likes.user_id == g.user.id, User.deleted_at.is_(None)))
+
+    if streaming.enabled():
+        likes = streaming.Rows(
+            lambda: streaming.streamed(page_query(
+                liked, Message.timestamp, Message.id,
+                cursor_from_request(), PER_PAGE)),
+            per_page=PER_PAGE)
+
+        return streaming.stream_template(
+            'users/show_liked_messages.html', likes=likes,
+            next_cursor=likes.next_cursor, user=load_current_user())
+
+    page = paginate(liked, Message.timestamp, Message.id,
+                    cursor_from_request(), PER_PAGE)
+
+    return render_template('users/show_liked_messages.html', likes=page.items,
+                           next_cursor=page.next_cursor,
+                           user=load_current_user())
       
 
 
@@ -318,20 +547,41 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
-        db.session.commit()
+        posting.post_message(g.user.id, form.text.data)
+        current_user_changed()
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
+@app.route('/messages/search')
+@replicas.read_only
+def messages_search():
+    """Search messages by text.
+
+    Takes a 'q' param with the words to look for; older results via the
+    `before` cursor.
+    """
+
+    q = request.args.get('q', '').strip()
+    page = search.search_messages(q, cursor_from_request()) if q else None
+
+    return render_template('messages/search.html', q=q, page=page)
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@replicas.read_only
+@conditional.cached(conditional.message_version)
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = (Message
+           .query
+           .join(Message.user)
+           .options(contains_eager(Message.user))
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first_or_404())
     return render_template('messages/show.html', message=msg)
 
 
@@ -349,9 +599,8 @@ def messages_destroy(message_id):
         return redirect("/")
         
 
-    msg = Message.query.get(message_id)
-    db.session.delete(msg)
-    db.session.commit()
+    posting.delete_message(m)
+    current_user_changed()
 
     return redirect(f"/users/{g.user.id}")
 
@@ -359,32 +608,128 @@ def messages_destroy(message_id):
 
 
 
+##############################################################################
+# Command-line tasks
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Rebuild every user's materialized home timeline."""
+
+    for (user_id,) in db.session.query(User.id).all():
+        timeline.rebuild(user_id)
+
+    db.session.commit()
+
+
+@app.cli.command('repair-counters')
+@click.option('--queue', is_flag=True,
+              help="Leave the repair to a background job")
+def repair_counters(queue):
+    """Recompute every user's denormalized counters."""
+
+    if queue:
+        jobs.enqueue('repair_counters', key='repair_counters')
+    else:
+        counters.repair()
+    db.session.commit()
+
+
+@app.cli.command('purge-users')
+def purge_users():
+    """Purge every deleted account, reporting progress as it goes."""
+
+    report = lambda user_id, step, n: click.echo(
+        f"user {user_id}: deleted {n} {step}")
+
+    for user_id in purge.hidden_ids():
+        purge.purge(user_id, report)
+
+
+@app.cli.command('purge-status')
+def purge_status():
+    """List the deleted accounts still being purged, with rows left."""
+
+    for user_id in purge.hidden_ids():
+        left = ', '.join(f"{n} {step}"
+                         for step, n in purge.progress(user_id).items())
+        click.echo(f"user {user_id}: {left} left")
+
+
+@app.cli.command('run-jobs')
+@click.option('--threads', default=4, show_default=True,
+              help="Jobs run at once")
+@click.option('--burst', is_flag=True,
+              help="Exit once no jobs are due instead of waiting for more")
+def run_jobs(threads, burst):
+    """Run queued background jobs until interrupted."""
+
+    jobs.Worker(app, threads).run(burst)
+
+
+@app.cli.command('job-status')
+def job_status():
+    """Count queued, running and failed jobs by kind."""
+
+    for (kind, status), n in sorted(jobs.counts().items()):
+        click.echo(f"{kind}: {n} {status}")
+
+
+@app.cli.command('import-likes')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=10000, show_default=True,
+              help="CSV rows written per batch")
+def import_likes(path, chunk_size):
+    """Add the likes in a user_id,message_id CSV, skipping ones that exist."""
+
+    added = 0
+    with open(path, newline='') as f:
+        rows = csv.DictReader(f)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            by_user = defaultdict(list)
+            for row in chunk:
+                by_user[int(row['user_id'])].append(int(row['message_id']))
+
+            for user_id, message_ids in by_user.items():
+                added += len(relations.like(user_id, message_ids))
+
+    click.echo(f"imported {added} likes")
+
+
 ##############################################################################
 # Homepage and error pages
 
 
 @app.route('/')
+@replicas.read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: 100 most recent messages of followed_users, older pages
+      via the `before` cursor
     """
-    messages=[]
-
-    if g.user:
-        u_messages = (Message
-                    .query
-                    .order_by(Message.timestamp.desc())
-                    .all())
-    
-        for message in u_messages:
-            if message.user in g.user.following or message.user.id == g.user.id:
-                messages.append(message)
-        if len(messages) > 100:
-            messages = messages[0:100]
-            
-        return render_template('home.html', messages=messages)
+    if g.user and streaming.enabled():
+        liked_ids = set()
+        messages = streaming.Rows(
+            lambda: timeline.home_timeline(g.user.id, cursor_from_request()),
+            on_chunk=lambda chunk: liked_ids.update(
+                g.user.liked_message_ids(msg.id for msg in chunk)),
+            per_page=timeline.TIMELINE_LIMIT)
+
+        return streaming.stream_template('home.html', messages=messages,
+                                         next_cursor=messages.next_cursor,
+                                         liked_ids=liked_ids)
+
+    elif g.user:
+        page = page_of(timeline.home_timeline(g.user.id, cursor_from_request()),
+                       timeline.TIMELINE_LIMIT)
+
+        liked_ids = g.user.liked_message_ids(msg.id for msg in page.items)
+
+        return render_template('home.html', messages=page.items,
+                               next_cursor=page.next_cursor,
+                               liked_ids=liked_ids)
 
     else:
         return render_template('home-anon.html')
@@ -401,6 +746,11 @@ def homepage():
 def add_header(req):
     """Add non-caching headers on every request."""
 
+    cache_control = app.config['CACHE_CONTROL'].get(request.endpoint)
+    if cache_control:
+        req.headers['Cache-Control'] = cache_control
+        return req
+
     req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     req.headers["Pragma"] = "no-cache"
     req.headers["Expires"] = "0"
@@ -0,0 +1,81 @@
+"""Compare throughput of the JSON API with the HTML pages.
+
+Drives matching HTML and /api/v1 routes through Flask's test client as a
+heavy user, for a fixed number of seconds each, and reports requests per
+second and the API's speedup. Uses the dataset bench_routes.py loads:
+
+    DATABASE_URL=postgresql:///warbler-bench \\
+        python benchmarks/bench_routes.py --size medium
+
+    DATABASE_URL=postgresql:///warbler-bench \\
+        python benchmarks/bench_api.py --seconds 10
+"""
+
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_routes import pick_users
+
+# name, HTML URL, API URL, which user to browse as
+PAIRS = [
+    ('timeline', '/', '/api/v1/timeline', 'follower'),
+    ('profile', '/users/{celebrity}',
+     '/api/v1/users/{celebrity}/messages', 'follower'),
+    ('following', '/users/{follower}/following',
+     '/api/v1/users/{follower}/following', 'follower'),
+    ('followers', '/users/{celebrity}/followers',
+     '/api/v1/users/{celebrity}/followers', 'follower'),
+    ('likes', '/users/likes', '/api/v1/likes', 'liker'),
+]
+
+
+def throughput(client, url, seconds):
+    """Requests per second for GETs of `url` over `seconds`."""
+
+    client.get(url)
+
+    count = 0
+    start = perf_counter()
+    deadline = start + seconds
+    while perf_counter() < deadline:
+        resp = client.get(url)
+        assert resp.status_code == 200, (url, resp.status_code)
+        count += 1
+
+    return count / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5,
+                        help="time spent on each route")
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        parser.error("set DATABASE_URL to a database loaded by bench_routes.py")
+
+    from app import app, CURR_USER_KEY
+
+    app.config['DEBUG_TB_ENABLED'] = False
+
+    with app.app_context():
+        users = pick_users()
+
+    print(f"{'route':12} {'html req/s':>11} {'api req/s':>11} {'speedup':>8}")
+    for name, html_url, api_url, viewer in PAIRS:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = users[viewer]
+
+            html = throughput(client, html_url.format(**users), args.seconds)
+            api = throughput(client, api_url.format(**users), args.seconds)
+
+        print(f"{name:12} {html:11.1f} {api:11.1f} {api / html:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
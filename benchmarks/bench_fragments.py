@@ -0,0 +1,99 @@
+"""Benchmark home page rendering with and without the fragment cache.
+
+Renders home.html for a 100-message timeline of in-memory messages (no
+database needed), first with the message card cache switched off, then
+warm, and reports the time per render:
+
+    python benchmarks/bench_fragments.py --renders 500
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def fake_timeline(rng, count, authors):
+    """`count` transient messages by `authors` distinct users, newest first."""
+
+    from models import Message, User
+
+    users = [User(id=i, username=f"author{i}", email=f"author{i}@test.com",
+                  image_url=f"/static/images/{i}.png", version=0)
+             for i in range(1, authors + 1)]
+
+    now = datetime(2020, 1, 1)
+    return [Message(id=count - i, text=" ".join(
+                        rng.choice(["warble", "tweet", "chirp", "squawk"])
+                        for _ in range(rng.randint(5, 25))),
+                    timestamp=now - timedelta(minutes=i),
+                    user=rng.choice(users))
+            for i in range(count)]
+
+
+def time_renders(app, messages, renders):
+    from flask import g, render_template
+
+    from current_user import UserSnapshot, SNAPSHOT_COLUMNS
+
+    fields = dict(username="viewer", image_url="", header_image_url="",
+                  updated_at=datetime(2020, 1, 1))
+    viewer = UserSnapshot([fields.get(column.key, 0)
+                           for column in SNAPSHOT_COLUMNS])
+    liked_ids = {msg.id for msg in messages[::3]}
+
+    timings = []
+    with app.test_request_context('/'):
+        g.user = viewer
+        for _ in range(renders):
+            start = perf_counter()
+            render_template('home.html', messages=messages, next_cursor=None,
+                            liked_ids=liked_ids)
+            timings.append((perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label}: p50 {percentile(timings, 50):.2f} ms, "
+          f"p95 {percentile(timings, 95):.2f} ms, "
+          f"p99 {percentile(timings, 99):.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--renders', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app import app
+
+    messages = fake_timeline(random.Random(args.seed), args.messages,
+                             args.authors)
+
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 0
+    uncached = time_renders(app, messages, args.renders)
+    report("uncached", uncached)
+
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 16 * 1024 * 1024
+    app.extensions.pop('fragment_cache', None)
+    cached = time_renders(app, messages, args.renders)
+    report("cached", cached)
+
+    saved = percentile(uncached, 50) - percentile(cached, 50)
+    print(f"saved per render (p50): {saved:.2f} ms "
+          f"({saved / percentile(uncached, 50):.0%})")
+
+
+if __name__ == '__main__':
+    main()
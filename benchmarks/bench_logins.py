@@ -0,0 +1,60 @@
+"""Benchmark password checks through the hashing pool.
+
+Reports logins/sec overall and per core for the configured cost factor.
+Run from the project root:
+
+    python benchmarks/bench_logins.py --rounds 12 --threads 32 --logins 200
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, HasherBusy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="size of the hashing pool")
+    parser.add_argument('--threads', type=int, default=32,
+                        help="concurrent 'request' threads")
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    hasher = PasswordHasher()
+    hasher.rounds = args.rounds
+    hasher.workers = args.workers
+    hasher.max_queue = args.threads
+
+    stored = hasher.hash('correct horse battery staple')
+
+    def login(_):
+        try:
+            return hasher.check(stored, 'correct horse battery staple')
+        except HasherBusy:
+            return None
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as requests:
+        results = list(requests.map(login, range(args.logins)))
+    elapsed = perf_counter() - start
+
+    ok = sum(1 for result in results if result)
+    rate = ok / elapsed
+
+    print(f"cost factor:      {args.rounds}")
+    print(f"hashing workers:  {args.workers}")
+    print(f"logins:           {ok} ok, {results.count(None)} rejected")
+    print(f"elapsed:          {elapsed:.2f}s")
+    print(f"logins/sec:       {rate:.1f}")
+    print(f"logins/sec/core:  {rate / args.workers:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Benchmark the main pages against a seeded dataset.
+
+Builds a database of the chosen size from generator/create_csvs.py output,
+then drives each route through Flask's test client as a heavy user and
+reports latency percentiles, time to first byte, SQL statements per
+request and peak Python memory per request; --stream turns on streamed
+rendering (STREAM_PAGES) for the pages that support it. Point
+DATABASE_URL at a scratch database -- it is dropped and reloaded unless
+--reuse is given:
+
+    DATABASE_URL=postgresql:///warbler-bench \\
+        python benchmarks/bench_routes.py --size medium --output medium.json
+
+    # later, after a change:
+    DATABASE_URL=postgresql:///warbler-bench \\
+        python benchmarks/bench_routes.py --size medium --reuse \\
+        --baseline medium.json
+
+With --baseline the run exits non-zero if any route got slower than the
+tolerance allows or started running more statements.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = {
+    'small': dict(users=1000, messages=10000, follows=20000, likes=20000),
+    'medium': dict(users=10000, messages=100000, follows=200000, likes=200000),
+    'large': dict(users=100000, messages=1000000, follows=2000000,
+                  likes=2000000),
+}
+
+CSV_FILES = ['users', 'messages', 'follows', 'likes']
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def generate_csvs(size, seed, out):
+    """Run the CSV generator for `size` into the directory `out`."""
+
+    args = [sys.executable, os.path.join(ROOT, 'generator', 'create_csvs.py'),
+            '--out', out, '--seed', seed]
+    for name, count in SIZES[size].items():
+        args += [f'--{name}', str(count)]
+
+    subprocess.run(args, check=True, stderr=subprocess.DEVNULL)
+
+
+def build(app, size, seed):
+    """Drop and reload the database with a `size` dataset."""
+
+    from models import db, User, Message, Follows, Likes
+    import counters
+    import loader
+    import timeline
+
+    models = dict(users=User, messages=Message, follows=Follows, likes=Likes)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = perf_counter()
+        generate_csvs(size, seed, tmpdir)
+        print(f"generated CSVs in {perf_counter() - start:.1f}s")
+
+        db.drop_all()
+        db.create_all()
+
+        tables = [models[name].__table__ for name in CSV_FILES]
+        start = perf_counter()
+        with loader.deferred_indexes(db.engine, tables):
+            for name in CSV_FILES:
+                path = os.path.join(tmpdir, f'{name}.csv')
+                loader.load_csv(db.engine, models[name].__table__, path,
+                                progress=lambda *args: None)
+        loader.reset_sequences(db.engine, tables)
+        print(f"loaded in {perf_counter() - start:.1f}s")
+
+    counters.repair()
+    if app.config['TIMELINE_FANOUT']:
+        for (user_id,) in db.session.query(User.id).all():
+            timeline.rebuild(user_id)
+    db.session.commit()
+
+
+def pick_users():
+    """The heaviest users to browse as and look at."""
+
+    from models import db, User
+
+    def top(column):
+        return db.session.query(User.id).order_by(column.desc()).first()[0]
+
+    celebrity = User.query.get(top(User.followers_count))
+
+    return dict(
+        follower=top(User.following_count),
+        liker=top(User.likes_count),
+        celebrity=celebrity.id,
+        search=celebrity.username[:3],
+    )
+
+
+# name, URL template, which user to browse as
+ROUTES = [
+    ('homepage', '/', 'follower'),
+    ('users_show', '/users/{celebrity}', 'follower'),
+    ('show_following', '/users/{follower}/following', 'follower'),
+    ('users_followers', '/users/{celebrity}/followers', 'follower'),
+    ('list_users', '/users?q={search}', 'follower'),
+    ('list_likes', '/users/likes', 'liker'),
+]
+
+
+def get(client, url):
+    """GET `url`; returns the response and seconds to its first byte."""
+
+    start = perf_counter()
+    resp = client.get(url, buffered=False)
+    try:
+        body = iter(resp.response)
+        first = next(body, b'')
+        first_byte = perf_counter() - start
+        resp.set_data(first + b''.join(body))
+    finally:
+        resp.close()
+
+    return resp, first_byte
+
+
+def measure(app, client, url, requests, warmup):
+    """Latency, time to first byte, statement count and peak memory for
+    GETs of `url`."""
+
+    import querystats
+
+    for _ in range(warmup):
+        get(client, url)
+
+    timings = []
+    first_bytes = []
+    for _ in range(requests):
+        with querystats.count_queries() as stats:
+            start = perf_counter()
+            resp, first_byte = get(client, url)
+            timings.append((perf_counter() - start) * 1000)
+            first_bytes.append(first_byte * 1000)
+        assert resp.status_code == 200, (url, resp.status_code)
+
+    tracemalloc.start()
+    try:
+        get(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        p50_ms=round(percentile(timings, 50), 3),
+        p95_ms=round(percentile(timings, 95), 3),
+        p99_ms=round(percentile(timings, 99), 3),
+        mean_ms=round(sum(timings) / len(timings), 3),
+        ttfb_p50_ms=round(percentile(first_bytes, 50), 3),
+        queries=stats.count,
+        repeated=len(stats.repeated()),
+        peak_kib=round(peak / 1024, 1),
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against `baseline`; returns the names of regressions."""
+
+    regressions = []
+    for name, now in results['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+
+        change = now['p50_ms'] / before['p50_ms'] - 1
+        print(f"{name:16} p50 {before['p50_ms']:8.2f} -> {now['p50_ms']:8.2f} ms"
+              f" ({change:+.0%})  queries {before['queries']} -> "
+              f"{now['queries']}")
+
+        if change > tolerance or now['queries'] > before['queries']:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--seed', default='warbler')
+    parser.add_argument('--reuse', action='store_true',
+                        help="benchmark the data already in the database")
+    parser.add_argument('--requests', type=int, default=50,
+                        help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--routes', nargs='+', metavar='ROUTE',
+                        choices=[name for name, _, _ in ROUTES],
+                        help="only benchmark these routes")
+    parser.add_argument('--stream', action='store_true',
+                        help="stream the pages that support it")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare with this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        parser.error("set DATABASE_URL to a scratch database")
+
+    from app import app, CURR_USER_KEY
+    from models import db
+
+    app.config['DEBUG_TB_ENABLED'] = False
+    app.config['STREAM_PAGES'] = args.stream
+
+    with app.app_context():
+        if not args.reuse:
+            build(app, args.size, args.seed)
+
+        users = pick_users()
+        results = dict(
+            size=args.size,
+            stream=args.stream,
+            database=db.engine.dialect.name,
+            dataset={name: db.engine.execute(
+                f"SELECT COUNT(*) FROM {name}").scalar()
+                for name in CSV_FILES},
+            routes={},
+        )
+
+    for name, template, viewer in ROUTES:
+        if args.routes and name not in args.routes:
+            continue
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = users[viewer]
+
+            results['routes'][name] = stats = measure(
+                app, client, template.format(**users),
+                args.requests, args.warmup)
+
+        print(f"{name:16} p50 {stats['p50_ms']:8.2f} ms  "
+              f"p95 {stats['p95_ms']:8.2f} ms  "
+              f"p99 {stats['p99_ms']:8.2f} ms  "
+              f"ttfb {stats['ttfb_p50_ms']:8.2f} ms  "
+              f"{stats['queries']:4} queries  "
+              f"peak {stats['peak_kib']:9,.1f} KiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
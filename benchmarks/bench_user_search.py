@@ -0,0 +1,102 @@
+"""Benchmark username search latency.
+
+By default builds the in-process n-gram index over synthetic usernames
+and times random infix/prefix queries against it:
+
+    python benchmarks/bench_user_search.py --users 1000000 --queries 2000
+
+With --sql the queries go to the database named by DATABASE_URL instead
+(load it first, e.g. with seed.py), exercising the pg_trgm index.
+"""
+
+import argparse
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYLLABLES = ["al", "bo", "ca", "de", "el", "fa", "gi", "ho", "in", "ja",
+             "ka", "lu", "mo", "ni", "or", "pe", "qu", "ra", "si", "tu"]
+
+
+def fake_username(rng):
+    """A pronounceable-ish username with a numeric suffix."""
+
+    stem = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return f"{stem}{rng.randint(0, 9999)}"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_queries(rng, names, count):
+    """Random substrings (and some prefixes) of real usernames."""
+
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        length = rng.randint(2, min(6, len(name)))
+        start = 0 if rng.random() < 0.3 else rng.randint(0, len(name) - length)
+        queries.append(name[start:start + length])
+    return queries
+
+
+def time_queries(search, queries):
+    timings = []
+    for query in queries:
+        start = perf_counter()
+        search(query)
+        timings.append((perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sql', action='store_true',
+                        help="query the database instead of the in-process index")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    if args.sql:
+        from app import app
+        from models import db, User
+        import search
+
+        app.config['SEARCH_BACKEND'] = 'sql'
+        with app.app_context():
+            names = [name for (name,) in
+                     db.session.query(User.username).limit(100000)]
+            queries = make_queries(rng, names, args.queries)
+            timings = time_queries(search.search_users, queries)
+    else:
+        from search import UsernameIndex
+
+        index = UsernameIndex()
+        names = []
+        start = perf_counter()
+        for user_id in range(1, args.users + 1):
+            name = fake_username(rng)
+            names.append(name)
+            index.add(user_id, name)
+        print(f"built index of {len(index)} users "
+              f"in {perf_counter() - start:.1f}s")
+
+        queries = make_queries(rng, names, args.queries)
+        timings = time_queries(index.search, queries)
+
+    print(f"queries: {len(timings)}")
+    for pct in (50, 95, 99):
+        print(f"p{pct}: {percentile(timings, pct):.2f} ms")
+    print(f"max: {max(timings):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
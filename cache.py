@@ -0,0 +1,128 @@
+"""Small in-process caches for Warbler.
+
+Each worker process keeps its own caches; nothing here is shared between
+processes, so every cache has a TTL to bound how stale an entry written
+by another worker can get.
+"""
+
+import sys
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by a byte budget.
+
+    `sizeof` estimates the size of a value in bytes; the least recently
+    used entries are evicted once the total goes over `max_bytes`.
+    Entries older than `ttl` seconds are treated as misses.
+    """
+
+    def __init__(self, max_bytes, ttl=None, sizeof=sys.getsizeof):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        """Snapshot of the cached keys."""
+
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` on a miss."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Cache `value` under `key`, evicting old entries as needed."""
+
+        size = self.sizeof(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size, monotonic())
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def update(self, key, func):
+        """Replace the cached value for `key` with `func(value)`.
+
+        Does nothing if `key` isn't cached. The entry keeps its age, so
+        patching doesn't extend its TTL.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+
+            value = func(entry[0])
+            size = self.sizeof(value)
+            self.bytes += size - entry[1]
+            self._entries[key] = (value, size, entry[2])
+
+    def delete(self, key):
+        """Drop `key` from the cache if present."""
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Counters for monitoring."""
+
+        return dict(entries=len(self._entries),
+                    bytes=self.bytes,
+                    max_bytes=self.max_bytes,
+                    hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions)
+
+    def _expired(self, entry):
+        return self.ttl is not None and monotonic() - entry[2] > self.ttl
+
+    def _remove(self, key):
+        value, size, stored = self._entries.pop(key)
+        self.bytes -= size
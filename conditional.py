@@ -0,0 +1,134 @@
+"""Conditional GET for profile, follower and message pages.
+
+`@cached(version_of)` gives a view an ETag and Last-Modified derived from
+the versions of what it shows: `version_of(**view_args)` runs one small
+query and returns `(tag, last_modified)`, or None if the resource doesn't
+exist (the view then runs as usual, and 404s). The logged-in user's
+version is mixed in too, since pages show their nav bar, follow buttons
+and likes. When the browser already has the current version the view
+isn't run and the response is an empty 304.
+
+Versions come from `users.version` / `users.updated_at`, which change
+with every edit or counter update (`User.touch`, `counters.adjust`),
+`users.listing_version` and the listed users' `profile_version`s for
+follower and following pages, and `messages.timestamp`, since messages
+are never edited.
+"""
+
+from functools import wraps
+from hashlib import sha1
+
+from flask import Response, g, make_response, request, session
+from sqlalchemy.orm import aliased
+from werkzeug.http import is_resource_modified
+
+from models import db, Follows, Message, User
+
+
+def cached(version_of):
+    """Answer conditional GETs of the decorated view from `version_of`."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            version = version_of(**kwargs)
+            if version is None:
+                return view(**kwargs)
+
+            tag, last_modified = version
+            if g.user:
+                tag = (tag, g.user.id, g.user.version)
+                last_modified = max(last_modified, g.user.updated_at)
+
+            etag = sha1(repr((request.full_path, tag)).encode()).hexdigest()
+
+            # A pending flash message is part of the page.
+            if session.get('_flashes') or is_resource_modified(
+                    request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = Response(status=304)
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def user_version(user_id):
+    """Version of a user's profile page."""
+
+    row = (db.session
+           .query(User.version, User.updated_at)
+           .filter(User.id == user_id, User.deleted_at.is_(None))
+           .first())
+
+    return row and (row.version, row.updated_at)
+
+
+def listing_version(user_id, listed_col, owner_col):
+    """Version of a page listing the users `user_id` follows or is
+    followed by (see `app.follows_page` for the columns).
+
+    `listing_version` covers follows and unfollows (`counters.adjust`);
+    edits by the users listed are covered by the sum of their
+    `profile_version`s, which any one edit changes, read from the follows
+    index rather than written to every lister on each edit. The owner's
+    row and the sum come back in one query.
+    """
+
+    listed = aliased(User)
+    listing = (db.session
+               .query(db.func.count(listed.id).label('count'),
+                      db.func.sum(listed.profile_version).label('profiles'),
+                      db.func.max(listed.updated_at).label('updated_at'))
+               .select_from(Follows)
+               .join(listed, listed_col == listed.id)
+               .filter(owner_col == user_id, listed.deleted_at.is_(None))
+               .subquery())
+
+    row = (db.session
+           .query(User.version,
+                  User.listing_version,
+                  User.updated_at,
+                  listing.c.count,
+                  listing.c.profiles,
+                  listing.c.updated_at.label('listed_at'))
+           .filter(User.id == user_id, User.deleted_at.is_(None))
+           .first())
+    if row is None:
+        return None
+
+    tag = (row.version, row.listing_version, row.count, row.profiles)
+    return tag, max(row.updated_at, row.listed_at or row.updated_at)
+
+
+def following_version(user_id):
+    """Version of the page of the users `user_id` follows."""
+
+    return listing_version(user_id, Follows.user_being_followed_id,
+                           Follows.user_following_id)
+
+
+def followers_version(user_id):
+    """Version of the page of `user_id`'s followers."""
+
+    return listing_version(user_id, Follows.user_following_id,
+                           Follows.user_being_followed_id)
+
+
+def message_version(message_id):
+    """Version of a message's page: the message and its author."""
+
+    row = (db.session
+           .query(Message.timestamp, User.version, User.updated_at)
+           .join(User, User.id == Message.user_id)
+           .filter(Message.id == message_id, User.deleted_at.is_(None))
+           .first())
+
+    return row and (row.version, max(row.timestamp, row.updated_at))
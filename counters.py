@@ -0,0 +1,96 @@
+"""Denormalized per-user counters.
+
+`users` carries message, following, follower and like counts so pages can
+show them without loading whole relationship collections. Handlers call
+`adjust()` in the same transaction as the write it accounts for;
+`repair()` rebuilds every counter from the source tables, directly or
+as a `repair_counters` background job.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func
+
+import jobs
+from models import db, Follows, Likes, Message, User
+
+# counter column -> the column whose rows it counts, grouped by user
+SOURCES = {
+    'messages_count': Message.user_id,
+    'following_count': Follows.user_following_id,
+    'followers_count': Follows.user_being_followed_id,
+    'likes_count': Likes.user_id,
+}
+
+
+def adjust(user_ids, **deltas):
+    """Add `deltas` (e.g. `likes_count=1`) to the counters of `user_ids`.
+
+    `user_ids` is one ID or a list/subquery of them. The update is done in
+    SQL (`count = count + n`), so concurrent writers don't lose updates.
+    The counts show on the users' pages, so their versions are bumped too,
+    and a change in follows bumps their listing versions.
+    """
+
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    values = {getattr(User, name): getattr(User, name) + delta
+              for name, delta in deltas.items()}
+    values.update(touched())
+    if {'following_count', 'followers_count'} & deltas.keys():
+        values[User.listing_version] = User.listing_version + 1
+
+    (User
+     .query
+     .filter(User.id.in_(user_ids))
+     .update(values, synchronize_session=False))
+
+
+def touched():
+    """UPDATE values that bump a user's version (cf. `User.touch`)."""
+
+    return {User.version: User.version + 1,
+            User.updated_at: datetime.utcnow()}
+
+
+@jobs.handler('repair_counters')
+def repair():
+    """Recompute every counter from the source tables.
+
+    Zeroes the counters, then writes each one back with a single
+    set-based UPDATE from a GROUP BY of its source table, so nothing is
+    read into Python. Run inside a transaction so readers never see the
+    zeroed state.
+    """
+
+    db.session.query(User).update({**{getattr(User, name): 0
+                                      for name in SOURCES},
+                                   **touched()},
+                                  synchronize_session=False)
+
+    users = User.__table__
+
+    for name, column in SOURCES.items():
+        if db.engine.dialect.name == 'postgresql':
+            # UPDATE users SET x = sub.n FROM (SELECT ... GROUP BY ...) sub
+            counts = (db.select([column.label('user_id'),
+                                 func.count().label('n')])
+                      .group_by(column)
+                      .alias('counts'))
+            update = (users
+                      .update()
+                      .where(users.c.id == counts.c.user_id)
+                      .values({name: counts.c.n}))
+        else:
+            # No UPDATE ... FROM in SQLAlchemy 1.3's SQLite dialect; count
+            # with a correlated subquery instead.
+            count = (db.select([func.count()])
+                     .where(column == users.c.id)
+                     .as_scalar())
+            update = (users
+                      .update()
+                      .where(users.c.id.in_(db.select([column]).distinct()))
+                      .values({name: count}))
+
+        db.session.execute(update)
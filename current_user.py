@@ -0,0 +1,111 @@
+"""Lightweight snapshot of the logged-in user.
+
+Every request needs a few facts about the current user (ID, name, avatar,
+counts) to render the nav bar and sidebar, but very few need the full ORM
+`User`. `load()` returns a read-only `UserSnapshot` from a short-TTL
+per-worker cache, keyed by user ID and a version number kept in the
+signed session. Handlers bump that version after changing anything the
+snapshot shows, so the user never sees their own stale data; changes made
+by other users (e.g. a new follower) show up once the TTL runs out.
+"""
+
+from flask import current_app, session
+
+from cache import LRUCache
+from models import db, User
+
+# Session key of the version the logged-in user's snapshot is cached at.
+VERSION_KEY = "curr_user_version"
+
+DEFAULT_TTL = 5
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+SNAPSHOT_COLUMNS = (
+    User.id,
+    User.username,
+    User.image_url,
+    User.header_image_url,
+    User.messages_count,
+    User.following_count,
+    User.followers_count,
+    User.likes_count,
+    User.version,
+    User.updated_at,
+)
+
+
+class UserSnapshot:
+    """Read-only view of a user's row, detached from the session."""
+
+    __slots__ = [column.key for column in SNAPSHOT_COLUMNS]
+
+    def __init__(self, row):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"<UserSnapshot #{self.id}: {self.username}>"
+
+    # These only need `self.id`, so the model's query helpers work as-is.
+    is_following = User.is_following
+    followed_ids = User.followed_ids
+    liked_message_ids = User.liked_message_ids
+
+
+def snapshot_cache():
+    """This app's snapshot cache, or None if caching is switched off."""
+
+    ttl = current_app.config.get('CURRENT_USER_CACHE_TTL', DEFAULT_TTL)
+    if not ttl:
+        return None
+
+    cache = current_app.extensions.get('current_user_cache')
+    if cache is None:
+        cache = LRUCache(max_bytes=DEFAULT_MAX_BYTES, ttl=ttl,
+                         sizeof=lambda snapshot: 512)
+        current_app.extensions['current_user_cache'] = cache
+
+    return cache
+
+
+def load(user_id, version=0):
+    """Snapshot of `user_id` at `version`, or None if there's no such user
+    (or they deleted their account)."""
+
+    cache = snapshot_cache()
+    key = (user_id, version)
+
+    if cache is not None:
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot
+
+    row = (db.session
+           .query(*SNAPSHOT_COLUMNS)
+           .filter(User.id == user_id, User.deleted_at.is_(None))
+           .first())
+
+    if row is None:
+        return None
+
+    snapshot = UserSnapshot(row)
+    if cache is not None:
+        cache.set(key, snapshot)
+
+    return snapshot
+
+
+def forget(user_id, version):
+    """Drop a cached snapshot that is about to be superseded."""
+
+    cache = snapshot_cache()
+    if cache is not None:
+        cache.delete((user_id, version))
+
+
+def changed(user_id):
+    """Move the logged-in user, `user_id`, on to a new snapshot version."""
+
+    version = session.get(VERSION_KEY, 0)
+    forget(user_id, version)
+    session[VERSION_KEY] = version + 1
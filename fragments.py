@@ -0,0 +1,82 @@
+"""Cached markup of message cards.
+
+The same message is rendered into the timeline of every follower, and
+each card needs its author's avatar and username and a formatted date.
+Templates call `message_card(msg)` for the part of a card that looks the
+same to everyone; each worker keeps that markup in an LRU cache bounded
+by `FRAGMENT_CACHE_MAX_BYTES` (0 switches caching off). Anything that
+depends on the viewer, such as the like button, stays in the calling
+template.
+
+Entries are keyed by message ID, author ID, timestamp and the author's
+`profile_version`, so a profile edit makes the author's cards re-render,
+while the follows, likes and posts that bump their `version` don't, and
+a message ID reused after a delete or a reseed can't pick up another
+message's card. Messages are never edited; deleting one drops its card
+with `forget()`. There is no TTL.
+"""
+
+from flask import current_app
+from markupsafe import Markup
+
+from cache import LRUCache
+
+CARD_TEMPLATE = 'messages/card.html'
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def init_app(app):
+    """Make `message_card` available to `app`'s templates."""
+
+    app.add_template_global(message_card)
+
+
+def fragment_cache():
+    """This app's fragment cache, or None if caching is switched off."""
+
+    max_bytes = current_app.config.get('FRAGMENT_CACHE_MAX_BYTES',
+                                       DEFAULT_MAX_BYTES)
+    if not max_bytes:
+        return None
+
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        cache = LRUCache(max_bytes=max_bytes)
+        current_app.extensions['fragment_cache'] = cache
+
+    return cache
+
+
+def message_card(msg):
+    """Markup of `msg`'s card, minus anything viewer-specific."""
+
+    cache = fragment_cache()
+    key = (msg.id, msg.user_id, msg.timestamp, msg.user.profile_version)
+
+    if cache is not None:
+        html = cache.get(key)
+        if html is not None:
+            return html
+
+    # Rendered directly rather than with render_template, so the many
+    # cards of a page don't each fire the template signals.
+    template = current_app.jinja_env.get_template(CARD_TEMPLATE)
+    html = Markup(template.render(msg=msg))
+
+    if cache is not None:
+        cache.set(key, html)
+
+    return html
+
+
+def forget(message_ids):
+    """Drop the cached cards of deleted messages (this worker only)."""
+
+    cache = fragment_cache()
+    if cache is None or not len(cache):
+        return
+
+    message_ids = set(message_ids)
+    for key in cache.keys():
+        if key[0] in message_ids:
+            cache.delete(key)
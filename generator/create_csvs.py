@@ -2,76 +2,219 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows, e.g. for load testing:
+
+    python generator/create_csvs.py --users 1000000 --messages 10000000 \\
+        --follows 20000000 --likes 30000000 --out /tmp/warbler-big
+
+Output depends only on the arguments: no network access, no clock. Work
+is split into chunks that each get their own seeded random generator, so
+for a given `--seed` and `--chunk-size` the files are identical whatever
+the number of worker processes.
+
+Follows and likes are heavy-tailed: how many accounts a user follows (or
+messages they like) is Pareto-distributed, and who gets followed (or which
+messages get liked) is Zipf-distributed, so a few accounts are very
+popular and most have a handful of followers. Prolific posters are the
+popular accounts. Message timestamps grow denser towards `--end` and
+follow a daily cycle.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
-from faker import Faker
-from helpers import get_random_datetime
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from random import Random
+
+from helpers import (
+    DOMAINS, CITIES, FIRST_NAMES, LAST_NAMES, HEADER_IMAGE_URLS,
+    PROFILE_IMAGE_URLS, paragraph, pareto_degree, random_timestamp, scatter,
+    scatter_stride, sentence, zipf_rank)
 
 MAX_WARBLER_LENGTH = 140
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+LIKES_CSV_HEADERS = ['user_id', 'message_id']
 
 NUM_USERS = 300
 NUM_MESSAGES = 1000
-NUM_FOLLWERS = 5000
+NUM_FOLLOWS = 5000
+NUM_LIKES = 2000
 
-fake = Faker()
+# bcrypt hash of "password", shared by every generated user.
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
 
-# Generate random profile image URLs to use for users
+# Zipf exponent for who gets followed / posts / which messages get liked.
+POPULARITY_ALPHA = 1.0
+# Pareto shape for how many follows/likes each user makes.
+DEGREE_ALPHA = 1.5
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
 
-# Generate random header image URLs to use for users
+def user_rows(rng, lo, hi, opts):
+    for user_id in range(lo, hi):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+
+        yield [
+            f"{first}.{last}{user_id}@{rng.choice(DOMAINS)}",
+            f"{first}{last}{user_id}",
+            rng.choice(PROFILE_IMAGE_URLS),
+            PASSWORD,
+            sentence(rng),
+            rng.choice(HEADER_IMAGE_URLS),
+            rng.choice(CITIES),
+        ]
+
+
+def message_rows(rng, lo, hi, opts):
+    users = opts['users']
+    stride = scatter_stride(users)
+
+    for _ in range(lo, hi):
+        author = scatter(zipf_rank(rng, users, POPULARITY_ALPHA), users, stride)
+
+        yield [
+            paragraph(rng, MAX_WARBLER_LENGTH),
+            random_timestamp(rng, opts['start'], opts['end']).isoformat(' '),
+            author,
+        ]
+
+
+def follow_rows(rng, lo, hi, opts):
+    """Follows made by users `lo` to `hi - 1`."""
+
+    users = opts['users']
+    stride = scatter_stride(users)
+    mean = opts['follows'] / users
+
+    for follower in range(lo, hi):
+        for followed in distinct_targets(
+                rng, users, stride, pareto_degree(rng, mean, DEGREE_ALPHA,
+                                                  users - 1),
+                exclude=follower):
+            yield [followed, follower]
+
+
+def like_rows(rng, lo, hi, opts):
+    """Likes made by users `lo` to `hi - 1`."""
+
+    messages = opts['messages']
+    if not messages:
+        return
+
+    stride = scatter_stride(messages)
+    mean = opts['likes'] / opts['users']
+
+    for user_id in range(lo, hi):
+        for message_id in distinct_targets(
+                rng, messages, stride, pareto_degree(rng, mean, DEGREE_ALPHA,
+                                                     messages)):
+            yield [user_id, message_id]
+
+
+def distinct_targets(rng, n, stride, count, exclude=None):
+    """Up to `count` distinct Zipf-popular IDs in 1..n, sorted."""
+
+    targets = set()
+    # Popular IDs repeat a lot; give up rather than spin on a tiny range.
+    for _ in range(count * 4):
+        if len(targets) == count:
+            break
+        target = scatter(zipf_rank(rng, n, POPULARITY_ALPHA), n, stride)
+        if target != exclude:
+            targets.add(target)
+
+    return sorted(targets)
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
+
+# Users and messages are chunked by row; follows and likes by the user
+# making them.
+TABLES = [
+    # name, headers, row generator, IDs chunked over
+    ('users', USERS_CSV_HEADERS, user_rows, 'users'),
+    ('messages', MESSAGES_CSV_HEADERS, message_rows, 'messages'),
+    ('follows', FOLLOWS_CSV_HEADERS, follow_rows, 'users'),
+    ('likes', LIKES_CSV_HEADERS, like_rows, 'users'),
 ]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
-
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
-
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
-
-# Generate follows.csv from random pairings of users
-
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
-
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+
+def write_part(task):
+    """Generate one chunk into its own file; returns (path, row count)."""
+
+    name, rows, index, lo, hi, opts, path = task
+    rng = Random(f"{opts['seed']}:{name}:{index}")
+
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for row in rows(rng, lo, hi, opts):
+            writer.writerow(row)
+            count += 1
+
+    return path, count
+
+
+def generate(name, headers, rows, chunked_over, opts, pool, tmpdir):
+    """Write `<name>.csv` in `opts['out']` from chunks generated on `pool`."""
+
+    total = opts[chunked_over]
+    rows_per_id = opts[name] / total if total else 1
+    step = max(1, int(opts['chunk_size'] / max(1, rows_per_id)))
+
+    tasks = [(name, rows, index, lo, min(total + 1, lo + step), opts,
+              os.path.join(tmpdir, f"{name}.{index:06}.csv"))
+             for index, lo in enumerate(range(1, total + 1, step))]
+
+    written = 0
+    with open(os.path.join(opts['out'], f"{name}.csv"), 'w', newline='') as out:
+        csv.writer(out).writerow(headers)
+
+        for path, count in pool.map(write_part, tasks):
+            with open(path, newline='') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+
+            written += count
+            print(f"{name}: {written:,} rows", file=sys.stderr)
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Warbler CSVs.")
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLOWS,
+                        help="approximate number of follows")
+    parser.add_argument('--likes', type=int, default=NUM_LIKES,
+                        help="approximate number of likes")
+    parser.add_argument('--seed', default='warbler')
+    parser.add_argument('--start', type=datetime.fromisoformat,
+                        default=datetime(2017, 1, 1),
+                        help="earliest message timestamp")
+    parser.add_argument('--end', type=datetime.fromisoformat,
+                        default=datetime(2019, 1, 1),
+                        help="latest message timestamp")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                        help="approximate rows per chunk")
+    parser.add_argument('--out', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory to write the CSVs to")
+    opts = vars(parser.parse_args())
+
+    os.makedirs(opts['out'], exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=opts['workers']) as pool, \
+            tempfile.TemporaryDirectory(dir=opts['out']) as tmpdir:
+        for name, headers, rows, chunked_over in TABLES:
+            generate(name, headers, rows, chunked_over, opts, pool, tmpdir)
+
+
+if __name__ == '__main__':
+    main()
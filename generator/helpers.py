@@ -1,14 +1,180 @@
-"""Support functions for CSV generation."""
+"""Support functions for CSV generation.
 
-from datetime import datetime
-from random import uniform
+Everything here draws from a `random.Random` passed in by the caller, so
+output depends only on the seed, never on the clock or the network.
+"""
 
+from datetime import timedelta
+from itertools import accumulate
+from math import gcd
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+# Header images previously fetched from the splashbase API, kept here so
+# generation needs no network access.
+HEADER_IMAGE_IDS = [
+    'tumblr_mnh0n9pHJW1st5lhmo1', 'tumblr_mnh0uemhCk1st5lhmo1',
+    'tumblr_mnh121HEWa1st5lhmo1', 'tumblr_mnh17lfd9R1st5lhmo1',
+    'tumblr_mnh1d7s3UD1st5lhmo1', 'tumblr_mnh1jdFvHR1st5lhmo1',
+    'tumblr_mnh1uhYnog1st5lhmo1', 'tumblr_mnh25vNOvI1st5lhmo1',
+    'tumblr_mnh29fxz111st5lhmo1', 'tumblr_mnh2m1hnS81st5lhmo1',
+    'tumblr_mo1h6tGOZf1st5lhmo1', 'tumblr_mo2wz2LTCs1st5lhmo1',
+    'tumblr_mo2x3aAnRH1st5lhmo1', 'tumblr_mo2x80NkDu1st5lhmo1',
+    'tumblr_mo2x9xqeef1st5lhmo1', 'tumblr_mo2xbk8JUK1st5lhmo1',
+    'tumblr_mo2xdqmle51st5lhmo1', 'tumblr_mo2xfarCvW1st5lhmo1',
+    'tumblr_mo2xgqdEFn1st5lhmo1', 'tumblr_mo2xijE2nr1st5lhmo1',
+    'tumblr_mopq4kHmAg1st5lhmo1', 'tumblr_mopq69jlcS1st5lhmo1',
+    'tumblr_mopq8fyQwI1st5lhmo1', 'tumblr_mopqamedKu1st5lhmo1',
+    'tumblr_mopqc3ZZcz1st5lhmo1', 'tumblr_mopqdfx05t1st5lhmo1',
+    'tumblr_mopqfpSTPN1st5lhmo1', 'tumblr_mopqhxFulr1st5lhmo1',
+    'tumblr_mopqj9QUeq1st5lhmo1', 'tumblr_mopqkkwK2M1st5lhmo1',
+    'tumblr_mp6rzyNlAN1st5lhmo1', 'tumblr_mp6s1hAudo1st5lhmo1',
+    'tumblr_mp6s32zb6l1st5lhmo1', 'tumblr_mp6s4dzqHA1st5lhmo1',
+    'tumblr_mp6s661UgK1st5lhmo1', 'tumblr_mp6s7lR1lS1st5lhmo1',
+    'tumblr_mp6s995bvI1st5lhmo1', 'tumblr_mp6sasSvPZ1st5lhmo1',
+    'tumblr_mp6scv2xrZ1st5lhmo1', 'tumblr_mpp6f50W261st5lhmo1',
+    'tumblr_mpp6gwrYvm1st5lhmo1', 'tumblr_mpp6l06zXi1st5lhmo1',
+    'tumblr_mpp6poZxE51st5lhmo1', 'tumblr_mpp6tjdFhf1st5lhmo1',
+    'tumblr_mpp6w0dxAm1st5lhmo1',
+]
 
-    now = datetime.now()
-    then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+HEADER_IMAGE_URLS = [
+    f"https://splashbase.s3.amazonaws.com/unsplash/regular/{image}_1280.jpg"
+    for image in HEADER_IMAGE_IDS
+]
 
-    return datetime.fromtimestamp(random_timestamp)
+PROFILE_IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
+
+FIRST_NAMES = """
+    alex amy ben beth carl cora dan dana eli emma finn gina hank ivy jack
+    jane kai kate leo lily max mia ned nora omar olga pat quinn ray rosa
+    sam sara tom tina uma vic wes willa xena yuri zoe
+""".split()
+
+LAST_NAMES = """
+    adams baker brown clark cruz davis diaz evans ford garcia gray hall
+    hill jones king lee lopez martin moore nguyen parker patel perez reed
+    rivera ross scott smith stone taylor turner walker ward white wood young
+""".split()
+
+DOMAINS = ["gmail.com", "yahoo.com", "hotmail.com", "example.com",
+           "mail.net", "inbox.org"]
+
+CITIES = """
+    Austin Boston Chicago Denver Detroit Houston Miami Oakland Omaha
+    Phoenix Portland Raleigh Reno Richmond Sacramento Seattle Tampa Tulsa
+""".split()
+
+WORDS = """
+    able about above across after again against air all almost along also
+    always among and another answer any area around ask away back bad base
+    be because become been before begin behind best better between big
+    bird book both bring build business but call can car care carry case
+    change child city close cold come common could country course cut day
+    deal deep develop different direction do door down draw during each
+    early earth east easy eat end enough even every eye face fact fall
+    family far fast feel few field find fire first fish follow food for
+    form found free friend from front full game general get give go good
+    great green ground group grow hand happen hard have head hear heart
+    help here high hold home hope hour house idea important just keep kind
+    know land large last late laugh lead learn leave less life light like
+    line list little live long look lose low make man many mark may mean
+    measure meet mind minute miss money month more morning most mother
+    mountain move much music must name near need never new next night
+    north note nothing notice now number object of off often old once only
+    open order other our out over own page paper part pass past pattern
+    people perhaps picture piece place plan plant play point power press
+    problem produce pull put question quick rain reach read ready real
+    record red remember rest right river road rock room round rule run
+    same say school sea second see seem serve set shape short show side
+    simple since sing sit size sleep slow small snow so some song soon
+    sound south space special stand star start state stay step still stop
+    story street strong study such sun sure table take talk teach tell
+    than that the then there these thing think those thought through time
+    today together too top toward town travel tree true try turn under
+    until up use very voice wait walk want warm watch water way weather
+    week well west what wheel when where while white whole why wide wind
+    winter with without word work world would write year yes yet young
+""".split()
+
+# Relative posting activity by hour of day (UTC): quiet overnight,
+# peaking in the evening.
+HOURLY_ACTIVITY = [
+    2, 1, 1, 1, 1, 2, 3, 5, 6, 6, 6, 7,
+    8, 7, 6, 6, 7, 8, 10, 11, 11, 9, 6, 4,
+]
+HOURLY_CUM_WEIGHTS = list(accumulate(HOURLY_ACTIVITY))
+HOURS = range(24)
+
+
+def zipf_rank(rng, n, alpha):
+    """A rank in 1..n drawn with probability roughly proportional to
+    rank ** -alpha, in O(1) time and memory (inverse CDF of the
+    continuous approximation)."""
+
+    u = rng.random()
+    if alpha == 1:
+        rank = n ** u
+    else:
+        rank = ((n ** (1 - alpha) - 1) * u + 1) ** (1 / (1 - alpha))
+
+    return min(n, max(1, int(rank)))
+
+
+def scatter_stride(n):
+    """A stride coprime with `n`, for `scatter`."""
+
+    stride = int(n * 0.618) | 1
+    while gcd(stride, n) != 1:
+        stride += 1
+
+    return stride
+
+
+def scatter(rank, n, stride):
+    """Map a popularity rank to an ID in 1..n.
+
+    This is a permutation, so popular users are spread across the ID
+    range rather than being the oldest accounts.
+    """
+
+    return (rank - 1) * stride % n + 1
+
+
+def pareto_degree(rng, mean, alpha, cap):
+    """A heavy-tailed count with the given (pre-cap) mean, at most `cap`."""
+
+    scale = mean * (alpha - 1) / alpha
+    return min(cap, int(scale * rng.paretovariate(alpha)))
+
+
+def sentence(rng, min_words=4, max_words=12):
+    """A capitalized sentence of random words."""
+
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, max_length):
+    """A few sentences, cut to `max_length` characters."""
+
+    text = " ".join(sentence(rng) for _ in range(rng.randint(1, 4)))
+    return text[:max_length]
+
+
+def random_timestamp(rng, start, end):
+    """A timestamp in [start, end).
+
+    Activity grows linearly over the period (so recent days are busier)
+    and follows a daily cycle.
+    """
+
+    days = (end - start).days
+    day = int(days * rng.random() ** 0.5)
+    hour = rng.choices(HOURS, cum_weights=HOURLY_CUM_WEIGHTS)[0]
+
+    return start + timedelta(days=day,
+                             seconds=hour * 3600 + rng.randrange(3600),
+                             microseconds=rng.randrange(1000000))
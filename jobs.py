@@ -0,0 +1,260 @@
+"""Background jobs, queued in the database.
+
+Work that needn't finish before a response goes out -- timeline fan-out
+and backfill, account purges, counter repair -- is queued as a row in
+`jobs` with `enqueue(kind, **payload)` and done later by a worker
+(`flask run-jobs`). The row is written in the caller's transaction, so
+a job is queued if and only if the write that asked for it commits.
+
+Handlers are registered per kind with `@handler(kind)` and called with
+the payload as keyword arguments inside an app context. A job's handler
+and the removal of the finished job commit together. A job that raises
+is retried up to `JOB_MAX_ATTEMPTS` times, waiting
+`JOB_RETRY_SECONDS * 2 ** (attempt - 1)` seconds in between, then left
+in the table as failed. A running job whose worker hasn't finished it
+within `JOB_LOCK_SECONDS` (say it was killed) is taken by another one;
+handlers that work in batches call `heartbeat()` with each batch to keep
+their job.
+
+Jobs given a `key` are only queued once: while one with that key is
+waiting, enqueueing another is a no-op. Handlers should be safe to run
+twice all the same.
+
+With `JOBS_SYNC` on (as in the tests), there is no queue: `enqueue()`
+runs the handler at once, in the caller's transaction. Handlers that
+work in batches commit that transaction, so callers enqueue after the
+rest of their writes.
+"""
+
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event
+
+from flask import current_app, g
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db, Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_SECONDS = 10
+DEFAULT_LOCK_SECONDS = 600
+DEFAULT_POLL_SECONDS = 1.0
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the decorated function as the handler for `kind` jobs."""
+
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+def sync():
+    """Are jobs run as they are enqueued?"""
+
+    return current_app.config.get('JOBS_SYNC', False)
+
+
+def enqueue(kind, key=None, delay=0, **payload):
+    """Queue a `kind` job with `payload`, to run `delay` seconds from now.
+
+    The caller commits. Does nothing if a job with the same `key` is
+    already waiting.
+    """
+
+    if sync():
+        HANDLERS[kind](**payload)
+        return
+
+    now = datetime.utcnow()
+    values = dict(kind=kind, key=key, payload=json.dumps(payload),
+                  status=QUEUED, attempts=0, created_at=now,
+                  run_at=now + timedelta(seconds=delay))
+
+    table = Job.__table__
+    if key is None:
+        insert = table.insert()
+    elif db.engine.dialect.name == 'postgresql':
+        insert = pg_insert(table).on_conflict_do_nothing(
+            index_elements=['key'], index_where=table.c.status == QUEUED)
+    else:
+        insert = table.insert().prefix_with('OR IGNORE')
+
+    db.session.execute(insert.values(values))
+
+
+##############################################################################
+# Running jobs
+
+
+def heartbeat():
+    """Renew the lock on the job being run, so no other worker takes it.
+
+    Written with the handler's next commit; does nothing outside a job.
+    """
+
+    job_id = g.get('job_id')
+    if job_id is not None:
+        (Job
+         .query
+         .filter(Job.id == job_id)
+         .update({Job.locked_at: datetime.utcnow()},
+                 synchronize_session=False))
+
+
+def claim():
+    """Take the next due job for this worker; returns it, or None.
+
+    The job is marked running and committed before it is returned, so
+    other workers skip it.
+    """
+
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config.get(
+        'JOB_LOCK_SECONDS', DEFAULT_LOCK_SECONDS))
+    due = db.or_((Job.status == QUEUED) & (Job.run_at <= now),
+                 (Job.status == RUNNING) & (Job.locked_at < stale))
+
+    candidate = (db.session
+                 .query(Job.id)
+                 .filter(due)
+                 .order_by(Job.run_at, Job.id)
+                 .limit(1))
+    if db.engine.dialect.name == 'postgresql':
+        candidate = candidate.with_for_update(skip_locked=True)
+
+    job_id = candidate.scalar()
+    if job_id is None:
+        db.session.rollback()
+        return None
+
+    # Another worker may have taken it since; only one update matches.
+    taken = (Job
+             .query
+             .filter(Job.id == job_id, due)
+             .update({Job.status: RUNNING,
+                      Job.locked_at: now,
+                      Job.attempts: Job.attempts + 1},
+                     synchronize_session=False))
+    db.session.commit()
+
+    return Job.query.get(job_id) if taken else None
+
+
+def run(job):
+    """Run a claimed `job`; returns whether it succeeded."""
+
+    job_id, kind, attempts = job.id, job.kind, job.attempts
+
+    g.job_id = job_id
+    try:
+        if kind not in HANDLERS:
+            raise LookupError(f"no handler for {kind!r} jobs")
+        HANDLERS[kind](**json.loads(job.payload))
+        Job.query.filter(Job.id == job_id).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception("job %s (%s) failed, attempt %s",
+                                     job_id, kind, attempts)
+        retry_or_fail(job_id, attempts, exc)
+        return False
+    finally:
+        g.pop('job_id', None)
+
+    return True
+
+
+def retry_or_fail(job_id, attempts, exc):
+    """Requeue a job that raised `exc` with backoff, or give up on it."""
+
+    config = current_app.config
+    job = Job.query.get(job_id)
+    job.locked_at = None
+    job.last_error = repr(exc)
+
+    if attempts >= config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+        job.status = FAILED
+    elif (job.key is not None
+          and Job.query.filter_by(key=job.key, status=QUEUED).count()):
+        # The same work has been queued again since; leave it to that job.
+        db.session.delete(job)
+    else:
+        delay = (config.get('JOB_RETRY_SECONDS', DEFAULT_RETRY_SECONDS)
+                 * 2 ** (attempts - 1))
+        job.status = QUEUED
+        job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    db.session.commit()
+
+
+def work_one():
+    """Claim and run one job; returns False if none was due."""
+
+    job = claim()
+    if job is None:
+        return False
+
+    run(job)
+    return True
+
+
+def counts():
+    """Jobs in the table, by (kind, status)."""
+
+    return Counter({(kind, status): n for kind, status, n in (
+        db.session
+        .query(Job.kind, Job.status, db.func.count())
+        .group_by(Job.kind, Job.status))})
+
+
+class Worker:
+    """Runs queued jobs of `app` on a pool of `threads` threads."""
+
+    def __init__(self, app, threads=1, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.app = app
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.stopping = Event()
+
+    def run(self, burst=False):
+        """Work until `stop()` is called or, with `burst`, the queue is
+        empty."""
+
+        with ThreadPoolExecutor(self.threads,
+                                thread_name_prefix='jobs') as pool:
+            loops = [pool.submit(self.loop, burst)
+                     for _ in range(self.threads)]
+            try:
+                for loop in loops:
+                    loop.result()
+            except KeyboardInterrupt:
+                self.stop()
+
+    def stop(self):
+        self.stopping.set()
+
+    def loop(self, burst):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    worked = work_one()
+            except Exception:
+                # Say the database is unreachable: wait and try again.
+                self.app.logger.exception("job worker failed")
+                worked = False
+
+            if not worked:
+                if burst:
+                    return
+                self.stopping.wait(self.poll_seconds)
@@ -0,0 +1,188 @@
+"""Bulk CSV loader used by seed.py.
+
+CSV files are streamed in fixed-size chunks rather than read into memory.
+On PostgreSQL each chunk goes in with COPY; on other databases it goes in
+with a batched executemany INSERT. Secondary indexes (and, on PostgreSQL,
+foreign keys) are dropped before loading and rebuilt once afterwards,
+which is much faster than maintaining them row by row. ID sequences are
+moved past the largest loaded ID when the CSV supplies its own IDs.
+"""
+
+import csv
+import io
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+
+from sqlalchemy import DateTime, Integer, text
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def chunks(rows, size):
+    """Yield lists of up to `size` items from the iterator `rows`."""
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def report(name, loaded, started, out=sys.stderr):
+    """Print a progress line for `name`."""
+
+    elapsed = perf_counter() - started
+    rate = loaded / elapsed if elapsed else 0
+    print(f"{name}: {loaded:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec)",
+          file=out)
+
+
+def copy_chunk(cursor, table, columns, chunk):
+    """COPY one chunk of CSV rows into `table` (PostgreSQL)."""
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows(chunk)
+    buf.seek(0)
+
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buf)
+
+
+def converter_for(column):
+    """Function turning a CSV string into a value for `column`.
+
+    COPY parses text itself; executemany needs Python values.
+    """
+
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, Integer):
+        return int
+
+    return str
+
+
+def load_csv(engine, table, path, chunk_size=DEFAULT_CHUNK_SIZE,
+             progress=report):
+    """Stream the CSV at `path` into `table`; returns the row count.
+
+    The CSV header names the columns. Empty fields load as NULL.
+    """
+
+    loaded = 0
+    started = perf_counter()
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+
+        if engine.dialect.name == 'postgresql':
+            conn = engine.raw_connection()
+            try:
+                cursor = conn.cursor()
+                for chunk in chunks(reader, chunk_size):
+                    copy_chunk(cursor, table, columns, chunk)
+                    loaded += len(chunk)
+                    progress(table.name, loaded, started)
+                conn.commit()
+            finally:
+                conn.close()
+
+        else:
+            converters = [converter_for(table.c[column]) for column in columns]
+            with engine.begin() as conn:
+                for chunk in chunks(reader, chunk_size):
+                    conn.execute(table.insert(),
+                                 [{column: convert(value) if value else None
+                                   for column, convert, value
+                                   in zip(columns, converters, row)}
+                                  for row in chunk])
+                    loaded += len(chunk)
+                    progress(table.name, loaded, started)
+
+    return loaded
+
+
+@contextmanager
+def deferred_indexes(engine, tables):
+    """Drop secondary indexes and foreign keys; rebuild them on exit.
+
+    Primary keys and unique constraints stay in place so bad data is
+    still rejected during the load.
+    """
+
+    if engine.dialect.name == 'postgresql':
+        saved = []
+
+        with engine.begin() as conn:
+            for table in tables:
+                saved.extend(drop_postgres_extras(conn, table.name))
+
+        try:
+            yield
+        finally:
+            with engine.begin() as conn:
+                for statement in saved:
+                    conn.execute(text(statement))
+
+    else:
+        indexes = [index for table in tables for index in table.indexes]
+        for index in indexes:
+            index.drop(engine)
+
+        try:
+            yield
+        finally:
+            for index in indexes:
+                index.create(engine)
+
+
+def drop_postgres_extras(conn, table_name):
+    """Drop `table_name`'s plain indexes and foreign keys.
+
+    Returns the statements that recreate them, indexes first so foreign
+    key validation can use them.
+    """
+
+    indexes = conn.execute(text("""
+        SELECT i.indexname, i.indexdef
+          FROM pg_indexes i
+         WHERE i.tablename = :table
+           AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                            WHERE c.conname = i.indexname)
+    """), table=table_name).fetchall()
+
+    foreign_keys = conn.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid)
+          FROM pg_constraint
+         WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+    """), table=table_name).fetchall()
+
+    for name, _ in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {table_name} DROP CONSTRAINT "{name}"'))
+    for name, _ in indexes:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+    return ([definition for _, definition in indexes] +
+            [f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" {definition}'
+             for name, definition in foreign_keys])
+
+
+def reset_sequences(engine, tables):
+    """Move each table's `id` sequence past the largest loaded ID."""
+
+    if engine.dialect.name != 'postgresql':
+        return
+
+    with engine.begin() as conn:
+        for table in tables:
+            if 'id' not in table.c:
+                continue
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"))
@@ -0,0 +1,184 @@
+"""Prometheus metrics, served at /metrics.
+
+Records, per endpoint, request latency, response size, time spent in SQL
+and in template rendering, plus requests in flight, connection pool
+checkouts, bcrypt time and the hit rates of the per-worker caches.
+
+Metrics are aggregated in-process by `prometheus_client`. Under a
+pre-forking server (e.g. gunicorn with several workers) set the
+`prometheus_multiproc_dir` environment variable to an empty directory
+before the app starts; each worker then writes its metrics to mmapped
+files there and /metrics reports the sum over all workers. Call
+`mark_process_dead(pid)` from the server's child-exit hook so live
+gauges of dead workers are dropped.
+"""
+
+import os
+from time import perf_counter
+
+from flask import (
+    Response, g, request, before_render_template, template_rendered)
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool
+
+from cache import LRUCache
+from passwords import hasher
+
+MULTIPROCESS = 'prometheus_multiproc_dir' in os.environ
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75,
+                   1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    'warbler_request_duration_seconds', "Time to handle a request.",
+    ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter(
+    'warbler_requests_total', "Requests handled.",
+    ['endpoint', 'method', 'status'])
+RESPONSE_SIZE = Histogram(
+    'warbler_response_size_bytes', "Size of response bodies.",
+    ['endpoint'], buckets=SIZE_BUCKETS)
+IN_FLIGHT = Gauge(
+    'warbler_requests_in_flight', "Requests being handled.",
+    multiprocess_mode='livesum')
+
+DB_TIME = Histogram(
+    'warbler_request_db_seconds', "Time a request spent running SQL.",
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+DB_QUERIES = Histogram(
+    'warbler_request_db_queries', "SQL statements run by a request.",
+    ['endpoint'], buckets=(1, 2, 3, 5, 10, 25, 50, 100, 250))
+TEMPLATE_TIME = Histogram(
+    'warbler_template_render_seconds', "Time to render a template.",
+    ['template'], buckets=LATENCY_BUCKETS)
+
+POOL_CHECKOUTS = Counter(
+    'warbler_db_pool_checkouts_total', "Connections taken from the pool.")
+POOL_EXHAUSTED = Counter(
+    'warbler_db_pool_exhausted_total',
+    "Checkouts that left no connection (or overflow) free, so the next "
+    "checkout will wait.")
+POOL_CHECKED_OUT = Gauge(
+    'warbler_db_pool_checked_out', "Connections currently checked out.",
+    multiprocess_mode='livesum')
+
+PASSWORD_HASH_TIME = Histogram(
+    'warbler_password_hash_seconds', "Time spent in bcrypt per hash or check.",
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5))
+PASSWORD_HASH_REJECTED = Gauge(
+    'warbler_password_hash_rejected',
+    "Hashes refused because the queue was full (since worker start).",
+    multiprocess_mode='livesum')
+
+CACHE_STATS = Gauge(
+    'warbler_cache', "Per-worker cache counters (since worker start).",
+    ['cache', 'stat'], multiprocess_mode='livesum')
+
+
+def init_app(app):
+    """Instrument `app` and add the /metrics endpoint."""
+
+    if not event.contains(Pool, 'checkout', _checkout):
+        event.listen(Pool, 'checkout', _checkout)
+        event.listen(Pool, 'checkin', _checkin)
+        hasher.observers.append(PASSWORD_HASH_TIME.observe)
+
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_end_render, app)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+
+        endpoint = request.endpoint or 'unknown'
+        method = request.method
+        stats = g.get('query_stats')
+
+        def record():
+            REQUEST_LATENCY.labels(endpoint, method).observe(
+                perf_counter() - started)
+            REQUESTS.labels(endpoint, method, str(response.status_code)).inc()
+
+            if stats is not None:
+                DB_TIME.labels(endpoint).observe(stats.seconds)
+                DB_QUERIES.labels(endpoint).observe(stats.count)
+
+        # Streamed bodies do more work once the headers are sent.
+        if response.is_streamed:
+            response.call_on_close(record)
+        else:
+            record()
+
+        # Streamed bodies have no length yet.
+        if response.content_length is not None:
+            RESPONSE_SIZE.labels(endpoint).observe(response.content_length)
+
+        for name, value in app.extensions.items():
+            if isinstance(value, LRUCache):
+                for stat in ('hits', 'misses', 'evictions', 'bytes'):
+                    CACHE_STATS.labels(name, stat).set(getattr(value, stat))
+        PASSWORD_HASH_REJECTED.set(hasher.rejected)
+
+        return response
+
+    @app.teardown_request
+    def end_metrics(exc):
+        if g.pop('metrics_started', None) is not None:
+            IN_FLIGHT.dec()
+
+    app.add_url_rule('/metrics', 'metrics', serve_metrics)
+
+
+def serve_metrics():
+    """Current metrics in Prometheus text format."""
+
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Drop a finished worker's live gauges (multiprocess mode only)."""
+
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+    pool = connection_proxy._pool
+    if isinstance(pool, QueuePool) and pool._max_overflow >= 0 and \
+            pool.checkedout() >= pool.size() + pool._max_overflow:
+        POOL_EXHAUSTED.inc()
+
+
+def _checkin(dbapi_connection, connection_record):
+    POOL_CHECKED_OUT.dec()
+
+
+def _start_render(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(perf_counter())
+
+
+def _end_render(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        TEMPLATE_TIME.labels(template.name).observe(
+            perf_counter() - started.pop())
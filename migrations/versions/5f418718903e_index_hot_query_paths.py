@@ -0,0 +1,80 @@
+"""index hot query paths
+
+- follows(user_following_id): "who does X follow" (the primary key only
+  covers "who follows X").
+- likes(user_id, message_id): likes are now unique per user and message
+  rather than per message, which let only one user ever like a message.
+  The unique index also answers "what has X liked".
+- likes(message_id): kept for cascading message deletes, which used to
+  go through the old unique index.
+
+On PostgreSQL the indexes are built CONCURRENTLY, outside the migration's
+transaction, so the tables stay writable. If the build is interrupted,
+drop the INVALID index it leaves behind and run the upgrade again.
+
+Revision ID: 5f418718903e
+Revises: 8b1f3c2d9e47
+Create Date: 2026-10-18 04:18:29.516121
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f418718903e'
+down_revision = '8b1f3c2d9e47'
+branch_labels = None
+depends_on = None
+
+# Names SQLite's unnamed constraints so batch mode can drop them.
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_follows_user_following_id', 'follows',
+                            ['user_following_id', 'user_being_followed_id'],
+                            postgresql_concurrently=True)
+            op.create_index('ix_likes_message_id', 'likes', ['message_id'],
+                            postgresql_concurrently=True)
+            op.create_index('uq_likes_user_id_message_id', 'likes',
+                            ['user_id', 'message_id'], unique=True,
+                            postgresql_concurrently=True)
+
+        op.execute('ALTER TABLE likes ADD CONSTRAINT '
+                   'uq_likes_user_id_message_id UNIQUE USING INDEX '
+                   'uq_likes_user_id_message_id')
+        op.drop_constraint('likes_message_id_key', 'likes', type_='unique')
+
+    else:
+        op.create_index('ix_follows_user_following_id', 'follows',
+                        ['user_following_id', 'user_being_followed_id'])
+
+        with op.batch_alter_table(
+                'likes', naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint('uq_likes_message_id', type_='unique')
+            batch_op.create_unique_constraint('uq_likes_user_id_message_id',
+                                              ['user_id', 'message_id'])
+            batch_op.create_index('ix_likes_message_id', ['message_id'])
+
+
+def downgrade():
+    # Fails if some message has been liked by more than one user.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_unique_constraint('likes_message_id_key', 'likes',
+                                    ['message_id'])
+        op.drop_constraint('uq_likes_user_id_message_id', 'likes',
+                           type_='unique')
+        op.drop_index('ix_likes_message_id', table_name='likes')
+
+    else:
+        with op.batch_alter_table('likes') as batch_op:
+            batch_op.drop_index('ix_likes_message_id')
+            batch_op.drop_constraint('uq_likes_user_id_message_id',
+                                     type_='unique')
+            batch_op.create_unique_constraint('uq_likes_message_id',
+                                              ['message_id'])
+
+    op.drop_index('ix_follows_user_following_id', table_name='follows')
@@ -0,0 +1,32 @@
+"""add user deleted_at
+
+users.deleted_at marks accounts that have been deleted but whose rows
+are still being purged in the background; they are hidden meanwhile.
+
+Revision ID: 7c2b9e41d3a5
+Revises: dd6e1ac18816
+Create Date: 2026-10-18 09:12:47.204516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2b9e41d3a5'
+down_revision = 'dd6e1ac18816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(),
+                                     nullable=True))
+    op.create_index('ix_users_deleted_at', 'users', ['deleted_at'],
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_users_deleted_at', table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('deleted_at')
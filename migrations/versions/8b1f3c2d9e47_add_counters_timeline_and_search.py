@@ -0,0 +1,98 @@
+"""add counters, timeline and search schema
+
+- users.messages_count/following_count/followers_count/likes_count,
+  filled in from the existing rows.
+- timeline_entries, the materialized home timelines.
+- messages(user_id, timestamp, id) for profile pages and timelines.
+- On PostgreSQL, the pg_trgm index on users.username and the full-text
+  index on messages.text (elsewhere a plain username index stands in for
+  the former).
+
+On PostgreSQL the indexes on existing tables are built CONCURRENTLY,
+outside the migration's transaction, so the tables stay writable. If the
+build is interrupted, drop the INVALID index it leaves behind and run the
+upgrade again.
+
+Revision ID: 8b1f3c2d9e47
+Revises: 539da405546a
+Create Date: 2026-10-18 16:52:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f3c2d9e47'
+down_revision = '539da405546a'
+branch_labels = None
+depends_on = None
+
+# counter column -> (table, column) whose rows it counts
+COUNTERS = {
+    'messages_count': ('messages', 'user_id'),
+    'following_count': ('follows', 'user_following_id'),
+    'followers_count': ('follows', 'user_being_followed_id'),
+    'likes_count': ('likes', 'user_id'),
+}
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    for name in COUNTERS:
+        op.add_column('users', sa.Column(name, sa.Integer(),
+                                         server_default='0', nullable=False))
+    for name, (table, column) in COUNTERS.items():
+        op.execute(f"UPDATE users SET {name} = "
+                   f"(SELECT count(*) FROM {table} "
+                   f"WHERE {table}.{column} = users.id)")
+
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('user_id', 'message_id')
+    )
+    op.create_index('ix_timeline_entries_user_id_author_id', 'timeline_entries', ['user_id', 'author_id'], unique=False)
+    op.create_index('ix_timeline_entries_user_id_timestamp', 'timeline_entries', ['user_id', sa.text('timestamp DESC'), sa.text('message_id DESC')], unique=False)
+
+    if postgresql:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+        with op.get_context().autocommit_block():
+            op.create_index('ix_messages_user_id_timestamp', 'messages',
+                            ['user_id', sa.text('timestamp DESC'),
+                             sa.text('id DESC')],
+                            postgresql_concurrently=True)
+            op.create_index('ix_users_username_trgm', 'users', ['username'],
+                            postgresql_using='gin',
+                            postgresql_ops={'username': 'gin_trgm_ops'},
+                            postgresql_concurrently=True)
+            op.execute("CREATE INDEX CONCURRENTLY ix_messages_text_fts "
+                       "ON messages USING gin (to_tsvector('english', text))")
+
+    else:
+        op.create_index('ix_messages_user_id_timestamp', 'messages',
+                        ['user_id', sa.text('timestamp DESC'),
+                         sa.text('id DESC')])
+        op.create_index('ix_users_username_trgm', 'users', ['username'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_messages_text_fts', table_name='messages')
+    op.drop_index('ix_users_username_trgm', table_name='users')
+    op.drop_index('ix_messages_user_id_timestamp', table_name='messages')
+
+    op.drop_index('ix_timeline_entries_user_id_timestamp', table_name='timeline_entries')
+    op.drop_index('ix_timeline_entries_user_id_author_id', table_name='timeline_entries')
+    op.drop_table('timeline_entries')
+
+    with op.batch_alter_table('users') as batch_op:
+        for name in reversed(list(COUNTERS)):
+            batch_op.drop_column(name)
@@ -0,0 +1,29 @@
+"""add user profile_version
+
+users.profile_version changes only when a user edits their profile;
+cached message cards are keyed on it.
+
+Revision ID: a41d6c0e8b27
+Revises: 3e8f5a7c1b92
+Create Date: 2026-10-18 13:02:11.480263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d6c0e8b27'
+down_revision = '3e8f5a7c1b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('profile_version', sa.Integer(),
+                                     server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('profile_version')
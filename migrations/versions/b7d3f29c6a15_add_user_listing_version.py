@@ -0,0 +1,30 @@
+"""add user listing_version
+
+users.listing_version changes when a user's follower or following list
+does; the pages' conditional GETs read it instead of summing the listed
+users' versions.
+
+Revision ID: b7d3f29c6a15
+Revises: a41d6c0e8b27
+Create Date: 2026-10-18 15:40:27.913052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3f29c6a15'
+down_revision = 'a41d6c0e8b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('listing_version', sa.Integer(),
+                                     server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('listing_version')
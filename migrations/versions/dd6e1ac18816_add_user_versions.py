@@ -0,0 +1,40 @@
+"""add user versions
+
+users.version and users.updated_at change whenever anything on a user's
+pages does; conditional GETs of those pages compare against them.
+Existing users start at version 0, updated now.
+
+Revision ID: dd6e1ac18816
+Revises: 5f418718903e
+Create Date: 2026-10-18 04:25:31.633787
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd6e1ac18816'
+down_revision = '5f418718903e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't ADD COLUMN with a non-constant default to a table with
+    # rows, so the table is rebuilt there; PostgreSQL adds both columns in
+    # place.
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    recreate = 'auto' if postgresql else 'always'
+    with op.batch_alter_table('users', recreate=recreate) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(),
+                                      server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(),
+                                      server_default=sa.func.now(),
+                                      nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
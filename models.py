@@ -3,11 +3,10 @@
 from datetime import datetime
 from tkinter import CASCADE
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from passwords import hasher
+from replicas import RoutingSQLAlchemy
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 
 class Follows(db.Model):
@@ -27,6 +26,22 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        # The primary key covers "who follows X"; this covers "who does X
+        # follow".
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
+    @classmethod
+    def exists(cls, follower_id, followed_id):
+        """Does `follower_id` follow `followed_id`? (primary key lookup)"""
+
+        query = cls.query.filter_by(user_being_followed_id=followed_id,
+                                    user_following_id=follower_id)
+
+        return db.session.query(query.exists()).scalar()
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -46,7 +61,15 @@ class Likes(db.Model):
     message_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
+    )
+
+    __table_args__ = (
+        # One like per user per message; also serves "what has this
+        # user liked" lookups.
+        db.UniqueConstraint('user_id', 'message_id',
+                            name='uq_likes_user_id_message_id'),
+        # Cascading deletes of messages.
+        db.Index('ix_likes_message_id', 'message_id'),
     )
 
 
@@ -95,41 +118,189 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message',cascade="all, delete-orphan", single_parent=True)
+    # Denormalized counts, kept in step by counters.adjust() and rebuilt
+    # by counters.repair().
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Bumped by touch() whenever anything shown on the user's pages
+    # changes; the ETag and Last-Modified of those pages derive from them
+    # (see conditional.py).
+
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=db.func.now(),
+    )
+
+    # Bumped only by profile edits, for what shows the user's name and
+    # avatar on other pages (see fragments.py).
+
+    profile_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Bumped whenever the user's follower or following list changes, by
+    # follows and unfollows either way (counters.adjust). Profile edits by
+    # the users listed show through their profile_version instead (see
+    # conditional.listing_version).
+
+    listing_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Set when the user deletes their account; it is hidden from then on
+    # and its rows are purged in the background (see purge.py).
+
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
+    # Deleting a user leaves the rows that refer to it to the database's
+    # ON DELETE CASCADE instead of loading them to delete one by one.
+
+    messages = db.relationship('Message',cascade="all, delete-orphan", single_parent=True,
+                               passive_deletes=True)
 
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        passive_deletes=True,
     )
 
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        passive_deletes=True,
     )
 
     likes = db.relationship(
         'Message',
-        secondary="likes"
+        secondary="likes",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        # Trigram index for infix username search (see search.py).
+        db.Index('ix_users_username_trgm', username,
+                 postgresql_using='gin',
+                 postgresql_ops={'username': 'gin_trgm_ops'}),
+        # Deleted accounts waiting to be purged (see purge.py).
+        db.Index('ix_users_deleted_at', deleted_at,
+                 postgresql_where=deleted_at.isnot(None)),
     )
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    @classmethod
+    def visible(cls):
+        """Query of the users whose accounts haven't been deleted."""
+
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    def touch(self):
+        """Mark this user's pages and profile as changed; the caller
+        commits."""
+
+        self.version = User.version + 1
+        self.profile_version = User.profile_version + 1
+        self.updated_at = datetime.utcnow()
+
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.exists(follower_id=other_user.id, followed_id=self.id)
 
     def is_following(self, other_user):
         """Is this user following `other_use`?"""
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.exists(follower_id=self.id, followed_id=other_user.id)
+
+    def followed_ids(self, user_ids):
+        """Which of `user_ids` does this user follow?
+
+        Returns a set, answered with one query however many IDs are
+        passed, so a grid of user cards can check follow state per card
+        with a set lookup.
+        """
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        rows = (db.session
+                .query(Follows.user_being_followed_id)
+                .join(User, User.id == Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.id,
+                        Follows.user_being_followed_id.in_(user_ids),
+                        User.deleted_at.is_(None))
+                .all())
+
+        return {user_id for (user_id,) in rows}
+
+    def liked_message_ids(self, message_ids):
+        """Which of `message_ids` has this user liked?
+
+        Returns a set, answered with one `IN (...)` query, so the cost of
+        rendering a page doesn't depend on how many likes the user has.
+        """
+
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+
+        rows = (db.session
+                .query(Likes.message_id)
+                .filter(Likes.user_id == self.id,
+                        Likes.message_id.in_(message_ids))
+                .all())
+
+        return {message_id for (message_id,) in rows}
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -138,7 +309,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hasher.hash(password)
 
         user = User(
             username=username,
@@ -159,13 +330,18 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        A hash made with an outdated cost factor is replaced with one at
+        the configured cost; the caller commits it.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.visible().filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = hasher.check(user.password, password)
             if is_auth:
+                if hasher.needs_rehash(user.password):
+                    user.password = hasher.hash(password)
                 return user
 
         return False
@@ -191,7 +367,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -202,6 +378,136 @@ class Message(db.Model):
 
     user = db.relationship('User')
 
+    __table_args__ = (
+        db.Index('ix_messages_user_id_timestamp',
+                 user_id, timestamp.desc(), id.desc()),
+    )
+
+
+class TimelineEntry(db.Model):
+    """A message materialized into one user's home timeline."""
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp',
+                 user_id, timestamp.desc(), message_id.desc()),
+        db.Index('ix_timeline_entries_user_id_author_id', user_id, author_id),
+    )
+
+
+class Job(db.Model):
+    """A unit of deferred work, queued in the database (see jobs.py)."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    kind = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # The handler's keyword arguments, as JSON.
+    payload = db.Column(
+        db.Text,
+        nullable=False,
+        default='{}',
+    )
+
+    # Jobs with the same key aren't queued twice.
+    key = db.Column(
+        db.Text,
+    )
+
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='queued',
+        server_default='queued',
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    locked_at = db.Column(
+        db.DateTime,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    __table_args__ = (
+        # Workers take the queued job that is due soonest.
+        db.Index('ix_jobs_status_run_at', status, run_at),
+        db.Index('uq_jobs_key_queued', key, unique=True,
+                 postgresql_where=(status == 'queued'),
+                 sqlite_where=(status == 'queued')),
+    )
+
+    def __repr__(self):
+        return f"<Job #{self.id}: {self.kind} {self.status}>"
+
+
+db.event.listen(
+    User.__table__,
+    'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'),
+)
+
+
+db.event.listen(
+    Message.__table__,
+    'after_create',
+    db.DDL("CREATE INDEX ix_messages_text_fts ON messages "
+           "USING gin (to_tsvector('english', text))").execute_if(
+        dialect='postgresql'),
+)
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
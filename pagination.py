@@ -0,0 +1,113 @@
+"""Keyset (cursor) pagination for Warbler's message lists.
+
+Pages are ordered newest first by `(timestamp, id)`. A cursor names the
+last row of a page as "<ISO timestamp>,<id>"; the next page is everything
+strictly before it. Each page is an index seek from the cursor, so deep
+pages cost the same as the first one, unlike OFFSET.
+
+Lists of users have no timestamp to order by; they come in ID order and
+page the same way with an `after` cursor holding the last ID.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, request
+from sqlalchemy import tuple_
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def make_cursor(timestamp, id):
+    """Cursor pointing just after the row `(timestamp, id)`."""
+
+    return f"{timestamp.isoformat()},{id}"
+
+
+def parse_cursor(value):
+    """Turn a cursor string into `(timestamp, id)`; None if empty.
+
+    Aborts with 400 on a malformed cursor.
+    """
+
+    if not value:
+        return None
+
+    try:
+        timestamp, id = value.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(id)
+    except ValueError:
+        abort(400)
+
+
+def cursor_from_request():
+    """The `before` cursor of the current request, if any."""
+
+    return parse_cursor(request.args.get('before'))
+
+
+def before(timestamp_col, id_col, cursor):
+    """Filter for rows strictly older than `cursor`."""
+
+    return tuple_(timestamp_col, id_col) < tuple_(*cursor)
+
+
+def page_query(query, timestamp_col, id_col, cursor, per_page):
+    """`query` narrowed to one newest-first page starting at `cursor`."""
+
+    if cursor:
+        query = query.filter(before(timestamp_col, id_col, cursor))
+
+    return (query
+            .order_by(timestamp_col.desc(), id_col.desc())
+            .limit(per_page))
+
+
+def paginate(query, timestamp_col, id_col, cursor, per_page):
+    """Fetch one newest-first page of `query` starting at `cursor`."""
+
+    items = page_query(query, timestamp_col, id_col, cursor, per_page).all()
+
+    return page_of(items, per_page)
+
+
+def after_from_request():
+    """The `after` ID cursor of the current request, if any.
+
+    Aborts with 400 if it isn't an integer.
+    """
+
+    value = request.args.get('after')
+    if not value:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+
+def paginate_by_id(query, id_col, after, per_page):
+    """Fetch one page of `query` in `id_col` order, after the ID `after`."""
+
+    if after is not None:
+        query = query.filter(id_col > after)
+
+    items = query.order_by(id_col).limit(per_page).all()
+
+    next_cursor = None
+    if items and len(items) == per_page:
+        next_cursor = str(items[-1].id)
+
+    return Page(items, next_cursor)
+
+
+def page_of(messages, per_page):
+    """Wrap a list of messages, adding a next cursor if the page is full."""
+
+    next_cursor = None
+    if messages and len(messages) == per_page:
+        last = messages[-1]
+        next_cursor = make_cursor(last.timestamp, last.id)
+
+    return Page(messages, next_cursor)
@@ -0,0 +1,128 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow, and a burst of logins (say, after a deploy
+logs everyone out) used to pin every request thread at 100% CPU. Hashing
+now runs on a small thread pool; bcrypt releases the GIL while it works,
+so at most `PASSWORD_HASH_WORKERS` cores are ever busy hashing and other
+requests keep being served. When more than `PASSWORD_HASH_MAX_QUEUE`
+hashes are waiting, new ones fail fast with `HasherBusy` instead of
+piling up.
+
+The cost factor is `BCRYPT_LOG_ROUNDS`. Hashes made with a different cost
+are re-hashed the next time their owner logs in.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+DEFAULT_MAX_QUEUE = 64
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+
+class PasswordHasher:
+    """bcrypt hashing and checking on a bounded thread pool."""
+
+    def __init__(self, app=None):
+        self.rounds = DEFAULT_ROUNDS
+        self.workers = os.cpu_count() or 1
+        self.max_queue = DEFAULT_MAX_QUEUE
+        self._pool = None
+        self._slots = None
+        self._lock = Lock()
+
+        self.hashes = 0
+        self.seconds = 0.0
+        self.rejected = 0
+        # Called with the seconds each hash or check took, e.g. by metrics.
+        self.observers = []
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the pool size and cost factor from `app.config`."""
+
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_queue = app.config.get('PASSWORD_HASH_MAX_QUEUE',
+                                        DEFAULT_MAX_QUEUE)
+        self._pool = None
+
+    def hash(self, password):
+        """Hash `password` at the configured cost; returns a str."""
+
+        salt = bcrypt.gensalt(self.rounds)
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), salt)
+        return hashed.decode('utf-8')
+
+    def check(self, hashed, password):
+        """Does `password` match the stored `hashed` value?"""
+
+        return self._run(bcrypt.checkpw, password.encode('utf-8'),
+                         hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made with a cost other than the configured one?"""
+
+        return cost_of(hashed) != self.rounds
+
+    def stats(self):
+        """Counters for monitoring."""
+
+        return dict(hashes=self.hashes,
+                    seconds=self.seconds,
+                    rejected=self.rejected)
+
+    def _run(self, func, *args):
+        """Run `func` on the pool and wait for its result."""
+
+        pool, slots = self._get_pool()
+
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+
+        try:
+            return pool.submit(self._timed, func, *args).result()
+        finally:
+            slots.release()
+
+    def _timed(self, func, *args):
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = perf_counter() - start
+            with self._lock:
+                self.hashes += 1
+                self.seconds += elapsed
+            for observer in self.observers:
+                observer(elapsed)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='password-hasher')
+                # Running plus waiting hashes.
+                self._slots = BoundedSemaphore(self.workers + self.max_queue)
+
+            return self._pool, self._slots
+
+
+def cost_of(hashed):
+    """The cost factor of a "$2b$12$..." bcrypt hash."""
+
+    return int(hashed.split('$')[2])
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,48 @@
+"""Posting and deleting messages.
+
+Shared by the HTML views and the JSON API so both keep counters,
+timelines and search indexes in step the same way. Callers check
+permissions first and note the change to the logged-in user afterwards.
+"""
+
+import counters
+import fragments
+import search
+import timeline
+from models import db, Likes, Message
+
+
+def post_message(user_id, text):
+    """Post `text` as `user_id` and commit; returns the new message."""
+
+    msg = Message(text=text, user_id=user_id)
+    db.session.add(msg)
+    counters.adjust(user_id, messages_count=1)
+    db.session.flush()
+    timeline.queue_fan_out(msg)
+    db.session.commit()
+    timeline.cache_push(msg.id, timeline.cached_audience(user_id))
+    search.message_added(msg)
+
+    return msg
+
+
+def delete_message(msg):
+    """Delete `msg` and commit.
+
+    Its likes go by cascade, so its likers' counters are adjusted first.
+    """
+
+    message_id, user_id = msg.id, msg.user_id
+
+    likers = (db.session
+              .query(Likes.user_id)
+              .filter(Likes.message_id == message_id))
+    counters.adjust(likers, likes_count=-1)
+
+    db.session.delete(msg)
+    counters.adjust(user_id, messages_count=-1)
+    db.session.commit()
+    timeline.cache_evict(timeline.cached_audience(user_id))
+    search.message_removed(message_id)
+    fragments.forget([message_id])
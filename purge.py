@@ -0,0 +1,236 @@
+"""Deleting accounts.
+
+Deleting a user used to be a single `db.session.delete(user)`, which
+loaded every one of their messages, likes and follows to cascade to them
+and deleted the lot in one transaction, holding a worker for as long as
+that took. It is now done in two halves:
+
+- `hide(user)` runs in the request. It marks the account deleted, and
+  from the next query on it can't log in and its profile, messages and
+  search results are gone (reads filter on `users.deleted_at`).
+
+- `purge(user_id)` runs as a background job. It deletes the user's rows
+  `PURGE_BATCH_SIZE` at a time, one short transaction per batch, keeping
+  other users' counters in step, and finally the user itself. Follows
+  go first, so the account drops out of follower lists soonest.
+
+The purge job renews its lock with each batch, so a long purge isn't
+taken over by a second worker, which would decrement the same counters
+again. A purge job that fails part way is retried, carrying on where it
+left off; `flask purge-users` purges every hidden account there and
+then, reporting progress, and `progress(user_id)` counts the rows still
+to go.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+import counters
+import fragments
+import jobs
+import search
+import timeline
+from models import db, Follows, Likes, Message, TimelineEntry, User
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def batch_size():
+    return current_app.config.get('PURGE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def hide(user):
+    """Mark `user`'s account deleted, queue its purge and commit."""
+
+    user_id = user.id
+    audience = timeline.cached_audience(user_id)
+    user.deleted_at = datetime.utcnow()
+    user.touch()
+    db.session.flush()
+    jobs.enqueue('purge_user', key=f"purge_user:{user_id}", user_id=user_id)
+    db.session.commit()
+    timeline.cache_evict(audience)
+    search.user_removed(user_id)
+
+
+def hidden_ids():
+    """IDs of the accounts waiting to be purged, oldest first."""
+
+    return [user_id for (user_id,) in (db.session
+                                       .query(User.id)
+                                       .filter(User.deleted_at.isnot(None))
+                                       .order_by(User.deleted_at))]
+
+
+##############################################################################
+# Purge steps: each deletes up to `limit` rows and returns how many.
+
+
+def ids(query, limit):
+    return [value for (value,) in query.limit(limit)]
+
+
+def purge_followers(user_id, limit):
+    """Unfollow `user_id` on behalf of their followers."""
+
+    follower_ids = ids(db.session
+                       .query(Follows.user_following_id)
+                       .filter(Follows.user_being_followed_id == user_id),
+                       limit)
+    if follower_ids:
+        counters.adjust(follower_ids, following_count=-1)
+        (Follows
+         .query
+         .filter(Follows.user_being_followed_id == user_id,
+                 Follows.user_following_id.in_(follower_ids))
+         .delete(synchronize_session=False))
+
+    return len(follower_ids)
+
+
+def purge_following(user_id, limit):
+    """Unfollow everyone `user_id` follows."""
+
+    followed_ids = ids(db.session
+                       .query(Follows.user_being_followed_id)
+                       .filter(Follows.user_following_id == user_id),
+                       limit)
+    if followed_ids:
+        counters.adjust(followed_ids, followers_count=-1)
+        (Follows
+         .query
+         .filter(Follows.user_following_id == user_id,
+                 Follows.user_being_followed_id.in_(followed_ids))
+         .delete(synchronize_session=False))
+        timeline.queue_refill(followed_ids)
+
+    return len(followed_ids)
+
+
+def purge_likes(user_id, limit):
+    """Delete the likes `user_id` gave."""
+
+    like_ids = ids(db.session.query(Likes.id).filter(Likes.user_id == user_id),
+                   limit)
+    if like_ids:
+        (Likes
+         .query
+         .filter(Likes.id.in_(like_ids))
+         .delete(synchronize_session=False))
+
+    return len(like_ids)
+
+
+def purge_timeline(user_id, limit):
+    """Delete `user_id`'s own materialized timeline."""
+
+    message_ids = ids(db.session
+                      .query(TimelineEntry.message_id)
+                      .filter(TimelineEntry.user_id == user_id),
+                      limit)
+    if message_ids:
+        (TimelineEntry
+         .query
+         .filter(TimelineEntry.user_id == user_id,
+                 TimelineEntry.message_id.in_(message_ids))
+         .delete(synchronize_session=False))
+
+    return len(message_ids)
+
+
+def purge_messages(user_id, limit):
+    """Delete `user_id`'s messages, with their likes and timeline entries."""
+
+    message_ids = ids(db.session
+                      .query(Message.id)
+                      .filter(Message.user_id == user_id),
+                      limit)
+    if not message_ids:
+        return 0
+
+    likers = Counter(liker_id for (liker_id,) in (
+        db.session
+        .query(Likes.user_id)
+        .filter(Likes.message_id.in_(message_ids))))
+    by_count = {}
+    for liker_id, n in likers.items():
+        by_count.setdefault(n, []).append(liker_id)
+    for n, liker_ids in by_count.items():
+        counters.adjust(liker_ids, likes_count=-n)
+
+    for model, column in ((Likes, Likes.message_id),
+                          (TimelineEntry, TimelineEntry.message_id),
+                          (Message, Message.id)):
+        (model
+         .query
+         .filter(column.in_(message_ids))
+         .delete(synchronize_session=False))
+    fragments.forget(message_ids)
+
+    return len(message_ids)
+
+
+STEPS = (
+    ('followers', purge_followers,
+     lambda user_id: Follows.user_being_followed_id == user_id),
+    ('following', purge_following,
+     lambda user_id: Follows.user_following_id == user_id),
+    ('likes', purge_likes, lambda user_id: Likes.user_id == user_id),
+    ('timeline', purge_timeline,
+     lambda user_id: TimelineEntry.user_id == user_id),
+    ('messages', purge_messages, lambda user_id: Message.user_id == user_id),
+)
+
+
+def progress(user_id):
+    """Rows of `user_id`'s still to be purged, by kind."""
+
+    return {name: (db.session
+                   .query(func.count())
+                   .filter(rows_of(user_id))
+                   .scalar())
+            for name, _, rows_of in STEPS}
+
+
+@jobs.handler('purge_user')
+def purge(user_id, report=None):
+    """Delete the hidden account `user_id`, a batch at a time.
+
+    Each batch is committed on its own; `report(user_id, step, n)` is
+    called after each one. Safe to re-run on a purge that was cut off.
+    """
+
+    hidden = (User
+              .query
+              .filter(User.id == user_id, User.deleted_at.isnot(None))
+              .exists())
+    if not db.session.query(hidden).scalar():
+        return
+
+    limit = batch_size()
+
+    for name, step, _ in STEPS:
+        while True:
+            n = step(user_id, limit)
+            jobs.heartbeat()
+            db.session.commit()
+            if not n:
+                break
+
+            current_app.logger.info("purge of user %s: deleted %s %s",
+                                    user_id, n, name)
+            if report is not None:
+                report(user_id, name, n)
+
+    # Anything left refers to the user by a cascading foreign key.
+    (User
+     .query
+     .filter(User.id == user_id, User.deleted_at.isnot(None))
+     .delete(synchronize_session=False))
+    db.session.commit()
+
+    if report is not None:
+        report(user_id, 'user', 1)
@@ -0,0 +1,173 @@
+"""Per-request SQL statement counting, timing and N+1 detection.
+
+Engine events time every statement. During a request the totals collect
+on `g.query_stats`; when the response goes out they are logged as one
+JSON line (at WARNING if some statement shape repeated at least
+`QUERY_REPEAT_THRESHOLD` times, the usual sign of a lazy load in a loop)
+and, with `QUERY_STATS_HEADERS` on, sent back as headers:
+
+    X-Query-Count: 3
+    X-Query-Repeated: 0
+    Server-Timing: db;dur=4.2;desc="3 queries"
+
+Tests can put a ceiling on a block of code:
+
+    with querystats.assert_max_queries(3):
+        client.get("/")
+"""
+
+import json
+import re
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+# Collectors opened by `count_queries`, in addition to the request's own.
+_collectors = []
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def shape(statement):
+    """`statement` with literals and whitespace normalized, so that the
+    same query with different values (or a different number of IN-list
+    parameters) has the same shape."""
+
+    statement = _LITERALS.sub('?', ' '.join(statement.split()))
+    # Numbered bind parameters, e.g. %(id_1)s, %(id_2)s.
+    return re.sub(r"_\d+\b", '', statement)
+
+
+class QueryStats:
+    """Statements run, time spent and how often each shape ran."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape(statement)] += 1
+
+    def repeated(self, threshold=DEFAULT_REPEAT_THRESHOLD):
+        """`(shape, count)` for shapes that ran at least `threshold` times."""
+
+        return [(statement, count)
+                for statement, count in self.shapes.most_common()
+                if count >= threshold]
+
+
+def _before_execute(conn, cursor, statement, parameters, context,
+                    executemany):
+    # Kept on the statement's execution context, which goes away with the
+    # statement whether or not it succeeds.
+    context._query_started = perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context,
+                   executemany):
+    elapsed = perf_counter() - context._query_started
+
+    if has_app_context() and 'query_stats' in g:
+        g.query_stats.record(statement, elapsed)
+    for stats in _collectors:
+        stats.record(statement, elapsed)
+
+
+def init_app(app):
+    """Time statements on every engine and report on each request."""
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+
+    @app.before_request
+    def start_query_stats():
+        if app.config.get('QUERY_STATS', True):
+            g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        threshold = app.config.get('QUERY_REPEAT_THRESHOLD',
+                                   DEFAULT_REPEAT_THRESHOLD)
+
+        # A streamed body runs more statements after the headers are
+        # sent; log once it's done, and send no (partial) headers.
+        if response.is_streamed:
+            endpoint, status = request.endpoint, response.status_code
+            response.call_on_close(
+                lambda: log_query_stats(app, stats, threshold, endpoint,
+                                        status))
+            return response
+
+        repeated = log_query_stats(app, stats, threshold, request.endpoint,
+                                   response.status_code)
+
+        if app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Repeated'] = str(len(repeated))
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats.seconds * 1000:.1f};'
+                f'desc="{stats.count} queries"')
+
+        return response
+
+
+def log_query_stats(app, stats, threshold, endpoint, status):
+    """Log a request's statements as one JSON line; returns the repeats."""
+
+    repeated = stats.repeated(threshold)
+    line = json.dumps(dict(
+        event='sql',
+        endpoint=endpoint,
+        status=status,
+        queries=stats.count,
+        db_ms=round(stats.seconds * 1000, 2),
+        repeated=[dict(statement=statement[:200], count=count)
+                  for statement, count in repeated],
+    ))
+    if repeated:
+        app.logger.warning(line)
+    else:
+        app.logger.info(line)
+
+    return repeated
+
+
+@contextmanager
+def count_queries():
+    """Collect `QueryStats` for every statement run inside the block."""
+
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail if the block runs more than `limit` statements."""
+
+    with count_queries() as stats:
+        yield stats
+
+    if stats.count > limit:
+        listing = '\n'.join(f"  {count} x {statement}"
+                            for statement, count in stats.shapes.most_common())
+        raise AssertionError(
+            f"{stats.count} queries, expected at most {limit}:\n{listing}")
@@ -0,0 +1,171 @@
+"""Set-based writes of follows and likes.
+
+Each write is a single INSERT ... SELECT or DELETE over the IDs given,
+checking existing rows by primary/unique key, so it costs the same
+however many follows or likes the user already has (nothing loads their
+`following` or `likes` collections). The writes are idempotent: IDs
+already followed/liked, or not followed/liked, or that don't exist, are
+skipped. Counters are adjusted by what actually changed.
+
+On PostgreSQL, inserts use ON CONFLICT DO NOTHING and both inserts and
+deletes report the rows they touched with RETURNING. SQLite has neither
+in SQLAlchemy 1.3, so there the rows that will change are selected
+first and inserts use INSERT OR IGNORE; a concurrent writer can make
+the counters drift, which `counters.repair()` fixes.
+
+Functions commit, like those in `posting`; callers note the change to
+the logged-in user afterwards.
+"""
+
+from sqlalchemy import exists, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import counters
+import timeline
+from models import db, Follows, Likes, Message, User
+
+
+def postgresql():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def insert_new(table, columns, rows, key):
+    """Insert `rows` (a SELECT of `columns`), skipping any that conflict.
+
+    Returns the values of the `key` column of the rows inserted.
+    """
+
+    if postgresql():
+        insert = (pg_insert(table)
+                  .from_select(columns, rows)
+                  .on_conflict_do_nothing()
+                  .returning(table.c[key]))
+        return [value for (value,) in db.session.execute(insert)]
+
+    source = list(rows.inner_columns)[columns.index(key)]
+    new = [value for (value,) in db.session.execute(
+        rows.with_only_columns([source]))]
+    if new:
+        db.session.execute(table.insert()
+                           .from_select(columns, rows.where(source.in_(new)))
+                           .prefix_with('OR IGNORE'))
+    return new
+
+
+def delete_existing(table, where, key):
+    """Delete the rows of `table` matching `where`; returns their `key`s."""
+
+    if postgresql():
+        delete = table.delete().where(where).returning(key)
+        return [value for (value,) in db.session.execute(delete)]
+
+    gone = [value for (value,) in db.session.execute(
+        db.select([key]).where(where))]
+    if gone:
+        db.session.execute(table.delete().where(where))
+    return gone
+
+
+def follow(follower_id, user_ids):
+    """Have `follower_id` follow `user_ids`; returns the IDs newly followed.
+
+    Users can't follow themselves; their own ID is skipped.
+    """
+
+    follows = Follows.__table__
+    users = User.__table__
+    already = exists().where((follows.c.user_following_id == follower_id)
+                             & (follows.c.user_being_followed_id
+                                == users.c.id))
+
+    rows = (db.select([users.c.id, literal(follower_id)])
+            .where(users.c.id.in_(list(user_ids)))
+            .where(users.c.id != follower_id)
+            .where(users.c.deleted_at.is_(None))
+            .where(~already))
+
+    followed = insert_new(follows, ['user_being_followed_id',
+                                    'user_following_id'],
+                          rows, 'user_being_followed_id')
+
+    if followed:
+        counters.adjust(follower_id, following_count=len(followed))
+        counters.adjust(followed, followers_count=1)
+        timeline.queue_backfill(follower_id, followed)
+
+    db.session.commit()
+    if followed:
+        timeline.cache_evict([follower_id])
+
+    return followed
+
+
+def unfollow(follower_id, user_ids):
+    """Have `follower_id` stop following `user_ids`; returns the IDs
+    no longer followed."""
+
+    follows = Follows.__table__
+    unfollowed = delete_existing(
+        follows,
+        (follows.c.user_following_id == follower_id)
+        & follows.c.user_being_followed_id.in_(list(user_ids)),
+        follows.c.user_being_followed_id)
+
+    if unfollowed:
+        counters.adjust(follower_id, following_count=-len(unfollowed))
+        counters.adjust(unfollowed, followers_count=-1)
+        for user_id in unfollowed:
+            timeline.prune(follower_id, user_id)
+        # Last: with JOBS_SYNC the refill runs, and commits, right here.
+        timeline.queue_refill(unfollowed)
+
+    db.session.commit()
+    if unfollowed:
+        timeline.cache_evict([follower_id])
+
+    return unfollowed
+
+
+def like(user_id, message_ids):
+    """Have `user_id` like `message_ids`; returns the IDs newly liked.
+
+    Messages by deleted accounts are skipped.
+    """
+
+    likes = Likes.__table__
+    messages = Message.__table__
+    users = User.__table__
+    already = exists().where((likes.c.user_id == user_id)
+                             & (likes.c.message_id == messages.c.id))
+    author_visible = exists().where((users.c.id == messages.c.user_id)
+                                    & users.c.deleted_at.is_(None))
+
+    rows = (db.select([literal(user_id), messages.c.id])
+            .where(messages.c.id.in_(list(message_ids)))
+            .where(author_visible)
+            .where(~already))
+
+    liked = insert_new(likes, ['user_id', 'message_id'], rows, 'message_id')
+
+    if liked:
+        counters.adjust(user_id, likes_count=len(liked))
+    db.session.commit()
+
+    return liked
+
+
+def unlike(user_id, message_ids):
+    """Have `user_id` unlike `message_ids`; returns the IDs unliked."""
+
+    likes = Likes.__table__
+    unliked = delete_existing(
+        likes,
+        (likes.c.user_id == user_id)
+        & likes.c.message_id.in_(list(message_ids)),
+        likes.c.message_id)
+
+    if unliked:
+        counters.adjust(user_id, likes_count=-len(unliked))
+    db.session.commit()
+
+    return unliked
@@ -0,0 +1,111 @@
+"""Routing reads to read replicas.
+
+Views decorated with `@read_only` read from a replica (one of
+`SQLALCHEMY_REPLICA_URLS`, picked at random per request) when serving
+GET or HEAD requests. Everything else -- other views, flushes, Core
+INSERT/UPDATE/DELETE, raw SQL, CLI commands -- goes to the primary, as
+does the rest of a transaction that has written anything.
+
+Replicas lag a little behind, so after a request commits a write the
+user is pinned to the primary for `REPLICA_PIN_SECONDS`, by a timestamp
+in their signed session cookie. That way users always see their own
+changes (the page they are redirected to after posting, say), whichever
+worker serves them next.
+"""
+
+import random
+from functools import wraps
+from threading import Lock
+from time import time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+PIN_KEY = 'primary_until'
+DEFAULT_PIN_SECONDS = 10
+
+_engines_lock = Lock()
+
+
+def read_only(view):
+    """Mark `view` as safe to serve from a replica."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return view(*args, **kwargs)
+
+    wrapper.read_only = True
+    return wrapper
+
+
+def replica_engines(app):
+    """This app's replica engines (created on first use)."""
+
+    engines = app.extensions.get('replica_engines')
+    if engines is None:
+        with _engines_lock:
+            engines = app.extensions.get('replica_engines')
+            if engines is None:
+                options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+                engines = [create_engine(url, **options) for url in
+                           app.config.get('SQLALCHEMY_REPLICA_URLS', [])]
+                app.extensions['replica_engines'] = engines
+
+    return engines
+
+
+def reads_from_replica():
+    """May the current request read from a replica?"""
+
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'read_only', False):
+        return False
+
+    return session.get(PIN_KEY, 0) < time()
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the reads of read-only views to a replica."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, (UpdateBase, TextClause)):
+            self.info['wrote'] = True
+
+        elif not self.info.get('wrote') and reads_from_replica():
+            if 'replica' not in self.info:
+                engines = replica_engines(self.app)
+                self.info['replica'] = (random.choice(engines) if engines
+                                        else None)
+
+            if self.info['replica'] is not None:
+                return self.info['replica']
+
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def pin_to_primary(db_session):
+    """Keep a user who just wrote something on the primary for a while."""
+
+    if db_session.info.pop('wrote', False) and has_request_context():
+        seconds = current_app.config.get('REPLICA_PIN_SECONDS',
+                                         DEFAULT_PIN_SECONDS)
+        session[PIN_KEY] = int(time() + seconds) + 1
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_writes(db_session):
+    db_session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """`SQLAlchemy` whose sessions are `RoutingSession`s."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,461 @@
+"""Username and message search.
+
+On PostgreSQL both searches are answered by database indexes:
+
+- `users.username` has a pg_trgm GIN index, so an infix `ILIKE '%q%'`
+  is answered from the index instead of a sequential scan.
+
+- `messages.text` has a GIN index on `to_tsvector('english', text)` for
+  full-text search.
+
+Elsewhere (SQLite in tests and development) each worker keeps in-process
+indexes instead, built on first use and updated incrementally by the
+handlers that add, edit or remove users and messages. A background thread
+rebuilds them every `SEARCH_REBUILD_SECONDS`, to pick up changes made by
+other workers, and swaps each new index in once it is complete; requests
+never wait for a rebuild.
+
+Username results rank exact matches first, then prefix matches, then
+other infix matches; ties go to the shorter, then alphabetically first,
+name. Matching is case-insensitive. Message results contain every search
+term and come newest first, paged by cursor.
+"""
+
+import re
+
+from heapq import nlargest, nsmallest
+from threading import Event, Lock, Thread
+
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.orm import contains_eager
+
+from models import db, Message, User
+from pagination import make_cursor, paginate, Page
+
+RESULT_LIMIT = 100
+DEFAULT_REBUILD_SECONDS = 300
+
+
+def escape_like(text):
+    """Escape LIKE wildcards so `text` matches literally."""
+
+    return (text.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+
+
+def ngrams(text, n):
+    """The set of `n`-character substrings of `text`."""
+
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def grams(text):
+    """The bigrams and trigrams of `text`, as indexed."""
+
+    return ngrams(text, 2) | ngrams(text, 3)
+
+
+def rank(username, query):
+    """Sort key: exact, then prefix, then infix; shorter names first."""
+
+    name = username.lower()
+    if name == query:
+        kind = 0
+    elif name.startswith(query):
+        kind = 1
+    else:
+        kind = 2
+
+    return (kind, len(name), name)
+
+
+class UsernameIndex:
+    """In-process n-gram index over usernames.
+
+    Each bigram and trigram maps to the set of user IDs whose (lowercased)
+    username contains it. A query intersects the postings of its own
+    trigrams, starting from the rarest, then confirms candidates by
+    substring. Two-letter queries read a bigram posting directly, and
+    one-letter queries scan the names.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.postings = {}
+        # Highest user ID loaded from the database so far.
+        self.max_id = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, user_id, username):
+        """Index (or re-index) `user_id` under `username`."""
+
+        with self.lock:
+            self._discard(user_id)
+
+            name = username.lower()
+            self.names[user_id] = name
+            for gram in grams(name):
+                self.postings.setdefault(gram, set()).add(user_id)
+
+    def remove(self, user_id):
+        """Drop `user_id` from the index."""
+
+        with self.lock:
+            self._discard(user_id)
+
+    def search(self, query, limit=RESULT_LIMIT):
+        """IDs of users whose name contains `query`, best matches first."""
+
+        query = query.lower()
+
+        with self.lock:
+            if len(query) < 2:
+                candidates = self.names.keys()
+            elif len(query) == 2:
+                candidates = self.postings.get(query, ())
+            else:
+                postings = sorted((self.postings.get(gram, set())
+                                   for gram in ngrams(query, 3)), key=len)
+                candidates = set.intersection(*postings)
+
+            matches = [(rank(self.names[user_id], query), user_id)
+                       for user_id in candidates
+                       if query in self.names[user_id]]
+
+        return [user_id for _, user_id in nsmallest(limit, matches)]
+
+    def _discard(self, user_id):
+        name = self.names.pop(user_id, None)
+        if name is None:
+            return
+
+        for gram in grams(name):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(user_id)
+                if not posting:
+                    del self.postings[gram]
+
+
+def uses_sql():
+    """Should searches go to the database's indexes?"""
+
+    backend = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return db.engine.dialect.name == 'postgresql'
+
+    return backend == 'sql'
+
+
+def username_index():
+    """This app's in-process index, brought up to date.
+
+    Users who signed up in other workers since the index was built are
+    picked up by ID on each search; renames and deletions wait for the
+    next rebuild.
+    """
+
+    index = current_index('username_index')
+    add_new_users(index)
+    return index
+
+
+def add_new_users(index):
+    """Load the users with IDs above `index.max_id` into `index`."""
+
+    new_users = (db.session
+                 .query(User.id, User.username)
+                 .filter(User.id > index.max_id)
+                 .order_by(User.id)
+                 .yield_per(10000))
+
+    for user_id, username in new_users:
+        index.add(user_id, username)
+        index.max_id = user_id
+
+
+def build_username_index():
+    index = UsernameIndex()
+    add_new_users(index)
+    return index
+
+
+def search_users(query, limit=RESULT_LIMIT):
+    """Users whose username contains `query`, best matches first."""
+
+    if uses_sql():
+        lowered = query.lower()
+        name = func.lower(User.username)
+
+        return (User
+                .visible()
+                .filter(User.username.ilike(f"%{escape_like(query)}%",
+                                            escape='\\'))
+                .order_by(case([(name == lowered, 0),
+                                (name.like(f"{escape_like(lowered)}%",
+                                           escape='\\'), 1)],
+                               else_=2),
+                          func.length(User.username),
+                          name)
+                .limit(limit)
+                .all())
+
+    user_ids = username_index().search(query, limit)
+    if not user_ids:
+        return []
+
+    users = {user.id: user
+             for user in User.visible().filter(User.id.in_(user_ids))}
+
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def user_changed(user):
+    """Re-index `user` after a signup or profile edit (this worker only)."""
+
+    index = current_app.extensions.get('username_index')
+    if index is not None:
+        index.add(user.id, user.username)
+
+
+def user_removed(user_id):
+    """Drop a deleted user from this worker's index."""
+
+    index = current_app.extensions.get('username_index')
+    if index is not None:
+        index.remove(user_id)
+
+
+##############################################################################
+# Building and rebuilding the in-process indexes
+
+# app.extensions key -> function building that index from scratch; the
+# message index registers itself below.
+BUILDERS = {
+    'username_index': build_username_index,
+}
+
+_build_lock = Lock()
+
+
+def current_index(name):
+    """This worker's index `name`, built on first use."""
+
+    index = current_app.extensions.get(name)
+    if index is not None:
+        return index
+
+    app = current_app._get_current_object()
+    with _build_lock:
+        if name not in app.extensions:
+            app.extensions[name] = BUILDERS[name]()
+            start_rebuilds(app)
+
+    return app.extensions[name]
+
+
+def rebuild_indexes():
+    """Rebuild this worker's in-process indexes and swap them in.
+
+    Each new index is complete before it replaces the old one, which
+    searches keep using until then.
+    """
+
+    for name, build in BUILDERS.items():
+        if name in current_app.extensions:
+            current_app.extensions[name] = build()
+
+
+class Rebuilder(Thread):
+    """Calls `rebuild_indexes()` for `app` every `seconds` seconds."""
+
+    def __init__(self, app, seconds):
+        super().__init__(name='search-rebuild', daemon=True)
+        self.app = app
+        self.seconds = seconds
+        self.stopping = Event()
+
+    def run(self):
+        while not self.stopping.wait(self.seconds):
+            try:
+                with self.app.app_context():
+                    rebuild_indexes()
+            except Exception:
+                self.app.logger.exception("search index rebuild failed")
+
+    def stop(self):
+        self.stopping.set()
+
+
+def start_rebuilds(app):
+    """Start `app`'s rebuild thread in this worker, once.
+
+    Started on first use rather than at import, so that each forked
+    worker process gets its own.
+    """
+
+    seconds = app.config.get('SEARCH_REBUILD_SECONDS',
+                             DEFAULT_REBUILD_SECONDS)
+    if seconds and 'search_rebuilder' not in app.extensions:
+        rebuilder = Rebuilder(app, seconds)
+        app.extensions['search_rebuilder'] = rebuilder
+        rebuilder.start()
+
+
+##############################################################################
+# Message search
+
+
+def tokens(text):
+    """Lowercased words of `text`."""
+
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class MessageIndex:
+    """In-process inverted index over message text.
+
+    Each token maps to the set of `(timestamp, id)` keys of messages that
+    contain it, so matches can be ordered and paged by cursor without
+    touching the database.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.postings = {}
+        # Highest message ID loaded from the database so far.
+        self.max_id = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, message_id, timestamp, text):
+        """Index a message."""
+
+        key = (timestamp, message_id)
+
+        with self.lock:
+            self.keys[message_id] = (key, tokens(text))
+            for token in self.keys[message_id][1]:
+                self.postings.setdefault(token, set()).add(key)
+
+    def remove(self, message_id):
+        """Drop a message from the index."""
+
+        with self.lock:
+            entry = self.keys.pop(message_id, None)
+            if entry is None:
+                return
+
+            key, words = entry
+            for token in words:
+                posting = self.postings.get(token)
+                if posting is not None:
+                    posting.discard(key)
+                    if not posting:
+                        del self.postings[token]
+
+    def search(self, query, cursor=None, limit=RESULT_LIMIT):
+        """Newest-first `(timestamp, id)` keys of messages with every word."""
+
+        words = tokens(query)
+        if not words:
+            return []
+
+        with self.lock:
+            postings = sorted((self.postings.get(token, set())
+                               for token in words), key=len)
+            matches = set.intersection(*postings)
+
+        if cursor:
+            matches = (key for key in matches if key < tuple(cursor))
+
+        return nlargest(limit, matches)
+
+
+def message_index():
+    """This app's in-process message index, brought up to date."""
+
+    index = current_index('message_index')
+    add_new_messages(index)
+    return index
+
+
+def add_new_messages(index):
+    """Load the messages with IDs above `index.max_id` into `index`."""
+
+    new_messages = (db.session
+                    .query(Message.id, Message.timestamp, Message.text)
+                    .filter(Message.id > index.max_id)
+                    .order_by(Message.id)
+                    .yield_per(10000))
+
+    for message_id, timestamp, text in new_messages:
+        index.add(message_id, timestamp, text)
+        index.max_id = message_id
+
+
+def build_message_index():
+    index = MessageIndex()
+    add_new_messages(index)
+    return index
+
+
+BUILDERS['message_index'] = build_message_index
+
+
+def search_messages(query, cursor=None, limit=RESULT_LIMIT):
+    """A page of messages containing every word of `query`, newest first.
+
+    Authors are loaded in the same query as the messages, so a page costs
+    the same number of queries whatever the size of the index.
+    """
+
+    messages = (Message
+                .query
+                .join(Message.user)
+                .options(contains_eager(Message.user))
+                .filter(User.deleted_at.is_(None)))
+
+    if uses_sql():
+        matches = (func.to_tsvector('english', Message.text)
+                   .op('@@')(func.plainto_tsquery('english', query)))
+
+        return paginate(messages.filter(matches),
+                        Message.timestamp, Message.id, cursor, limit)
+
+    keys = message_index().search(query, cursor, limit)
+    if not keys:
+        return Page([], None)
+
+    found = {msg.id: msg
+             for msg in messages.filter(Message.id.in_(
+                 [message_id for _, message_id in keys]))}
+
+    # The cursor comes from the index so that messages deleted by another
+    # worker don't cut paging short.
+    next_cursor = make_cursor(*keys[-1]) if len(keys) == limit else None
+
+    return Page([found[id] for _, id in keys if id in found], next_cursor)
+
+
+def message_added(message):
+    """Index a new message (this worker only)."""
+
+    index = current_app.extensions.get('message_index')
+    if index is not None:
+        index.add(message.id, message.timestamp, message.text)
+
+
+def message_removed(message_id):
+    """Drop a deleted message from this worker's index."""
+
+    index = current_app.extensions.get('message_index')
+    if index is not None:
+        index.remove(message_id)
@@ -1,20 +1,100 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
-from models import User, Message, Follows
+With `--append`, indexes are kept, and CSVs of rows that other CSVs
+refer to (users, messages) must carry their own `id` column: otherwise
+the rows would get fresh IDs and the references would point elsewhere.
 
+Run like:
 
-db.drop_all()
-db.create_all()
+    python seed.py                  # drop everything and reload
+    python seed.py --append --dir more/  # add rows to existing data
+    python seed.py --dir big/ --chunk-size 100000
+"""
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+import argparse
+import csv
+import os
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+from flask_migrate import stamp
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+from app import app, db
+from models import User, Message, Follows, Likes
+import counters
+import loader
 
-db.session.commit()
+# Load order respects foreign keys when they aren't deferred.
+CSV_FILES = [
+    ('users.csv', User),
+    ('messages.csv', Message),
+    ('follows.csv', Follows),
+    ('likes.csv', Likes),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load Warbler CSV data.")
+    parser.add_argument('--dir', default='generator',
+                        help="directory holding the CSV files")
+    parser.add_argument('--append', action='store_true',
+                        help="keep existing tables and rows")
+    parser.add_argument('--chunk-size', type=int,
+                        default=loader.DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help="don't drop and rebuild indexes around the load"
+                             " (implied by --append)")
+    args = parser.parse_args()
+
+    files = [(os.path.join(args.dir, name), model)
+             for name, model in CSV_FILES
+             if os.path.exists(os.path.join(args.dir, name))]
+    tables = [model.__table__ for _, model in files]
+
+    if args.append:
+        for path in without_ids(files):
+            parser.error(f"{path} has no id column, so other CSVs' "
+                         f"references to it can't be kept with --append")
+        # Rebuilding indexes over the existing rows costs more than
+        # maintaining them for the new ones.
+        args.keep_indexes = True
+        db.create_all()
+    else:
+        db.drop_all()
+        db.create_all()
+        # The tables match the newest migration; record that so later
+        # `flask db upgrade`s start from here.
+        with app.app_context():
+            stamp()
+
+    if args.keep_indexes:
+        load(files, args.chunk_size)
+    else:
+        with loader.deferred_indexes(db.engine, tables):
+            load(files, args.chunk_size)
+
+    loader.reset_sequences(db.engine, tables)
+
+    counters.repair()
+    db.session.commit()
+
+
+def without_ids(files):
+    """Paths among `files` that other CSVs refer to but that have no IDs."""
+
+    referenced = {fk.column.table
+                  for _, model in files
+                  for fk in model.__table__.foreign_keys}
+
+    for path, model in files:
+        if model.__table__ in referenced:
+            with open(path, newline='') as f:
+                if 'id' not in next(csv.reader(f)):
+                    yield path
+
+
+def load(files, chunk_size):
+    for path, model in files:
+        loader.load_csv(db.engine, model.__table__, path, chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Streamed rendering of long pages.
+
+With `STREAM_PAGES` on, the home page, likes and follower pages are sent
+while they render instead of after. Their templates mark the end of the
+page shell with `{{ stream_flush }}`: everything before it (head, nav
+bar, profile header) goes out before the page's rows are even queried.
+The rows then come from a `Rows`, which fetches them through a
+server-side cursor `STREAM_CHUNK_ROWS` at a time, and the rendered
+markup is sent in chunks of about `STREAM_CHUNK_BYTES`. Only one chunk
+of rows is held at once, so a page's memory use doesn't grow with the
+number of rows it shows.
+
+Headers, including the session cookie, are sent before the body, so
+streamed views must not change the session.
+"""
+
+from itertools import islice
+
+from flask import (
+    Response, before_render_template, current_app, stream_with_context,
+    template_rendered)
+from markupsafe import Markup
+
+from pagination import make_cursor
+
+FLUSH = Markup('<!-- flush -->')
+DEFAULT_CHUNK_ROWS = 100
+DEFAULT_CHUNK_BYTES = 16 * 1024
+
+
+def init_app(app):
+    """Render `{{ stream_flush }}` as nothing on unstreamed pages."""
+
+    app.context_processor(lambda: dict(stream_flush=''))
+
+
+def enabled():
+    """Are pages streamed in this app?"""
+
+    return current_app.config.get('STREAM_PAGES', False)
+
+
+def chunk_rows():
+    return current_app.config.get('STREAM_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+
+
+def stream_template(template_name, **context):
+    """Response that renders `template_name` as it is sent."""
+
+    app = current_app._get_current_object()
+    context['stream_flush'] = FLUSH
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    chunk_bytes = app.config.get('STREAM_CHUNK_BYTES', DEFAULT_CHUNK_BYTES)
+
+    def generate():
+        before_render_template.send(app, template=template, context=context)
+
+        buffer = []
+        size = 0
+        for piece in template.generate(context):
+            if piece == FLUSH or size >= chunk_bytes:
+                if buffer:
+                    yield ''.join(buffer)
+                buffer = []
+                size = 0
+                if piece == FLUSH:
+                    continue
+
+            buffer.append(piece)
+            size += len(piece)
+
+        if buffer:
+            yield ''.join(buffer)
+
+        template_rendered.send(app, template=template, context=context)
+
+    return Response(stream_with_context(generate()))
+
+
+class Cursor:
+    """A `before` cursor that is only known once a page's rows are out."""
+
+    def __init__(self):
+        self.value = None
+
+    def __bool__(self):
+        return self.value is not None
+
+    def __str__(self):
+        return self.value or ''
+
+
+def streamed(query):
+    """`query`'s results, read from a server-side cursor in chunks."""
+
+    return query.yield_per(chunk_rows())
+
+
+class Rows:
+    """A page's rows, fetched only as the template reaches them.
+
+    `fetch()` is called when the template starts looping over the rows
+    and returns them, usually as `streamed(query)`. They are rendered
+    `STREAM_CHUNK_ROWS` at a time; `on_chunk(rows)` runs before each
+    chunk, to load whatever the template needs to know about those rows
+    (which of them the viewer likes, say). Given `per_page`,
+    `next_cursor` is set after the last row of a full page, as
+    `pagination.page_of` would.
+    """
+
+    def __init__(self, fetch, on_chunk=None, per_page=None):
+        self.fetch = fetch
+        self.on_chunk = on_chunk
+        self.per_page = per_page
+        self.next_cursor = Cursor()
+
+    def __iter__(self):
+        size = chunk_rows()
+        rows = iter(self.fetch())
+        count = 0
+
+        while True:
+            chunk = list(islice(rows, size))
+            if not chunk:
+                break
+
+            if self.on_chunk is not None:
+                self.on_chunk(chunk)
+            yield from chunk
+
+            count += len(chunk)
+            last = chunk[-1]
+
+        if self.per_page and count == self.per_page:
+            self.next_cursor.value = make_cursor(last.timestamp, last.id)
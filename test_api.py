@@ -0,0 +1,208 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import api
+import querystats
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class ApiTestCase(TestCase):
+    """Reads, batches and writes through /api/v1."""
+
+    def setUp(self):
+        """A viewer following three authors with two messages each."""
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        viewer = User(email="viewer@test.com", username="viewer",
+                      password="HASHED_PASSWORD")
+        db.session.add(viewer)
+        db.session.commit()
+        self.viewer_id = viewer.id
+
+        self.author_ids = []
+        self.msg_ids = []
+        for i in range(3):
+            author = User(email=f"author{i}@test.com", username=f"author{i}",
+                          password="HASHED_PASSWORD")
+            db.session.add(author)
+            db.session.commit()
+            self.author_ids.append(author.id)
+
+            db.session.add(Follows(user_being_followed_id=author.id,
+                                   user_following_id=viewer.id))
+            for j in range(2):
+                msg = Message(text=f"warble {i}.{j}", user_id=author.id)
+                db.session.add(msg)
+                db.session.commit()
+                self.msg_ids.append(msg.id)
+
+        db.session.add(Likes(user_id=viewer.id, message_id=self.msg_ids[0]))
+        db.session.commit()
+
+        app.extensions.pop('current_user_cache', None)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def test_user(self):
+        resp = self.client.get(f"/api/v1/users/{self.author_ids[0]}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['username'], "author0")
+        self.assertNotIn('password', resp.json)
+        self.assertNotIn('email', resp.json)
+
+    def test_missing_user(self):
+        resp = self.client.get("/api/v1/users/0")
+
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn('error', resp.json)
+
+    def test_users_batch(self):
+        ids = [self.author_ids[2], 0, self.author_ids[0]]
+
+        with querystats.assert_max_queries(1):
+            resp = self.client.get(
+                f"/api/v1/users?ids={','.join(map(str, ids))}")
+
+        self.assertEqual([user['id'] for user in resp.json['users']],
+                         [self.author_ids[2], self.author_ids[0]])
+        self.assertEqual(resp.json['missing'], [0])
+
+    def test_messages_batch(self):
+        ids = self.msg_ids[:4]
+
+        with querystats.assert_max_queries(1):
+            resp = self.client.get(
+                f"/api/v1/messages?ids={','.join(map(str, ids))}")
+
+        messages = resp.json['messages']
+        self.assertEqual([msg['id'] for msg in messages], ids)
+        self.assertEqual(messages[0]['user']['username'], "author0")
+
+    def test_bad_batch(self):
+        self.assertEqual(self.client.get("/api/v1/users?ids=1,x").status_code,
+                         400)
+        self.assertEqual(self.client.get("/api/v1/users").status_code, 400)
+        ids = ','.join(str(id) for id in range(1, 102))
+        self.assertEqual(self.client.get(f"/api/v1/users?ids={ids}")
+                         .status_code, 400)
+
+    def test_timeline(self):
+        self.assertEqual(self.client.get("/api/v1/timeline").status_code, 401)
+
+        self.login()
+        resp = self.client.get("/api/v1/timeline")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([msg['id'] for msg in resp.json['messages']],
+                         self.msg_ids[::-1])
+        self.assertIsNone(resp.json['next_cursor'])
+
+    def test_profile_messages(self):
+        resp = self.client.get(f"/api/v1/users/{self.author_ids[1]}/messages")
+
+        self.assertEqual([msg['text'] for msg in resp.json['messages']],
+                         ["warble 1.1", "warble 1.0"])
+
+    def test_follows(self):
+        following = self.client.get(f"/api/v1/users/{self.viewer_id}/following")
+        followers = self.client.get(
+            f"/api/v1/users/{self.author_ids[0]}/followers")
+
+        self.assertEqual([user['id'] for user in following.json['users']],
+                         self.author_ids)
+        self.assertEqual([user['id'] for user in followers.json['users']],
+                         [self.viewer_id])
+
+    @patch.object(api, 'PER_PAGE', 2)
+    def test_follows_pages(self):
+        url = f"/api/v1/users/{self.viewer_id}/following"
+
+        first = self.client.get(url).json
+        rest = self.client.get(url, query_string={
+            'after': first['next_cursor']}).json
+
+        self.assertEqual([user['id'] for user in first['users']],
+                         self.author_ids[:2])
+        self.assertEqual([user['id'] for user in rest['users']],
+                         self.author_ids[2:])
+        self.assertIsNone(rest['next_cursor'])
+        self.assertEqual(
+            self.client.get(url, query_string={'after': 'x'}).status_code,
+            400)
+
+    def test_likes(self):
+        self.login()
+        resp = self.client.get("/api/v1/likes")
+
+        self.assertEqual([msg['id'] for msg in resp.json['messages']],
+                         [self.msg_ids[0]])
+
+    def test_create_and_delete(self):
+        self.login()
+
+        resp = self.client.post("/api/v1/messages", json={"text": "via api"})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json['user']['id'], self.viewer_id)
+        msg_id = resp.json['id']
+        self.assertEqual(User.query.get(self.viewer_id).messages_count, 1)
+
+        resp = self.client.delete(f"/api/v1/messages/{msg_id}")
+        self.assertEqual(resp.status_code, 204)
+        self.assertIsNone(Message.query.get(msg_id))
+
+    def test_create_validation(self):
+        self.login()
+
+        self.assertEqual(self.client.post("/api/v1/messages", json={})
+                         .status_code, 400)
+        self.assertEqual(self.client.post("/api/v1/messages",
+                                          json={"text": "x" * 141})
+                         .status_code, 400)
+        self.assertEqual(self.client.post("/api/v1/messages",
+                                          data={"text": "form post"})
+                         .status_code, 400)
+
+    def test_delete_others_message(self):
+        self.login()
+
+        resp = self.client.delete(f"/api/v1/messages/{self.msg_ids[0]}")
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertIsNotNone(Message.query.get(self.msg_ids[0]))
@@ -0,0 +1,71 @@
+"""In-process cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_cache.py
+
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+    """Tests for the byte-bounded LRU cache."""
+
+    def setUp(self):
+        self.cache = LRUCache(max_bytes=30, ttl=10, sizeof=len)
+
+    def test_hit_and_miss(self):
+        """Hits and misses are counted."""
+
+        self.cache.set(1, "abc")
+
+        self.assertEqual(self.cache.get(1), "abc")
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        """Going over the byte budget evicts the oldest entry first."""
+
+        self.cache.set(1, "a" * 10)
+        self.cache.set(2, "b" * 10)
+        self.cache.get(1)
+        self.cache.set(3, "c" * 15)
+
+        self.assertIn(1, self.cache)
+        self.assertNotIn(2, self.cache)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertLessEqual(self.cache.bytes, 30)
+
+    def test_oversized_values_are_not_cached(self):
+        """A value bigger than the whole budget is skipped."""
+
+        self.cache.set(1, "x" * 31)
+
+        self.assertNotIn(1, self.cache)
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_update_patches_in_place(self):
+        """update() rewrites cached values and their size."""
+
+        self.cache.set(1, "abc")
+        self.cache.update(1, lambda value: "z" + value)
+        self.cache.update(2, lambda value: "never called")
+
+        self.assertEqual(self.cache.get(1), "zabc")
+        self.assertEqual(self.cache.bytes, 4)
+        self.assertNotIn(2, self.cache)
+
+    def test_expired_entries_miss(self):
+        """Entries older than the TTL are dropped on read."""
+
+        with patch("cache.monotonic", return_value=100):
+            self.cache.set(1, "abc")
+
+        with patch("cache.monotonic", return_value=111):
+            self.assertIsNone(self.cache.get(1))
+
+        self.assertEqual(len(self.cache), 0)
@@ -0,0 +1,209 @@
+"""Conditional GET tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_conditional.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import querystats
+import relations
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class ConditionalGetTestCase(TestCase):
+    """ETags and Last-Modified on profile, follower and message pages."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.viewer = User(email="viewer@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        db.session.add_all([self.viewer, self.author])
+        db.session.commit()
+        self.viewer_id = self.viewer.id
+        self.author_id = self.author.id
+
+        msg = Message(text="cache me", user_id=self.author_id)
+        db.session.add(msg)
+        db.session.commit()
+        self.msg_id = msg.id
+
+        app.extensions.pop('current_user_cache', None)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def revalidate(self, url, resp):
+        return self.client.get(url, headers={
+            'If-None-Match': resp.headers['ETag']})
+
+    def test_validators(self):
+        resp = self.client.get(f"/users/{self.author_id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', resp.headers)
+        self.assertEqual(resp.headers['Cache-Control'], 'private, no-cache')
+
+    def test_not_modified(self):
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        with querystats.assert_max_queries(1):
+            resp = self.revalidate(url, first)
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.get_data(), b"")
+        self.assertEqual(resp.headers['ETag'], first.headers['ETag'])
+
+    def test_if_modified_since(self):
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        resp = self.client.get(url, headers={
+            'If-Modified-Since': first.headers['Last-Modified']})
+
+        self.assertEqual(resp.status_code, 304)
+
+    def test_new_message_changes_profile(self):
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.author_id
+        self.client.post("/messages/new", data={"text": "fresh"})
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+
+        resp = self.revalidate(url, first)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("fresh", resp.get_data(as_text=True))
+
+    def test_depends_on_viewer(self):
+        url = f"/users/{self.author_id}"
+        self.login()
+        first = self.client.get(url)
+
+        self.client.post(f"/users/follow/{self.author_id}")
+        resp = self.revalidate(url, first)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Unfollow", resp.get_data(as_text=True))
+
+    def test_followers_page_follows_follower_edits(self):
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.viewer_id))
+        db.session.commit()
+
+        self.login()
+        url = f"/users/{self.author_id}/followers"
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        follower = User.query.get(self.viewer_id)
+        follower.bio = "new bio"
+        follower.touch()
+        db.session.commit()
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_own_followers_page_follows_follower_edits(self):
+        db.session.add(Follows(user_being_followed_id=self.author_id,
+                               user_following_id=self.viewer_id))
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.author_id
+        url = f"/users/{self.author_id}/followers"
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        # The edit writes only the follower's row.
+        follower = User.query.get(self.viewer_id)
+        follower.bio = "new bio"
+        with querystats.count_queries() as stats:
+            follower.touch()
+            db.session.commit()
+        self.assertEqual(stats.count, 1)
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_followers_page_ignores_follower_activity(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        relations.follow(self.viewer_id, [self.author_id])
+        db.session.commit()
+
+        self.login()
+        url = f"/users/{self.author_id}/followers"
+        first = self.client.get(url)
+
+        # The viewer's counts change, but not what the page lists.
+        db.session.add(Message(text="not listed", user_id=self.viewer_id))
+        relations.like(self.viewer_id, [self.msg_id])
+        db.session.commit()
+
+        with querystats.count_queries() as stats:
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+        self.assertNotIn("GROUP BY", "".join(stats.shapes))
+
+        relations.unfollow(self.viewer_id, [self.author_id])
+        db.session.commit()
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_message(self):
+        url = f"/messages/{self.msg_id}"
+        first = self.client.get(url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+    def test_missing(self):
+        self.assertEqual(self.client.get("/messages/0").status_code, 404)
+        self.assertEqual(self.client.get("/users/0").status_code, 404)
+
+    def test_pending_flash(self):
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [("success", "Hello!")]
+        resp = self.revalidate(url, first)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Hello!", resp.get_data(as_text=True))
@@ -0,0 +1,131 @@
+"""Denormalized counter tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import querystats
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class CountersTestCase(TestCase):
+    """Counters stay in step with the rows they count."""
+
+    def setUp(self):
+        """Create two users; u1 is logged in."""
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.u1 = User.signup(username="counter1", email="c1@test.com",
+                              password="123456", image_url=None)
+        self.u2 = User.signup(username="counter2", email="c2@test.com",
+                              password="123456", image_url=None)
+        db.session.commit()
+        self.u1_id, self.u2_id = self.u1.id, self.u2.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def counts(self, user_id):
+        db.session.expire_all()
+        user = User.query.get(user_id)
+        return (user.messages_count, user.following_count,
+                user.followers_count, user.likes_count)
+
+    def test_handlers_keep_counts(self):
+        """Posting, following and liking update both sides' counters."""
+
+        msg = Message(text="like me", user_id=self.u2_id)
+        db.session.add(msg)
+        db.session.commit()
+        msg_id = msg.id
+
+        self.client.post("/messages/new", data={"text": "hello"})
+        self.client.post(f"/users/follow/{self.u2_id}")
+        self.client.post(f"/users/add_like/{msg_id}")
+
+        self.assertEqual(self.counts(self.u1_id), (1, 1, 0, 1))
+        self.assertEqual(self.counts(self.u2_id)[2], 1)
+
+        self.client.post(f"/users/stop-following/{self.u2_id}")
+        self.client.post(f"/users/remove_like/{msg_id}")
+
+        self.assertEqual(self.counts(self.u1_id), (1, 0, 0, 0))
+        self.assertEqual(self.counts(self.u2_id)[2], 0)
+
+    def test_delete_liked_message(self):
+        """Deleting a liked message updates its author's and likers' counts."""
+
+        self.client.post("/messages/new", data={"text": "like me"})
+        msg_id = Message.query.filter_by(user_id=self.u1_id).one().id
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u2_id
+        self.client.post(f"/users/add_like/{msg_id}")
+        self.assertEqual(self.counts(self.u2_id)[3], 1)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        self.assertEqual(self.counts(self.u1_id)[0], 0)
+        self.assertEqual(self.counts(self.u2_id)[3], 0)
+
+    def test_repair(self):
+        """repair() rebuilds counters from rows inserted behind its back."""
+
+        db.session.add(Message(text="one", user_id=self.u1_id))
+        db.session.add(Message(text="two", user_id=self.u1_id))
+        db.session.add(Follows(user_being_followed_id=self.u2_id,
+                               user_following_id=self.u1_id))
+        db.session.commit()
+
+        counters.repair()
+        db.session.commit()
+
+        self.assertEqual(self.counts(self.u1_id), (2, 1, 0, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 0, 1, 0))
+
+    def test_repair_is_set_based(self):
+        """repair() runs the same statements however many users there are."""
+
+        for i in range(3):
+            db.session.add(Message(text=f"warble {i}", user_id=self.u1_id))
+        db.session.commit()
+
+        with querystats.count_queries() as stats:
+            counters.repair()
+        db.session.commit()
+
+        self.assertEqual(stats.count, 1 + len(counters.SOURCES))
+        self.assertEqual(self.counts(self.u1_id), (3, 0, 0, 0))
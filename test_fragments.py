@@ -0,0 +1,144 @@
+"""Message card fragment cache tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import fragments
+import posting
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class FragmentCacheTestCase(TestCase):
+    """Cards are rendered once per message and author profile version."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        viewer = User(email="viewer@test.com", username="viewer",
+                      password="HASHED_PASSWORD")
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([viewer, author])
+        db.session.commit()
+        self.viewer_id = viewer.id
+        self.author_id = author.id
+
+        db.session.add(Follows(user_being_followed_id=author.id,
+                               user_following_id=viewer.id))
+        msg = Message(text="render me once", user_id=author.id)
+        db.session.add(msg)
+        db.session.commit()
+        self.msg_id = msg.id
+
+        self.max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES')
+        app.config['FRAGMENT_CACHE_MAX_BYTES'] = 1024 * 1024
+        app.extensions.pop('fragment_cache', None)
+        app.extensions.pop('current_user_cache', None)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['FRAGMENT_CACHE_MAX_BYTES'] = self.max_bytes
+        app.extensions.pop('fragment_cache', None)
+
+    def test_cards_are_cached(self):
+        first = self.client.get("/").get_data(as_text=True)
+        second = self.client.get("/").get_data(as_text=True)
+
+        cache = app.extensions['fragment_cache']
+        self.assertEqual(first, second)
+        self.assertIn("render me once", second)
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+    def test_like_button_is_not_cached(self):
+        self.client.get("/")
+        self.client.post(f"/users/add_like/{self.msg_id}")
+
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertIn(f"/users/remove_like/{self.msg_id}", html)
+        self.assertEqual(app.extensions['fragment_cache'].misses, 1)
+
+    def test_profile_edit_rerenders(self):
+        self.client.get("/")
+
+        author = User.query.get(self.author_id)
+        author.username = "renamed"
+        author.touch()
+        db.session.commit()
+
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertIn("@renamed", html)
+
+    def test_counter_changes_keep_cards(self):
+        self.client.get("/")
+
+        with app.app_context():
+            counters.adjust(self.author_id, followers_count=1)
+            db.session.commit()
+
+        self.client.get("/")
+
+        self.assertEqual(app.extensions['fragment_cache'].misses, 1)
+
+    def test_deleted_cards_are_dropped(self):
+        self.client.get("/")
+
+        with app.app_context():
+            posting.delete_message(Message.query.get(self.msg_id))
+
+        self.assertEqual(app.extensions['fragment_cache'].keys(), [])
+
+    def test_cards_are_per_author(self):
+        with app.app_context():
+            msg = Message.query.get(self.msg_id)
+            fragments.message_card(msg)
+
+            # The same ID, reused by another author after a reseed.
+            msg.user_id = self.viewer_id
+            msg.text = "reused by viewer"
+            db.session.flush()
+            db.session.expire(msg, ['user'])
+
+            self.assertIn("reused by viewer", fragments.message_card(msg))
+
+    def test_disabled(self):
+        app.config['FRAGMENT_CACHE_MAX_BYTES'] = 0
+
+        html = self.client.get("/").get_data(as_text=True)
+
+        self.assertIn("render me once", html)
+        self.assertNotIn('fragment_cache', app.extensions)
+        with app.app_context():
+            self.assertIsNone(fragments.fragment_cache())
@@ -0,0 +1,213 @@
+"""Background job queue tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_jobs.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry, Job
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app
+import jobs
+import posting
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+calls = []
+
+
+@jobs.handler('test_record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.handler('test_heartbeat')
+def beat():
+    jobs.heartbeat()
+    calls.append(db.session.query(Job.locked_at).scalar())
+
+
+@jobs.handler('test_fail')
+def fail():
+    raise RuntimeError("no luck")
+
+
+class JobsTestCase(TestCase):
+    """Queued jobs are run once, retried with backoff and deduplicated."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.session.rollback()
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+        del calls[:]
+        app.config['JOBS_SYNC'] = False
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['TIMELINE_FANOUT'] = False
+        app.config['JOB_MAX_ATTEMPTS'] = jobs.DEFAULT_MAX_ATTEMPTS
+        self.ctx.pop()
+
+    def test_enqueue_and_run(self):
+        jobs.enqueue('test_record', value=1)
+        jobs.enqueue('test_record', value=2)
+        db.session.commit()
+
+        self.assertEqual(calls, [])
+        self.assertEqual(jobs.counts(), {('test_record', 'queued'): 2})
+
+        self.assertTrue(jobs.work_one())
+        self.assertTrue(jobs.work_one())
+        self.assertFalse(jobs.work_one())
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_rolled_back_jobs_are_not_queued(self):
+        jobs.enqueue('test_record', value=1)
+        db.session.rollback()
+
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_dedupe(self):
+        for value in range(3):
+            jobs.enqueue('test_record', key='once', value=value)
+        db.session.commit()
+
+        self.assertEqual(Job.query.count(), 1)
+
+        jobs.work_one()
+        jobs.enqueue('test_record', key='once', value=3)
+        db.session.commit()
+
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_delay(self):
+        jobs.enqueue('test_record', delay=60, value=1)
+        db.session.commit()
+
+        self.assertFalse(jobs.work_one())
+
+    def test_retry_with_backoff(self):
+        app.config['JOB_MAX_ATTEMPTS'] = 3
+        jobs.enqueue('test_fail')
+        db.session.commit()
+
+        for attempt in (1, 2):
+            before = datetime.utcnow()
+            self.assertTrue(jobs.work_one())
+
+            job = Job.query.one()
+            self.assertEqual((job.status, job.attempts), ('queued', attempt))
+            self.assertIn("no luck", job.last_error)
+            self.assertGreaterEqual(
+                job.run_at,
+                before + timedelta(seconds=10 * 2 ** (attempt - 1)))
+
+            # Not due yet.
+            self.assertFalse(jobs.work_one())
+            job.run_at = datetime.utcnow()
+            db.session.commit()
+
+        self.assertTrue(jobs.work_one())
+        self.assertEqual(jobs.counts(), {('test_fail', 'failed'): 1})
+        self.assertFalse(jobs.work_one())
+
+    def test_stale_jobs_are_taken_over(self):
+        jobs.enqueue('test_record', value=1)
+        db.session.commit()
+
+        job = jobs.claim()
+        self.assertFalse(jobs.work_one())
+
+        job.locked_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        self.assertTrue(jobs.work_one())
+        self.assertEqual(calls, [1])
+
+    def test_heartbeat(self):
+        jobs.enqueue('test_heartbeat')
+        db.session.commit()
+
+        job = jobs.claim()
+        job.locked_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        before = datetime.utcnow()
+
+        self.assertTrue(jobs.run(job))
+        self.assertGreaterEqual(calls[0], before)
+
+    def test_unknown_kind(self):
+        jobs.enqueue('test_missing')
+        db.session.commit()
+
+        jobs.work_one()
+
+        self.assertIn("no handler", Job.query.one().last_error)
+
+    def test_sync(self):
+        app.config['JOBS_SYNC'] = True
+
+        jobs.enqueue('test_record', value=1)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_fan_out_job(self):
+        app.config['TIMELINE_FANOUT'] = True
+        author = User(email="author@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        fan = User(email="fan@test.com", username="fan",
+                   password="HASHED_PASSWORD")
+        db.session.add_all([author, fan])
+        db.session.commit()
+        ids = {author.id, fan.id}
+        db.session.add(Follows(user_being_followed_id=author.id,
+                               user_following_id=fan.id))
+        db.session.commit()
+
+        msg_id = posting.post_message(author.id, "fanned out later").id
+
+        # Only the author's own entry is written before the job runs.
+        self.assertEqual({e.user_id for e in TimelineEntry.query}, {author.id})
+
+        result = app.test_cli_runner().invoke(
+            args=['run-jobs', '--burst', '--threads', '1'])
+        self.assertEqual(result.exit_code, 0)
+
+        self.assertEqual({e.user_id for e in TimelineEntry.query.filter_by(
+            message_id=msg_id)}, ids)
+
+    def test_cli_status(self):
+        runner = app.test_cli_runner()
+        runner.invoke(args=['repair-counters', '--queue'])
+        runner.invoke(args=['repair-counters', '--queue'])
+
+        self.assertEqual(runner.invoke(args=['job-status']).output,
+                         "repair_counters: 1 queued\n")
@@ -171,3 +171,27 @@ class MessageModelTestCase(TestCase):
         
         self.assertEqual(len(u1.likes), 2)
         self.assertEqual(len(u2.likes), 0)
+
+    def test_liked_message_ids(self):
+        """liked_message_ids returns only the liked IDs among those asked"""
+
+        u = User(
+            email="test31@test.com",
+            username="testuser31",
+            password="HASHED_PASSWORD"
+        )
+
+        db.session.add(u)
+        db.session.commit()
+
+        m1 = Message(text="liked", user_id=u.id)
+        m2 = Message(text="not liked", user_id=u.id)
+
+        db.session.add_all([m1, m2])
+        db.session.commit()
+
+        u.likes.append(m1)
+        db.session.commit()
+
+        self.assertEqual(u.liked_message_ids([m1.id, m2.id]), {m1.id})
+        self.assertEqual(u.liked_message_ids([]), set())
@@ -0,0 +1,82 @@
+"""Metrics endpoint tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_metrics.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class MetricsTestCase(TestCase):
+    """Requests show up in /metrics."""
+
+    def setUp(self):
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        user = User(email="metrics@test.com", username="metrics",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_metrics(self):
+        self.client.get("/")
+        self.client.get(f"/users/{self.user_id}")
+
+        resp = self.client.get("/metrics")
+        text = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        self.assertIn('warbler_request_duration_seconds_count'
+                      '{endpoint="homepage",method="GET"}', text)
+        self.assertIn('warbler_requests_total'
+                      '{endpoint="users_show",method="GET",status="200"}',
+                      text)
+        self.assertIn('warbler_template_render_seconds_count'
+                      '{template="users/show.html"}', text)
+        self.assertIn('warbler_request_db_queries_count'
+                      '{endpoint="homepage"}', text)
+        self.assertIn('warbler_db_pool_checkouts_total', text)
+        self.assertIn('warbler_cache{cache="current_user_cache",stat="hits"}',
+                      text)
+
+    def test_in_flight_returns_to_zero(self):
+        self.client.get("/")
+
+        text = self.client.get("/metrics").get_data(as_text=True)
+
+        # Only the /metrics request itself is in flight.
+        self.assertIn('warbler_requests_in_flight 1.0', text)
@@ -0,0 +1,98 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_passwords.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app
+from passwords import PasswordHasher, HasherBusy, cost_of, hasher
+
+db.create_all()
+
+
+class PasswordHasherTestCase(TestCase):
+    """Tests for the pooled bcrypt hasher."""
+
+    def setUp(self):
+        self.hasher = PasswordHasher()
+        self.hasher.rounds = 4
+
+    def test_hash_and_check(self):
+        """A hash checks against its password and nothing else."""
+
+        hashed = self.hasher.hash("123456")
+
+        self.assertTrue(self.hasher.check(hashed, "123456"))
+        self.assertFalse(self.hasher.check(hashed, "654321"))
+        self.assertEqual(cost_of(hashed), 4)
+
+    def test_needs_rehash(self):
+        """Hashes at another cost need re-hashing."""
+
+        hashed = self.hasher.hash("123456")
+        self.hasher.rounds = 5
+
+        self.assertTrue(self.hasher.needs_rehash(hashed))
+
+    def test_full_queue_is_rejected(self):
+        """Hashing fails fast once the queue is full."""
+
+        self.hasher.workers = 1
+        self.hasher.max_queue = 0
+
+        # Take the only slot, as an in-flight hash would.
+        pool, slots = self.hasher._get_pool()
+        slots.acquire()
+
+        try:
+            with self.assertRaises(HasherBusy):
+                self.hasher.hash("123456")
+        finally:
+            slots.release()
+
+        self.assertEqual(self.hasher.rejected, 1)
+
+
+class RehashOnLoginTestCase(TestCase):
+    """Logging in upgrades hashes made at an old cost factor."""
+
+    def setUp(self):
+        db.session.rollback()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        self.rounds = hasher.rounds
+
+    def tearDown(self):
+        hasher.rounds = self.rounds
+        db.session.rollback()
+
+    def test_authenticate_rehashes(self):
+        """authenticate() stores a hash at the configured cost"""
+
+        hasher.rounds = 4
+        User.signup("rehash", "rehash@test.com", "123456", None)
+        db.session.commit()
+
+        hasher.rounds = 5
+        user = User.authenticate("rehash", "123456")
+        db.session.commit()
+
+        self.assertEqual(cost_of(user.password), 5)
+        self.assertTrue(hasher.check(user.password, "123456"))
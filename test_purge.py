@@ -0,0 +1,201 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_purge.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes, TimelineEntry, Job
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import jobs
+import purge
+import relations
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class PurgeTestCase(TestCase):
+    """Deleted accounts are hidden at once and purged in batches."""
+
+    def setUp(self):
+        """A doomed user with messages, followed by and liked by three fans."""
+
+        db.session.rollback()
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+        doomed = User.signup("doomed", "doomed@test.com", "password", None)
+        db.session.commit()
+        self.doomed_id = doomed.id
+
+        self.msg_ids = []
+        for i in range(5):
+            msg = Message(text=f"doomed warble {i}", user_id=doomed.id)
+            db.session.add(msg)
+            db.session.commit()
+            self.msg_ids.append(msg.id)
+
+        self.fan_ids = []
+        for i in range(3):
+            fan = User(email=f"fan{i}@test.com", username=f"fan{i}",
+                       password="HASHED_PASSWORD")
+            db.session.add(fan)
+            db.session.commit()
+            self.fan_ids.append(fan.id)
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        for fan_id in self.fan_ids:
+            relations.follow(fan_id, [self.doomed_id])
+            relations.follow(self.doomed_id, [fan_id])
+            relations.like(fan_id, self.msg_ids[:2])
+        counters.repair()
+        db.session.commit()
+
+        # Purges are queued, so tests see the account hidden but intact.
+        self.batch_size = app.config['PURGE_BATCH_SIZE']
+        app.config['PURGE_BATCH_SIZE'] = 2
+        app.config['JOBS_SYNC'] = False
+        app.extensions.pop('current_user_cache', None)
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['JOBS_SYNC'] = False
+        app.config['PURGE_BATCH_SIZE'] = self.batch_size
+        self.ctx.pop()
+
+    def hide(self):
+        purge.hide(User.query.get(self.doomed_id))
+
+    def log_in(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def counts(self):
+        db.session.expire_all()
+        return [(u.following_count, u.followers_count, u.likes_count)
+                for u in User.query.filter(User.id.in_(self.fan_ids))
+                                   .order_by(User.id)]
+
+    def test_hidden_at_once(self):
+        self.hide()
+
+        self.assertEqual(
+            self.client.get(f"/users/{self.doomed_id}").status_code, 404)
+        self.assertEqual(
+            self.client.get(f"/messages/{self.msg_ids[0]}").status_code, 404)
+        self.assertEqual(
+            self.client.get(f"/api/v1/users/{self.doomed_id}").status_code,
+            404)
+        self.assertNotIn("doomed", self.client.get("/users").get_data(
+            as_text=True))
+
+        self.log_in(self.fan_ids[0])
+        self.assertNotIn("doomed warble",
+                         self.client.get("/").get_data(as_text=True))
+        self.assertNotIn("doomed warble",
+                         self.client.get("/users/likes").get_data(as_text=True))
+
+        self.assertFalse(User.authenticate("doomed", "password"))
+
+        # Nothing is purged yet.
+        self.assertEqual(purge.progress(self.doomed_id),
+                         dict(followers=3, following=3, likes=0, timeline=0,
+                              messages=5))
+
+    def test_logged_out_elsewhere(self):
+        self.log_in(self.doomed_id)
+        self.assertEqual(self.client.get("/users/likes").status_code, 200)
+
+        self.hide()
+        app.extensions.pop('current_user_cache', None)
+
+        self.assertEqual(self.client.get("/users/likes").status_code, 302)
+
+    def test_purge_in_batches(self):
+        self.hide()
+        reports = []
+
+        purge.purge(self.doomed_id,
+                    lambda user_id, step, n: reports.append((step, n)))
+
+        self.assertEqual(reports, [('followers', 2), ('followers', 1),
+                                   ('following', 2), ('following', 1),
+                                   ('messages', 2), ('messages', 2),
+                                   ('messages', 1), ('user', 1)])
+        self.assertIsNone(User.query.get(self.doomed_id))
+        self.assertEqual(Message.query.count(), 0)
+        self.assertEqual(Likes.query.count(), 0)
+        self.assertEqual(Follows.query.count(), 0)
+
+        self.assertEqual(self.counts(), [(0, 0, 0)] * 3)
+        counters.repair()
+        self.assertEqual(self.counts(), [(0, 0, 0)] * 3)
+
+    def test_only_hidden_users_are_purged(self):
+        purge.purge(self.doomed_id)
+
+        self.assertIsNotNone(User.query.get(self.doomed_id))
+        self.assertEqual(Message.query.count(), 5)
+
+    def test_delete_route(self):
+        app.config['JOBS_SYNC'] = True
+        self.log_in(self.doomed_id)
+
+        resp = self.client.post("/users/delete")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertIsNone(User.query.get(self.doomed_id))
+        self.assertEqual(self.counts(), [(0, 0, 0)] * 3)
+
+    def test_purge_job(self):
+        self.hide()
+        self.hide()
+
+        self.assertEqual(jobs.counts(), {('purge_user', 'queued'): 1})
+
+        jobs.Worker(app).run(burst=True)
+
+        db.session.expire_all()
+        self.assertIsNone(User.query.get(self.doomed_id))
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_cli(self):
+        self.hide()
+        runner = app.test_cli_runner()
+
+        status = runner.invoke(args=['purge-status']).output
+        self.assertIn(f"user {self.doomed_id}: 3 followers", status)
+        self.assertIn("5 messages left", status)
+
+        output = runner.invoke(args=['purge-users']).output
+        self.assertIn(f"user {self.doomed_id}: deleted 2 followers", output)
+        self.assertIn(f"user {self.doomed_id}: deleted 1 user", output)
+
+        self.assertEqual(runner.invoke(args=['purge-status']).output, "")
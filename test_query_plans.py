@@ -0,0 +1,183 @@
+"""Query plan tests for hot query paths.
+
+Each test EXPLAINs a query the app runs on every page view and fails if
+the plan scans a whole table instead of using an index. On PostgreSQL
+sequential scans are switched off for the EXPLAIN, so any "Seq Scan"
+left in the plan means no usable index exists (rather than the planner
+preferring a scan of a tiny test table).
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_query_plans.py
+
+
+import os
+import re
+from datetime import datetime
+from unittest import TestCase, skipUnless
+
+from sqlalchemy import or_
+
+from models import db, User, Message, Follows, Likes, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app
+from pagination import before
+from search import escape_like
+from timeline import followed_ids_query
+
+db.create_all()
+
+POSTGRESQL = db.engine.dialect.name == 'postgresql'
+
+
+def explain(query):
+    """The plan for `query`, one line per step."""
+
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    with db.engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if POSTGRESQL:
+                conn.execute("SET LOCAL enable_seqscan = off")
+                rows = conn.execute(f"EXPLAIN {compiled}", params)
+                return [line for (line,) in rows]
+            else:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {compiled}", params)
+                return [row[-1] for row in rows]
+        finally:
+            trans.rollback()
+
+
+def full_scans(plan):
+    """Tables read in full by `plan`."""
+
+    pattern = (r"Seq Scan on (\w+)" if POSTGRESQL
+               else r"^SCAN (?:TABLE )?(\w+)(?! USING)")
+
+    return [match.group(1) for line in plan
+            for match in [re.search(pattern, line.strip())] if match]
+
+
+def newest_first(query, timestamp_col, id_col, limit=100):
+    return query.order_by(timestamp_col.desc(), id_col.desc()).limit(limit)
+
+
+class QueryPlanTestCase(TestCase):
+    """Hot queries must be answered from indexes."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        users = [User(email=f"plan{i}@test.com", username=f"plan{i}",
+                      password="HASHED_PASSWORD") for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_id = users[0].id
+
+        db.session.add(Follows(user_being_followed_id=users[1].id,
+                               user_following_id=users[0].id))
+        msg = Message(text="a plan", user_id=users[1].id)
+        db.session.add(msg)
+        db.session.commit()
+        db.session.add(Likes(user_id=users[0].id, message_id=msg.id))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def assertIndexed(self, query):
+        plan = explain(query)
+        self.assertEqual(full_scans(plan), [], "\n".join(plan))
+
+    def test_profile_messages(self):
+        messages = Message.query.filter(Message.user_id == self.user_id)
+
+        self.assertIndexed(newest_first(messages, Message.timestamp,
+                                        Message.id))
+        self.assertIndexed(newest_first(
+            messages.filter(before(Message.timestamp, Message.id,
+                                   (datetime(2020, 1, 1), 1000))),
+            Message.timestamp, Message.id))
+
+    def test_home_timeline(self):
+        messages = Message.query.filter(or_(
+            Message.user_id == self.user_id,
+            Message.user_id.in_(followed_ids_query(self.user_id))))
+
+        self.assertIndexed(newest_first(messages, Message.timestamp,
+                                        Message.id))
+
+    def test_materialized_timeline(self):
+        entries = TimelineEntry.query.filter(
+            TimelineEntry.user_id == self.user_id)
+
+        self.assertIndexed(newest_first(entries, TimelineEntry.timestamp,
+                                        TimelineEntry.message_id))
+
+    def test_following(self):
+        self.assertIndexed(
+            User.query
+                .join(Follows, Follows.user_being_followed_id == User.id)
+                .filter(Follows.user_following_id == self.user_id))
+
+    def test_followers(self):
+        self.assertIndexed(
+            User.query
+                .join(Follows, Follows.user_following_id == User.id)
+                .filter(Follows.user_being_followed_id == self.user_id))
+
+    def test_liked_messages(self):
+        liked = (Message
+                 .query
+                 .join(Likes, Likes.message_id == Message.id)
+                 .filter(Likes.user_id == self.user_id))
+
+        self.assertIndexed(newest_first(liked, Message.timestamp, Message.id))
+
+    def test_liked_message_ids(self):
+        self.assertIndexed(
+            db.session
+              .query(Likes.message_id)
+              .filter(Likes.user_id == self.user_id,
+                      Likes.message_id.in_([1, 2, 3])))
+
+    def test_likes_of_message(self):
+        """Used by cascading deletes of a message."""
+
+        self.assertIndexed(Likes.query.filter(Likes.message_id == 1))
+
+    @skipUnless(POSTGRESQL, "trigram index is PostgreSQL-only")
+    def test_username_search(self):
+        self.assertIndexed(User.query.filter(
+            User.username.ilike(f"%{escape_like('lan')}%", escape='\\')))
+
+    @skipUnless(POSTGRESQL, "full-text index is PostgreSQL-only")
+    def test_message_search(self):
+        from sqlalchemy import func
+
+        self.assertIndexed(Message.query.filter(
+            func.to_tsvector('english', Message.text)
+                .op('@@')(func.plainto_tsquery('english', 'plan'))))
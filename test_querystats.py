@@ -0,0 +1,152 @@
+"""Per-request SQL statistics tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_querystats.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import querystats
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class ShapeTestCase(TestCase):
+    """Statements that differ only in values share a shape."""
+
+    def test_shape(self):
+        self.assertEqual(
+            querystats.shape("SELECT * FROM users\n WHERE id = %(id_1)s"),
+            querystats.shape("SELECT * FROM users WHERE id = %(id_7)s"))
+        self.assertEqual(
+            querystats.shape("SELECT 1 FROM t WHERE name = 'bob' LIMIT 10"),
+            "SELECT ? FROM t WHERE name = ? LIMIT ?")
+
+    def test_repeated(self):
+        stats = querystats.QueryStats()
+        for i in range(5):
+            stats.record(f"SELECT * FROM users WHERE id = {i}", 0.001)
+        stats.record("SELECT * FROM messages", 0.001)
+
+        self.assertEqual(stats.count, 6)
+        self.assertEqual(stats.repeated(5),
+                         [("SELECT * FROM users WHERE id = ?", 5)])
+
+
+class QueryStatsTestCase(TestCase):
+    """Counting statements run by routes."""
+
+    def setUp(self):
+        """A viewer following five users with a message each."""
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.viewer = User(email="viewer@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        db.session.add(self.viewer)
+        db.session.commit()
+        self.viewer_id = self.viewer.id
+
+        self.author_ids = []
+        for i in range(5):
+            author = User(email=f"author{i}@test.com", username=f"author{i}",
+                          password="HASHED_PASSWORD")
+            db.session.add(author)
+            db.session.commit()
+            self.author_ids.append(author.id)
+            db.session.add(Message(text=f"warble {i}", user_id=author.id))
+            db.session.add(Follows(user_being_followed_id=author.id,
+                                   user_following_id=self.viewer_id))
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['QUERY_STATS_HEADERS'] = False
+
+    def test_detects_repeated_lazy_loads(self):
+        """Loading users one at a time shows up as a repeated shape."""
+
+        db.session.expire_all()
+        with querystats.count_queries() as stats:
+            for user_id in self.author_ids:
+                User.query.get(user_id)
+
+        self.assertEqual(stats.count, 5)
+        self.assertEqual(len(stats.repeated(5)), 1)
+
+    def test_headers(self):
+        app.config['QUERY_STATS_HEADERS'] = True
+
+        resp = self.client.get("/")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(int(resp.headers['X-Query-Count']), 0)
+        self.assertEqual(resp.headers['X-Query-Repeated'], '0')
+        self.assertIn('db;dur=', resp.headers['Server-Timing'])
+
+    def test_no_headers_by_default(self):
+        resp = self.client.get("/")
+
+        self.assertNotIn('X-Query-Count', resp.headers)
+
+    def test_pages_have_query_budgets(self):
+        """Listing pages cost the same however many rows they show.
+
+        Follow pages run one more query, for their ETag (conditional.py).
+        """
+
+        for url, limit in [("/", 4),
+                           (f"/users/{self.viewer_id}/following", 5),
+                           (f"/users/{self.author_ids[0]}/followers", 5)]:
+            with querystats.assert_max_queries(limit) as stats:
+                resp = self.client.get(url)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(stats.repeated(3), [], url)
+
+    def test_assert_max_queries(self):
+        db.session.expire_all()
+        with self.assertRaises(AssertionError) as cm:
+            with querystats.assert_max_queries(1):
+                for user_id in self.author_ids:
+                    User.query.get(user_id)
+
+        self.assertIn("5 queries, expected at most 1", str(cm.exception))
+
+    def test_failed_statements_leave_nothing_behind(self):
+        with db.engine.connect() as conn:
+            info = dict(conn.info)
+            with self.assertRaises(Exception):
+                conn.execute("SELECT * FROM no_such_table")
+
+            self.assertEqual(conn.info, info)
+
+            with querystats.count_queries() as stats:
+                conn.execute("SELECT 1")
+            self.assertEqual(stats.count, 1)
@@ -0,0 +1,199 @@
+"""Follow and like write tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_relations.py
+
+
+import os
+from tempfile import NamedTemporaryFile
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import querystats
+import relations
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class RelationsTestCase(TestCase):
+    """Idempotent, set-based follows and likes."""
+
+    def setUp(self):
+        """A fan and four authors with two messages each."""
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        fan = User(email="fan@test.com", username="fan",
+                   password="HASHED_PASSWORD")
+        db.session.add(fan)
+        db.session.commit()
+        self.fan_id = fan.id
+
+        self.author_ids = []
+        self.msg_ids = []
+        for i in range(4):
+            author = User(email=f"author{i}@test.com", username=f"author{i}",
+                          password="HASHED_PASSWORD")
+            db.session.add(author)
+            db.session.commit()
+            self.author_ids.append(author.id)
+
+            for j in range(2):
+                msg = Message(text=f"warble {i}.{j}", user_id=author.id)
+                db.session.add(msg)
+                db.session.commit()
+                self.msg_ids.append(msg.id)
+
+        app.extensions.pop('current_user_cache', None)
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.fan_id
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def counts(self, user_id, *names):
+        db.session.expire_all()
+        user = User.query.get(user_id)
+        return tuple(getattr(user, name) for name in names)
+
+    def test_follow(self):
+        ids = self.author_ids[:3] + [0]
+
+        self.assertEqual(sorted(relations.follow(self.fan_id, ids)),
+                         self.author_ids[:3])
+        self.assertEqual(relations.follow(self.fan_id, ids), [])
+
+        self.assertEqual(Follows.query.count(), 3)
+        self.assertEqual(self.counts(self.fan_id, 'following_count'), (3,))
+        self.assertEqual(self.counts(self.author_ids[0], 'followers_count'),
+                         (1,))
+
+    def test_no_self_follow(self):
+        self.assertEqual(relations.follow(self.fan_id, [self.fan_id]), [])
+
+        self.client.post(f"/users/follow/{self.fan_id}")
+        resp = self.client.post("/api/v1/follows", json={"ids": [self.fan_id]})
+
+        self.assertEqual(resp.json['followed'], [])
+        self.assertEqual(Follows.query.count(), 0)
+        self.assertEqual(self.counts(self.fan_id, 'following_count',
+                                     'followers_count'), (0, 0))
+
+    def test_unfollow(self):
+        relations.follow(self.fan_id, self.author_ids)
+
+        self.assertEqual(
+            sorted(relations.unfollow(self.fan_id, self.author_ids[:2] + [0])),
+            self.author_ids[:2])
+        self.assertEqual(relations.unfollow(self.fan_id, self.author_ids[:2]),
+                         [])
+
+        self.assertEqual(self.counts(self.fan_id, 'following_count'), (2,))
+        self.assertEqual(self.counts(self.author_ids[0], 'followers_count'),
+                         (0,))
+        self.assertEqual(self.counts(self.author_ids[3], 'followers_count'),
+                         (1,))
+
+    def test_like_and_unlike(self):
+        self.assertEqual(sorted(relations.like(self.fan_id, self.msg_ids)),
+                         self.msg_ids)
+        self.assertEqual(relations.like(self.fan_id, self.msg_ids[:2] + [0]),
+                         [])
+        self.assertEqual(self.counts(self.fan_id, 'likes_count'), (8,))
+
+        self.assertEqual(relations.unlike(self.fan_id, self.msg_ids[:3]),
+                         self.msg_ids[:3])
+        self.assertEqual(relations.unlike(self.fan_id, self.msg_ids[:3]), [])
+        self.assertEqual(self.counts(self.fan_id, 'likes_count'), (5,))
+        self.assertEqual(Likes.query.count(), 5)
+
+    def test_like_cost_is_constant(self):
+        """Liking doesn't load the likes the user already has."""
+
+        relations.like(self.fan_id, self.msg_ids[:-1])
+
+        with querystats.assert_max_queries(5):
+            resp = self.client.post(f"/users/add_like/{self.msg_ids[-1]}")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(self.counts(self.fan_id, 'likes_count'), (8,))
+
+    def test_repeated_clicks(self):
+        for _ in range(2):
+            self.client.post(f"/users/follow/{self.author_ids[0]}")
+            self.client.post(f"/users/add_like/{self.msg_ids[0]}")
+
+        self.assertEqual(self.counts(self.fan_id, 'following_count',
+                                     'likes_count'), (1, 1))
+
+        for _ in range(2):
+            resp = self.client.post(
+                f"/users/stop-following/{self.author_ids[0]}")
+            self.assertEqual(resp.status_code, 302)
+            resp = self.client.post(f"/users/remove_like/{self.msg_ids[0]}")
+            self.assertEqual(resp.status_code, 302)
+
+        self.assertEqual(self.counts(self.fan_id, 'following_count',
+                                     'likes_count'), (0, 0))
+
+    def test_missing_ids(self):
+        self.assertEqual(self.client.post("/users/follow/0").status_code, 404)
+        self.assertEqual(self.client.post("/users/add_like/0").status_code,
+                         404)
+        self.assertEqual(
+            self.client.post("/users/stop-following/0").status_code, 302)
+
+    def test_api_bulk(self):
+        resp = self.client.post("/api/v1/follows",
+                                json={"ids": self.author_ids + [0]})
+        self.assertEqual(sorted(resp.json['followed']), self.author_ids)
+
+        resp = self.client.post("/api/v1/likes",
+                                json={"ids": self.msg_ids[:4]})
+        self.assertEqual(sorted(resp.json['liked']), self.msg_ids[:4])
+
+        ids = ','.join(map(str, self.msg_ids[:2]))
+        resp = self.client.delete(f"/api/v1/likes?ids={ids}")
+        self.assertEqual(sorted(resp.json['unliked']), self.msg_ids[:2])
+
+        resp = self.client.post("/api/v1/likes", json={"ids": ["1"]})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_import_likes(self):
+        with NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("user_id,message_id\n")
+            for msg_id in self.msg_ids[:3] + self.msg_ids[:1]:
+                f.write(f"{self.fan_id},{msg_id}\n")
+        try:
+            result = app.test_cli_runner().invoke(
+                args=['import-likes', f.name, '--chunk-size', '2'])
+        finally:
+            os.unlink(f.name)
+
+        self.assertIn("imported 3 likes", result.output)
+        self.assertEqual(self.counts(self.fan_id, 'likes_count'), (3,))
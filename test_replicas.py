@@ -0,0 +1,110 @@
+"""Read replica routing tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_replicas.py
+#
+# They need a second, empty database to stand in for the replica:
+#
+#    createdb warbler-test-replica
+
+
+import os
+from time import time
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+REPLICA_URL = "postgresql:///warbler-test-replica"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import replicas
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class ReplicaTestCase(TestCase):
+    """The replica starts empty, so anything found there came from it."""
+
+    def setUp(self):
+        app.config['SQLALCHEMY_REPLICA_URLS'] = [REPLICA_URL]
+        app.extensions.pop('replica_engines', None)
+        app.extensions.pop('current_user_cache', None)
+
+        self.replica = replicas.replica_engines(app)[0]
+        db.metadata.drop_all(bind=self.replica)
+        db.metadata.create_all(bind=self.replica)
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        user = User(email="primary@test.com", username="primary",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['SQLALCHEMY_REPLICA_URLS'] = []
+        app.extensions.pop('replica_engines', None)
+        self.replica.dispose()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_read_only_views_use_replica(self):
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_other_views_use_primary(self):
+        self.login()
+
+        resp = self.client.get("/users/profile")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("primary", resp.get_data(as_text=True))
+
+    def test_writes_pin_user_to_primary(self):
+        self.login()
+
+        self.client.post("/messages/new", data={"text": "fresh"})
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("fresh", resp.get_data(as_text=True))
+
+    def test_pin_expires(self):
+        with self.client.session_transaction() as sess:
+            sess[replicas.PIN_KEY] = int(time()) - 1
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_no_replicas_configured(self):
+        app.config['SQLALCHEMY_REPLICA_URLS'] = []
+        app.extensions.pop('replica_engines', None)
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,201 @@
+"""Username search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app
+import search
+
+db.create_all()
+
+
+class UsernameIndexTestCase(TestCase):
+    """Tests for the in-process n-gram index."""
+
+    def setUp(self):
+        self.index = search.UsernameIndex()
+        for user_id, name in enumerate(["bobcat", "Bob", "kabob", "alice",
+                                        "bobby"], start=1):
+            self.index.add(user_id, name)
+
+    def test_ranking(self):
+        """Exact, then prefix, then infix matches."""
+
+        self.assertEqual(self.index.search("bob"), [2, 5, 1, 3])
+
+    def test_short_queries(self):
+        """One- and two-letter queries still match."""
+
+        self.assertEqual(self.index.search("al"), [4])
+
+    def test_rename_and_remove(self):
+        """Re-adding replaces the old name; removing drops it."""
+
+        self.index.add(4, "robert")
+        self.index.remove(1)
+
+        self.assertEqual(self.index.search("alice"), [])
+        self.assertEqual(self.index.search("bob"), [2, 5, 3])
+
+
+class SearchUsersTestCase(TestCase):
+    """Tests for search_users() against the database."""
+
+    def setUp(self):
+        db.session.rollback()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        for name in ["warbler", "warbler_fan", "the_warbler", "robin"]:
+            db.session.add(User(email=f"{name}@test.com", username=name,
+                                password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        app.extensions.pop('username_index', None)
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_search_ranks_matches(self):
+        """Exact and prefix matches come before infix matches."""
+
+        names = [u.username for u in search.search_users("Warbler")]
+        self.assertEqual(names, ["warbler", "warbler_fan", "the_warbler"])
+
+    def test_wildcards_are_literal(self):
+        """'_' in a query matches an underscore, not any character."""
+
+        names = [u.username for u in search.search_users("r_f")]
+        self.assertEqual(names, ["warbler_fan"])
+
+    def test_new_signups_are_found(self):
+        """Users added after the index was built show up."""
+
+        search.search_users("robin")
+        db.session.add(User(email="robinson@test.com", username="robinson",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        names = [u.username for u in search.search_users("robin")]
+        self.assertEqual(names, ["robin", "robinson"])
+
+    def test_rebuild_swaps_in_new_index(self):
+        """Renames elsewhere show up after a rebuild, not during a search."""
+
+        search.search_users("robin")
+        index = app.extensions['username_index']
+        User.query.filter_by(username="robin").update({'username': "sparrow"})
+        db.session.commit()
+
+        self.assertEqual(search.search_users("sparrow"), [])
+        self.assertIs(app.extensions['username_index'], index)
+
+        search.rebuild_indexes()
+
+        names = [u.username for u in search.search_users("sparrow")]
+        self.assertEqual(names, ["sparrow"])
+
+
+class MessageIndexTestCase(TestCase):
+    """Tests for the in-process message index."""
+
+    def setUp(self):
+        self.index = search.MessageIndex()
+        start = datetime(2020, 1, 1)
+        for i, text in enumerate(["Hello world", "hello there",
+                                  "Goodbye world", "hello, World!"],
+                                 start=1):
+            self.index.add(i, start + timedelta(minutes=i), text)
+
+    def test_all_words_must_match(self):
+        """Results contain every word, newest first."""
+
+        keys = self.index.search("world hello")
+        self.assertEqual([id for _, id in keys], [4, 1])
+
+    def test_cursor(self):
+        """A cursor skips everything at or after it."""
+
+        first = self.index.search("hello", limit=2)
+        rest = self.index.search("hello", cursor=first[-1])
+
+        self.assertEqual([id for _, id in first], [4, 2])
+        self.assertEqual([id for _, id in rest], [1])
+
+    def test_remove(self):
+        """Removed messages no longer match."""
+
+        self.index.remove(4)
+        self.assertEqual([id for _, id in self.index.search("world")], [3, 1])
+
+
+class MessageSearchViewTestCase(TestCase):
+    """Tests for the /messages/search page."""
+
+    def setUp(self):
+        db.session.rollback()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        user = User(email="search@test.com", username="searcher",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add_all([Message(text="warbling in the morning",
+                                    user_id=user.id),
+                            Message(text="quiet evening", user_id=user.id)])
+        db.session.commit()
+
+        app.extensions.pop('message_index', None)
+
+    def test_search_page(self):
+        """Matching messages are listed with their authors."""
+
+        with app.test_client() as client:
+            resp = client.get("/messages/search?q=morning")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("warbling in the morning", html)
+            self.assertIn("@searcher", html)
+            self.assertNotIn("quiet evening", html)
+
+    def test_rebuild_drops_messages_deleted_elsewhere(self):
+        """A rebuild swaps in an index without other workers' deletions."""
+
+        with app.app_context():
+            self.assertEqual(len(search.search_messages("morning").items), 1)
+            index = app.extensions['message_index']
+
+            Message.query.filter(Message.text.contains("morning")).delete(
+                synchronize_session=False)
+            db.session.commit()
+            search.rebuild_indexes()
+
+            self.assertIsNot(app.extensions['message_index'], index)
+            self.assertEqual(app.extensions['message_index'].search("morning"),
+                             [])
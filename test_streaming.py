@@ -0,0 +1,151 @@
+"""Streamed page rendering tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_streaming.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import querystats
+import streaming
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+
+class StreamingTestCase(TestCase):
+    """Streamed pages match rendered ones and send their shell first."""
+
+    def setUp(self):
+        """A viewer followed by, and following, five authors."""
+
+        db.session.rollback()
+        Likes.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        viewer = User(email="viewer@test.com", username="viewer",
+                      password="HASHED_PASSWORD")
+        db.session.add(viewer)
+        db.session.commit()
+        self.viewer_id = viewer.id
+
+        self.msg_ids = []
+        for i in range(5):
+            author = User(email=f"author{i}@test.com", username=f"author{i}",
+                          password="HASHED_PASSWORD")
+            db.session.add(author)
+            db.session.commit()
+
+            db.session.add(Follows(user_being_followed_id=author.id,
+                                   user_following_id=viewer.id))
+            db.session.add(Follows(user_being_followed_id=viewer.id,
+                                   user_following_id=author.id))
+            msg = Message(text=f"streamed {i}", user_id=author.id)
+            db.session.add(msg)
+            db.session.commit()
+            self.msg_ids.append(msg.id)
+
+        db.session.add(Likes(user_id=viewer.id, message_id=self.msg_ids[0]))
+        db.session.commit()
+
+        self.chunk_rows = app.config['STREAM_CHUNK_ROWS']
+        app.config['STREAM_PAGES'] = True
+        app.config['STREAM_CHUNK_ROWS'] = 2
+        app.extensions.pop('current_user_cache', None)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['STREAM_PAGES'] = False
+        app.config['STREAM_CHUNK_ROWS'] = self.chunk_rows
+
+    def get_both(self, url):
+        """`url` streamed, then rendered in one go."""
+
+        streamed = self.client.get(url)
+        app.config['STREAM_PAGES'] = False
+        rendered = self.client.get(url)
+        app.config['STREAM_PAGES'] = True
+
+        return streamed.get_data(as_text=True), rendered.get_data(as_text=True)
+
+    def assertSamePage(self, url):
+        streamed, rendered = self.get_both(url)
+
+        self.assertNotIn(streaming.FLUSH, streamed)
+        self.assertEqual(streamed.split(), rendered.split())
+
+    def test_homepage(self):
+        self.assertSamePage("/")
+
+    def test_likes(self):
+        self.assertSamePage("/users/likes")
+
+    def test_follow_pages(self):
+        self.assertSamePage(f"/users/{self.viewer_id}/followers")
+        self.assertSamePage(f"/users/{self.viewer_id}/following")
+
+    def test_shell_sent_before_rows_are_read(self):
+        resp = self.client.get("/", buffered=False)
+        try:
+            with querystats.count_queries() as stats:
+                first = next(resp.response).decode()
+            rest = b"".join(resp.response).decode()
+        finally:
+            resp.close()
+
+        self.assertIn("<nav", first)
+        self.assertNotIn("streamed", first)
+        self.assertEqual(stats.count, 0)
+        self.assertIn("streamed 4", rest)
+
+    def test_rows_read_in_chunks(self):
+        """One query for the rows, one per chunk for the follow buttons."""
+
+        url = f"/users/{self.viewer_id}/followers"
+        self.client.get(url).get_data()
+
+        with querystats.count_queries() as stats:
+            self.client.get(url).get_data()
+
+        def count(fragment):
+            return sum(n for statement, n in stats.shapes.items()
+                       if fragment in statement)
+
+        self.assertEqual(count("FROM users JOIN follows ON"), 1)
+        self.assertEqual(count("follows.user_being_followed_id IN"), 3)
+
+    def test_next_cursor(self):
+        with app.test_request_context():
+            rows = streaming.Rows(
+                lambda: Message.query.order_by(Message.timestamp.desc(),
+                                               Message.id.desc()).limit(4),
+                per_page=4)
+
+            self.assertFalse(rows.next_cursor)
+            self.assertEqual(len(list(rows)), 4)
+            self.assertTrue(rows.next_cursor)
+            self.assertTrue(str(rows.next_cursor).endswith(
+                f",{self.msg_ids[1]}"))
@@ -0,0 +1,382 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follows, Job, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app
+import counters
+import jobs
+import posting
+import relations
+import timeline
+from pagination import page_of, parse_cursor
+from timeline import home_timeline
+
+db.create_all()
+
+NUM_MESSAGES = 100_000
+
+
+class HomeTimelineTestCase(TestCase):
+    """Tests for the home timeline query."""
+
+    def setUp(self):
+        """Create a viewer, an author they follow and a stranger."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.session.rollback()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.viewer = User(email="viewer@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        self.stranger = User(email="stranger@test.com", username="stranger",
+                             password="HASHED_PASSWORD")
+        db.session.add_all([self.viewer, self.author, self.stranger])
+        db.session.commit()
+
+        db.session.add(Follows(user_being_followed_id=self.author.id,
+                               user_following_id=self.viewer.id))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def add_messages(self, count):
+        """Bulk insert `count` messages spread over the three users."""
+
+        start = datetime(2020, 1, 1)
+        authors = [self.viewer.id, self.author.id, self.stranger.id]
+        rows = [dict(text=f"warble {i}",
+                     timestamp=start + timedelta(seconds=i),
+                     user_id=authors[i % 3])
+                for i in range(count)]
+        db.session.execute(Message.__table__.insert(), rows)
+        db.session.commit()
+
+    def test_timeline_includes_own_and_followed(self):
+        """Only the viewer's and followed users' messages are returned."""
+
+        self.add_messages(30)
+        messages = home_timeline(self.viewer.id)
+
+        self.assertEqual(len(messages), 20)
+        self.assertNotIn(self.stranger.id, {m.user_id for m in messages})
+
+    def test_timeline_is_newest_first(self):
+        """Messages come back newest first."""
+
+        self.add_messages(30)
+        timestamps = [m.timestamp for m in home_timeline(self.viewer.id)]
+
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_cursor_pages_through_timeline(self):
+        """Following next cursors walks the whole timeline exactly once."""
+
+        self.add_messages(75)
+        seen = []
+        cursor = None
+
+        while True:
+            page = page_of(home_timeline(self.viewer.id, cursor, limit=20), 20)
+            seen.extend(m.id for m in page.items)
+            if not page.next_cursor:
+                break
+            cursor = parse_cursor(page.next_cursor)
+
+        self.assertEqual(len(seen), 50)
+        self.assertEqual(len(set(seen)), 50)
+
+    def test_timeline_query_count_is_bounded(self):
+        """A large site still costs a single query, authors included."""
+
+        self.add_messages(NUM_MESSAGES)
+        viewer_id = self.viewer.id
+        db.session.expire_all()
+
+        statements = []
+
+        def count(conn, cursor, statement, params, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            messages = home_timeline(viewer_id)
+            usernames = {m.user.username for m in messages}
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+        self.assertEqual(len(messages), 100)
+        self.assertEqual(usernames, {"viewer", "author"})
+        self.assertEqual(len(statements), 1)
+
+
+class FanoutTimelineTestCase(TestCase):
+    """Tests for materialized (fan-out-on-write) timelines."""
+
+    def setUp(self):
+        """Switch fan-out on and create an author with two followers."""
+
+        app.config['TIMELINE_FANOUT'] = True
+        app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] = 10000
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.session.rollback()
+        TimelineEntry.query.delete()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        self.fan1 = User(email="fan1@test.com", username="fan1",
+                         password="HASHED_PASSWORD")
+        self.fan2 = User(email="fan2@test.com", username="fan2",
+                         password="HASHED_PASSWORD")
+        db.session.add_all([self.author, self.fan1, self.fan2])
+        db.session.commit()
+
+        for fan in (self.fan1, self.fan2):
+            db.session.add(Follows(user_being_followed_id=self.author.id,
+                                   user_following_id=fan.id))
+        db.session.flush()
+        counters.repair()
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['TIMELINE_FANOUT'] = False
+        db.session.rollback()
+        self.ctx.pop()
+
+    def post(self, text):
+        """Post a message as the author and fan it out."""
+
+        msg = Message(text=text, user_id=self.author.id)
+        db.session.add(msg)
+        db.session.flush()
+        timeline.fan_out(msg)
+        db.session.commit()
+        return msg
+
+    def test_fan_out_writes_entries(self):
+        """Posting writes one entry for the author and each follower."""
+
+        msg = self.post("hello fans")
+
+        entries = TimelineEntry.query.filter_by(message_id=msg.id).all()
+        self.assertEqual({e.user_id for e in entries},
+                         {self.author.id, self.fan1.id, self.fan2.id})
+
+    def test_pushed_matches_pulled(self):
+        """The materialized timeline returns what the pull query does."""
+
+        for i in range(5):
+            self.post(f"warble {i}")
+
+        self.assertEqual(
+            [m.id for m in timeline.pushed_timeline(self.fan1.id)],
+            [m.id for m in timeline.pulled_timeline(self.fan1.id)])
+
+    def test_prune_and_backfill(self):
+        """Unfollowing prunes entries; following again backfills them."""
+
+        self.post("hello fans")
+
+        timeline.prune(self.fan1.id, self.author.id)
+        db.session.commit()
+        self.assertEqual(timeline.home_timeline(self.fan1.id), [])
+
+        timeline.backfill(self.fan1.id, self.author.id)
+        db.session.commit()
+        self.assertEqual(len(timeline.home_timeline(self.fan1.id)), 1)
+
+    def test_fan_out_and_backfill_overlap(self):
+        """Fan-out and backfill write each entry once, in either order."""
+
+        msg = self.post("hello fans")
+        timeline.backfill(self.fan1.id, self.author.id)
+        timeline.fan_out(msg)
+        db.session.commit()
+
+        late = Message(text="not fanned out yet", user_id=self.author.id)
+        db.session.add(late)
+        db.session.flush()
+        timeline.backfill(self.fan2.id, self.author.id)
+        timeline.fan_out(late)
+        db.session.commit()
+
+        for message in (msg, late):
+            entries = TimelineEntry.query.filter_by(message_id=message.id)
+            self.assertEqual(sorted(e.user_id for e in entries),
+                             sorted([self.author.id, self.fan1.id,
+                                     self.fan2.id]))
+
+    def test_own_post_is_not_queued(self):
+        """The author sees their post at once; followers get it from the
+        fan-out job."""
+
+        app.config['JOBS_SYNC'] = False
+        Job.query.delete()
+        msg = posting.post_message(self.author.id, "hello fans")
+
+        self.assertEqual([m.id for m in home_timeline(self.author.id)],
+                         [msg.id])
+        self.assertEqual(home_timeline(self.fan1.id), [])
+
+        self.assertTrue(jobs.work_one())
+        self.assertEqual([m.id for m in home_timeline(self.fan1.id)],
+                         [msg.id])
+
+    def test_large_authors_are_pulled(self):
+        """Authors over the cutoff are not fanned out but still show up."""
+
+        app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] = 1
+        msg = self.post("too popular to push")
+
+        self.assertEqual(TimelineEntry.query.filter_by(
+            message_id=msg.id).count(), 1)
+        self.assertEqual([m.id for m in timeline.home_timeline(self.fan2.id)],
+                         [msg.id])
+
+    def test_pages_past_backfilled_range(self):
+        """Pages older than the backfilled entries are pulled."""
+
+        start = datetime(2020, 1, 1)
+        db.session.add_all([Message(text=f"old warble {i}",
+                                    user_id=self.author.id,
+                                    timestamp=start + timedelta(minutes=i))
+                            for i in range(150)])
+        db.session.commit()
+        timeline.backfill(self.fan1.id, self.author.id)
+        db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            page = page_of(home_timeline(self.fan1.id, cursor, limit=40), 40)
+            seen.extend(m.id for m in page.items)
+            if not page.next_cursor:
+                break
+            cursor = parse_cursor(page.next_cursor)
+
+        self.assertEqual(TimelineEntry.query.filter_by(
+            user_id=self.fan1.id).count(), 100)
+        self.assertEqual(len(seen), 150)
+        self.assertEqual(len(set(seen)), 150)
+
+    def test_refill_under_cutoff(self):
+        """Followers get what an author posted while over the cutoff once
+        the author drops back under it."""
+
+        app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] = 1
+        app.config['JOBS_SYNC'] = True
+        self.addCleanup(app.config.__setitem__, 'JOBS_SYNC', False)
+        msg = self.post("too popular to push")
+
+        relations.unfollow(self.fan2.id, [self.author.id])
+
+        self.assertEqual(TimelineEntry.query.filter_by(
+            user_id=self.fan1.id, message_id=msg.id).count(), 1)
+        self.assertEqual([m.id for m in timeline.home_timeline(self.fan1.id)],
+                         [msg.id])
+
+
+class TimelineCacheTestCase(TestCase):
+    """Tests for the per-worker timeline cache."""
+
+    def setUp(self):
+        """Switch caching on and create a follower of an author."""
+
+        app.config['TIMELINE_CACHE'] = True
+        app.extensions.pop('timeline_cache', None)
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.session.rollback()
+        Message.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+
+        self.author = User(email="author@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        self.fan = User(email="fan@test.com", username="fan",
+                        password="HASHED_PASSWORD")
+        db.session.add_all([self.author, self.fan])
+        db.session.commit()
+
+        db.session.add(Follows(user_being_followed_id=self.author.id,
+                               user_following_id=self.fan.id))
+        db.session.add(Message(text="first", user_id=self.author.id))
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['TIMELINE_CACHE'] = False
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_repeat_loads_hit_the_cache(self):
+        """The second load is served from the cache."""
+
+        timeline.home_timeline(self.fan.id)
+        timeline.home_timeline(self.fan.id)
+
+        stats = timeline.timeline_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_new_messages_are_pushed(self):
+        """A new message is patched into cached follower timelines."""
+
+        timeline.home_timeline(self.fan.id)
+
+        msg = Message(text="second", user_id=self.author.id)
+        db.session.add(msg)
+        db.session.commit()
+        timeline.cache_push(msg.id, timeline.cached_audience(self.author.id))
+
+        texts = [m.text for m in timeline.home_timeline(self.fan.id)]
+        self.assertEqual(texts, ["second", "first"])
+
+    def test_audience_is_looked_up_in_batches(self):
+        """Cached users are checked against the author's followers a batch
+        at a time."""
+
+        cache = timeline.timeline_cache()
+        stranger_ids = range(self.fan.id + 1, self.fan.id + 6)
+        for user_id in [*stranger_ids, self.fan.id]:
+            cache.set(user_id, [])
+
+        with patch.object(timeline, 'AUDIENCE_BATCH_SIZE', 2):
+            audience = timeline.cached_audience(self.author.id)
+
+        self.assertEqual(audience, [self.author.id, self.fan.id])
@@ -243,3 +243,19 @@ class UserModelTestCase(TestCase):
 
 
 
+
+
+    def test_followed_ids(self):
+        """Does followed_ids report follow state for many users at once?"""
+
+        u1 = User(email="fi1@test.com", username="fi1", password="HASHED_PASSWORD")
+        u2 = User(email="fi2@test.com", username="fi2", password="HASHED_PASSWORD")
+        u3 = User(email="fi3@test.com", username="fi3", password="HASHED_PASSWORD")
+        db.session.add_all([u1, u2, u3])
+        db.session.commit()
+
+        u1.following.append(u2)
+        db.session.commit()
+
+        self.assertEqual(u1.followed_ids([u2.id, u3.id]), {u2.id})
+        self.assertEqual(u1.followed_ids([]), set())
@@ -6,9 +6,12 @@
 
 
 import os
+import re
+from datetime import datetime, timedelta
 from unittest import TestCase
+from unittest.mock import patch
 from app import CURR_USER_KEY, app, g
-from models import db, User, Message, Follows, connect_db
+from models import db, User, Message, Follows, Likes, connect_db
 from flask import session
 
 # BEFORE we import our app, let's set an environmental variable
@@ -197,4 +200,95 @@ class UserViewTestCase(TestCase):
                 resp = client.post('/messages/new', data=form, follow_redirects=True)
                 html = resp.get_data(as_text=True)
                 self.assertIn("Access unauthorized", html)
-                self.assertEqual(resp.status_code, 200)
\ No newline at end of file
+                self.assertEqual(resp.status_code, 200)
+
+    def test_home_counts_follow_own_writes(self):
+        """ Does the cached current-user snapshot pick up your own new message?"""
+        with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    user = User.query.filter_by(username='test3').first()
+                    sess[CURR_USER_KEY] = user.id
+
+                client.get("/")
+                client.post('/messages/new', data={"text": "counted"})
+                resp = client.get("/")
+                html = resp.get_data(as_text=True)
+                self.assertIn(f'<a href="/users/{user.id}">1</a>', html)
+                self.assertEqual(resp.status_code, 200)
+
+    def test_hidden_accounts_left_out(self):
+        """ Are deleted accounts gone from follow pages, and can't be liked?"""
+        with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    user = User.query.filter_by(username='test3').first()
+                    sess[CURR_USER_KEY] = user.id
+
+                hidden = User.query.filter_by(username='test1').first()
+                user_id, hidden_id = user.id, hidden.id
+                msg_id = hidden.messages[0].id
+                hidden.deleted_at = datetime.utcnow()
+                db.session.commit()
+
+                resp = client.get(f"/users/{user_id}/following")
+                self.assertNotIn("<p>@test1</p>", resp.get_data(as_text=True))
+                self.assertEqual(resp.status_code, 200)
+
+                resp = client.post(f"/users/add_like/{msg_id}")
+                self.assertEqual(resp.status_code, 404)
+                self.assertEqual(
+                    User.query.get(user_id).followed_ids([hidden_id]), set())
+
+    def add_paged_messages(self):
+        """ Five messages by test1, a minute apart, liked by test3."""
+        user = User.query.filter_by(username='test1').first()
+        liker = User.query.filter_by(username='test3').first()
+        start = datetime(2020, 1, 1)
+        for i in range(5):
+            msg = Message(text=f"paged warble {i}", user_id=user.id,
+                          timestamp=start + timedelta(minutes=i))
+            db.session.add(msg)
+            db.session.flush()
+            db.session.add(Likes(user_id=liker.id, message_id=msg.id))
+        db.session.commit()
+        app.extensions.pop('fragment_cache', None)
+        return user.id, liker.id
+
+    def follow_older_links(self, client, url):
+        """ Messages on each page, following the "Older" link to the next."""
+        pages = []
+        while url:
+            html = client.get(url).get_data(as_text=True)
+            pages.append(re.findall(r"paged warble (\d)", html))
+            older = re.search(r'href="(\?before=[^"]+)"[^>]*id="older-messages"',
+                              html)
+            url = older and url.split('?')[0] + older.group(1)
+        return pages
+
+    @patch('app.PER_PAGE', 2)
+    def test_users_show_pages(self):
+        """ Does the "Older" link walk a profile's messages, newest first?"""
+        with app.test_client() as client:
+                user_id, _ = self.add_paged_messages()
+                pages = self.follow_older_links(client, f"/users/{user_id}")
+                # test1's "test_content" is newest; a full last page still
+                # links to an empty one.
+                self.assertEqual(pages, [['4'], ['3', '2'], ['1', '0'], []])
+
+    @patch('app.PER_PAGE', 2)
+    def test_list_likes_pages(self):
+        """ Does the "Older" link walk your liked messages, newest first?"""
+        with app.test_client() as client:
+                _, liker_id = self.add_paged_messages()
+                with client.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = liker_id
+                pages = self.follow_older_links(client, "/users/likes")
+                self.assertEqual(pages, [['4', '3'], ['2', '1'], ['0']])
+
+    def test_list_likes_not_logged_in(self):
+        """ When youre logged out, are you redirected away from your likes?"""
+        with app.test_client() as client:
+                resp = client.get("/users/likes")
+                self.assertEqual(resp.status_code, 302)
+
+                resp = client.get("/users/likes", follow_redirects=True)
+                self.assertIn("Access unauthorized.", resp.get_data(as_text=True))
@@ -0,0 +1,519 @@
+"""Home timeline queries for Warbler.
+
+Timelines are read in one of two ways:
+
+- pull (default): the timeline is computed at read time from `follows`
+  and `messages`.
+
+- push (`TIMELINE_FANOUT = True`): when a message is posted it is written
+  into a `timeline_entries` row for every follower, and the home page
+  reads those rows with a single index range scan. Authors with more than
+  `TIMELINE_FANOUT_MAX_FOLLOWERS` followers are not fanned out; their
+  messages are pulled at read time and merged in. Fan-out, and backfill
+  of the timelines of new followers, run as background jobs. Only the
+  newest `TIMELINE_LIMIT` entries of a timeline are sure to be complete
+  (backfill copies that many messages per author), so pages past them are
+  pulled. An author who drops back under the cutoff has their followers'
+  timelines backfilled, since what they posted meanwhile wasn't pushed.
+
+Either way, with `TIMELINE_CACHE = True` each worker keeps the most recent
+message IDs of active users' timelines in an LRU cache, so a repeat home
+page load is one cache lookup plus one fetch by primary key. Handlers
+patch or evict cached timelines after they commit a change.
+"""
+
+import sys
+from heapq import merge
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import contains_eager
+
+import jobs
+from cache import LRUCache
+from models import db, Follows, Message, TimelineEntry, User
+from pagination import paginate
+
+TIMELINE_LIMIT = 100
+DEFAULT_MAX_FOLLOWERS = 10000
+REFILL_BATCH_SIZE = 1000
+AUDIENCE_BATCH_SIZE = 500
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_TTL = 30
+
+ENTRY_COLUMNS = ['user_id', 'message_id', 'author_id', 'timestamp']
+
+
+def fanout_enabled():
+    """Is the push model switched on for this app?"""
+
+    return current_app.config.get('TIMELINE_FANOUT', False)
+
+
+def max_followers():
+    """Follower count above which an author's messages are pulled."""
+
+    return current_app.config.get('TIMELINE_FANOUT_MAX_FOLLOWERS',
+                                  DEFAULT_MAX_FOLLOWERS)
+
+
+def followed_ids_query(user_id):
+    """Subquery of the IDs of users `user_id` follows."""
+
+    return (db.session
+            .query(Follows.user_being_followed_id)
+            .filter(Follows.user_following_id == user_id))
+
+
+def is_pulled(author_id):
+    """Are `author_id`'s messages read at request time instead of pushed?"""
+
+    followers_count = (db.session
+                       .query(User.followers_count)
+                       .filter(User.id == author_id)
+                       .scalar())
+
+    return (followers_count or 0) > max_followers()
+
+
+def home_timeline(user_id, cursor=None, limit=TIMELINE_LIMIT):
+    """Most recent messages by `user_id` and the users they follow.
+
+    `cursor` is a `(timestamp, id)` pair from `pagination`; only messages
+    older than it are returned. Only the first page is cached.
+    """
+
+    cache = timeline_cache()
+    if cache is None or cursor:
+        return compute_timeline(user_id, cursor, limit)
+
+    message_ids = cache.get(user_id)
+    if message_ids is None:
+        messages = compute_timeline(user_id, limit=TIMELINE_LIMIT)
+        cache.set(user_id, tuple(msg.id for msg in messages))
+        return messages[:limit]
+
+    return messages_by_ids(message_ids[:limit])
+
+
+def compute_timeline(user_id, cursor=None, limit=TIMELINE_LIMIT):
+    """Read the timeline from the database, bypassing the cache."""
+
+    if fanout_enabled():
+        return pushed_timeline(user_id, cursor, limit)
+
+    return pulled_timeline(user_id, cursor, limit)
+
+
+def messages_by(author_filter, cursor, limit):
+    """Newest messages matching `author_filter`, authors eager-loaded."""
+
+    query = (Message
+             .query
+             .join(Message.user)
+             .options(contains_eager(Message.user))
+             .filter(author_filter, User.deleted_at.is_(None)))
+
+    return paginate(query, Message.timestamp, Message.id, cursor, limit).items
+
+
+def messages_by_ids(message_ids):
+    """Fetch messages by primary key, keeping the order of `message_ids`."""
+
+    if not message_ids:
+        return []
+
+    messages = (Message
+                .query
+                .join(Message.user)
+                .options(contains_eager(Message.user))
+                .filter(Message.id.in_(message_ids),
+                        User.deleted_at.is_(None))
+                .all())
+
+    by_id = {msg.id: msg for msg in messages}
+    return [by_id[id] for id in message_ids if id in by_id]
+
+
+def pulled_timeline(user_id, cursor=None, limit=TIMELINE_LIMIT):
+    """Compute the timeline at read time.
+
+    Runs as a single query: the author filter is a subquery on `follows`
+    and each message's author is loaded in the same round trip, so the
+    cost depends on the user's network, not on the size of the site.
+    """
+
+    return messages_by(db.or_(Message.user_id == user_id,
+                              Message.user_id.in_(followed_ids_query(user_id))),
+                       cursor, limit)
+
+
+def materialized_horizon(user_id):
+    """`(timestamp, id)` of the oldest entry of `user_id`'s timeline that
+    is sure to be complete, or None if all of them are.
+
+    Each followed author has at least their newest `TIMELINE_LIMIT`
+    messages materialized, so the newest `TIMELINE_LIMIT` entries are
+    exactly the timeline's; older ones may have gaps.
+    """
+
+    return (db.session
+            .query(TimelineEntry.timestamp, TimelineEntry.message_id)
+            .filter(TimelineEntry.user_id == user_id)
+            .order_by(TimelineEntry.timestamp.desc(),
+                      TimelineEntry.message_id.desc())
+            .offset(TIMELINE_LIMIT - 1)
+            .limit(1)
+            .first())
+
+
+def pushed_timeline(user_id, cursor=None, limit=TIMELINE_LIMIT):
+    """Read the materialized timeline, merging in pulled authors.
+
+    The part of a page past the materialized range (see
+    `materialized_horizon`) is pulled instead.
+    """
+
+    horizon = None
+    if cursor or limit > TIMELINE_LIMIT:
+        horizon = materialized_horizon(user_id)
+        if horizon is not None:
+            horizon = tuple(horizon)
+
+    if horizon is not None and cursor and tuple(cursor) <= horizon:
+        return pulled_timeline(user_id, cursor, limit)
+
+    messages = materialized_page(user_id, cursor, limit)
+    if horizon is None:
+        return messages
+
+    messages = [msg for msg in messages if (msg.timestamp, msg.id) >= horizon]
+    if len(messages) == limit:
+        return messages
+
+    return messages + pulled_timeline(user_id, horizon, limit - len(messages))
+
+
+def materialized_page(user_id, cursor, limit):
+    """One page of `user_id`'s entries, merged with pulled authors."""
+
+    entries = (Message
+               .query
+               .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+               .join(Message.user)
+               .options(contains_eager(Message.user))
+               .filter(TimelineEntry.user_id == user_id,
+                       User.deleted_at.is_(None)))
+
+    pushed = paginate(entries, TimelineEntry.timestamp,
+                      TimelineEntry.message_id, cursor, limit).items
+
+    pulled_authors = (db.session
+                      .query(User.id)
+                      .filter(User.id.in_(followed_ids_query(user_id)),
+                              User.followers_count > max_followers()))
+
+    pulled = messages_by(Message.user_id.in_(pulled_authors), cursor, limit)
+
+    if not pulled:
+        return pushed
+
+    # An author who crossed the cutoff may still have pushed entries.
+    newest_first = lambda msg: (msg.timestamp, msg.id)
+    merged = merge(pushed, pulled, key=newest_first, reverse=True)
+    seen = set()
+    unique = (msg for msg in merged
+              if msg.id not in seen and not seen.add(msg.id))
+
+    return list(islice(unique, limit))
+
+
+def insert_entries():
+    """INSERT into `timeline_entries` that skips entries already there.
+
+    Fan-out and backfill jobs overlap (a follow while a post is still
+    being fanned out) and may run twice, so neither can assume it is
+    the first to write an entry.
+    """
+
+    table = TimelineEntry.__table__
+    if db.engine.dialect.name == 'postgresql':
+        return pg_insert(table).on_conflict_do_nothing()
+
+    return table.insert().prefix_with('OR IGNORE')
+
+
+def fan_out(message):
+    """Write `message` into its author's and followers' timelines.
+
+    The author always gets their own entry. Followers only get one when
+    the author is below the fan-out cutoff; otherwise they pick the
+    message up at read time. Call after the message has been flushed.
+    """
+
+    add_own_entry(message)
+    fan_out_to_followers(message)
+
+
+def add_own_entry(message):
+    """Write `message` into its author's timeline."""
+
+    if not fanout_enabled():
+        return
+
+    db.session.execute(insert_entries().values(
+        user_id=message.user_id,
+        message_id=message.id,
+        author_id=message.user_id,
+        timestamp=message.timestamp,
+    ))
+
+
+def fan_out_to_followers(message):
+    """Write `message` into its author's followers' timelines, unless the
+    author is over the fan-out cutoff."""
+
+    if not fanout_enabled() or is_pulled(message.user_id):
+        return
+
+    followers = (db.session
+                 .query(Follows.user_following_id,
+                        literal(message.id),
+                        literal(message.user_id),
+                        literal(message.timestamp))
+                 .filter(Follows.user_being_followed_id == message.user_id))
+
+    db.session.execute(insert_entries().from_select(ENTRY_COLUMNS, followers))
+
+
+def queue_fan_out(message):
+    """Write `message` into its author's timeline now, and fan it out to
+    their followers from a background job; the caller commits."""
+
+    if fanout_enabled():
+        add_own_entry(message)
+        jobs.enqueue('fan_out', key=f"fan_out:{message.id}",
+                     message_id=message.id)
+
+
+@jobs.handler('fan_out')
+def fan_out_job(message_id):
+    message = Message.query.get(message_id)
+    if message is not None:
+        fan_out_to_followers(message)
+
+
+def backfill(follower_id, author_id, limit=TIMELINE_LIMIT):
+    """Copy `author_id`'s recent messages into `follower_id`'s timeline."""
+
+    if not fanout_enabled() or is_pulled(author_id):
+        return
+
+    recent = (db.session
+              .query(literal(follower_id),
+                     Message.id,
+                     Message.user_id,
+                     Message.timestamp)
+              .filter(Message.user_id == author_id)
+              .order_by(Message.timestamp.desc())
+              .limit(limit)
+              .subquery())
+
+    db.session.execute(insert_entries()
+                       .from_select(ENTRY_COLUMNS, db.session.query(recent)))
+
+
+def queue_backfill(follower_id, author_ids):
+    """Backfill `follower_id`'s timeline with `author_ids`' messages from a
+    background job; the caller commits."""
+
+    if fanout_enabled():
+        jobs.enqueue('backfill', follower_id=follower_id,
+                     author_ids=list(author_ids))
+
+
+@jobs.handler('backfill')
+def backfill_job(follower_id, author_ids):
+    # Skip authors unfollowed since the job was queued.
+    followed = (db.session
+                .query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == follower_id,
+                        Follows.user_being_followed_id.in_(author_ids)))
+
+    for (author_id,) in followed.all():
+        backfill(follower_id, author_id)
+
+    cache_evict([follower_id])
+
+
+def queue_refill(author_ids):
+    """Backfill the followers of those of `author_ids` who just dropped back
+    to the fan-out cutoff from a background job; the caller commits.
+
+    Call after taking one off the authors' follower counts. Their followers
+    stop pulling their messages, but the ones posted while they were over
+    the cutoff were never fanned out.
+    """
+
+    if not fanout_enabled():
+        return
+
+    rejoined = (db.session
+                .query(User.id)
+                .filter(User.id.in_(list(author_ids)),
+                        User.followers_count == max_followers()))
+
+    for (author_id,) in rejoined.all():
+        jobs.enqueue('refill', key=f"refill:{author_id}", author_id=author_id)
+
+
+@jobs.handler('refill')
+def refill_job(author_id):
+    """Backfill every follower of `author_id`, a batch of followers per
+    commit."""
+
+    recent = (db.session
+              .query(Message.id, Message.user_id, Message.timestamp)
+              .filter(Message.user_id == author_id)
+              .order_by(Message.timestamp.desc())
+              .limit(TIMELINE_LIMIT)
+              .subquery())
+
+    after = 0
+    # Stop if the author has crossed the cutoff again since.
+    while not is_pulled(author_id):
+        follower_ids = [follower_id for (follower_id,) in (
+            db.session
+            .query(Follows.user_following_id)
+            .filter(Follows.user_being_followed_id == author_id,
+                    Follows.user_following_id > after)
+            .order_by(Follows.user_following_id)
+            .limit(REFILL_BATCH_SIZE))]
+        if not follower_ids:
+            return
+
+        entries = (db.session
+                   .query(Follows.user_following_id, recent.c.id,
+                          recent.c.user_id, recent.c.timestamp)
+                   .filter(Follows.user_being_followed_id == author_id,
+                           Follows.user_following_id.in_(follower_ids)))
+        db.session.execute(insert_entries().from_select(ENTRY_COLUMNS,
+                                                        entries))
+        jobs.heartbeat()
+        db.session.commit()
+
+        cache_evict(follower_ids)
+        after = follower_ids[-1]
+
+
+def prune(follower_id, author_id):
+    """Remove `author_id`'s messages from `follower_id`'s timeline."""
+
+    if not fanout_enabled():
+        return
+
+    (TimelineEntry
+     .query
+     .filter_by(user_id=follower_id, author_id=author_id)
+     .delete(synchronize_session=False))
+
+
+def rebuild(user_id, limit=TIMELINE_LIMIT):
+    """Rebuild `user_id`'s materialized timeline from scratch."""
+
+    TimelineEntry.query.filter_by(user_id=user_id).delete(
+        synchronize_session=False)
+
+    recent = (db.session
+              .query(literal(user_id),
+                     Message.id,
+                     Message.user_id,
+                     Message.timestamp)
+              .filter(db.or_(Message.user_id == user_id,
+                             Message.user_id.in_(followed_ids_query(user_id))))
+              .order_by(Message.timestamp.desc())
+              .limit(limit)
+              .subquery())
+
+    db.session.execute(TimelineEntry.__table__.insert()
+                       .from_select(ENTRY_COLUMNS, db.session.query(recent)))
+
+
+##############################################################################
+# Per-worker timeline cache
+
+
+def ids_sizeof(message_ids):
+    """Approximate bytes held by a cached tuple of message IDs."""
+
+    return sys.getsizeof(message_ids) + 28 * len(message_ids)
+
+
+def timeline_cache():
+    """This app's timeline cache, or None if caching is switched off."""
+
+    if not current_app.config.get('TIMELINE_CACHE', False):
+        return None
+
+    cache = current_app.extensions.get('timeline_cache')
+    if cache is None:
+        cache = LRUCache(
+            max_bytes=current_app.config.get('TIMELINE_CACHE_MAX_BYTES',
+                                             DEFAULT_CACHE_MAX_BYTES),
+            ttl=current_app.config.get('TIMELINE_CACHE_TTL',
+                                       DEFAULT_CACHE_TTL),
+            sizeof=ids_sizeof)
+        current_app.extensions['timeline_cache'] = cache
+
+    return cache
+
+
+def cached_audience(author_id):
+    """IDs of cached timelines that show `author_id`'s messages.
+
+    Only users already in the cache are looked up, so the queries are
+    bounded by the cache size rather than by the author's follower count.
+    They go `AUDIENCE_BATCH_SIZE` at a time, under SQLite's limit on bound
+    parameters.
+    """
+
+    cache = timeline_cache()
+    if cache is None or not len(cache):
+        return []
+
+    audience = [author_id]
+    cached_ids = iter(cache.keys())
+    for batch in iter(lambda: list(islice(cached_ids, AUDIENCE_BATCH_SIZE)),
+                      []):
+        audience.extend(user_id for (user_id,) in (
+            db.session
+            .query(Follows.user_following_id)
+            .filter(Follows.user_being_followed_id == author_id,
+                    Follows.user_following_id.in_(batch))))
+
+    return audience
+
+
+def cache_push(message_id, audience):
+    """Prepend a new message to the cached timelines in `audience`."""
+
+    cache = timeline_cache()
+    if cache is None:
+        return
+
+    prepend = lambda ids: (message_id,) + ids[:TIMELINE_LIMIT - 1]
+    for user_id in audience:
+        cache.update(user_id, prepend)
+
+
+def cache_evict(user_ids):
+    """Drop the cached timelines of `user_ids`."""
+
+    cache = timeline_cache()
+    if cache is None:
+        return
+
+    for user_id in user_ids:
+        cache.delete(user_id)